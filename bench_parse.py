@@ -0,0 +1,187 @@
+"""
+Adversarial benchmark for the s1.py parser
+
+Feeds worst-case page texts and transaction lists (long digit/comma runs, lines
+packed with amounts, exchange rates and references) to each parsing stage at
+doubling sizes, and fails if
+any stage's time grows faster than linearly. A fuzz pass then throws random
+garbled pages at the parser to make sure nothing raises.
+
+Usage:
+    py bench_parse.py                          # exit code 1 on super-linear growth
+    py bench_parse.py --steps 5 --fuzz 5000 --seed 7
+"""
+
+import argparse
+import math
+import random
+import sys
+import time
+from collections import Counter
+
+import s1
+
+# Allowed growth: time(2n) / time(n) may be at most 2 ** MAX_EXPONENT on average
+MAX_EXPONENT = 1.35
+# Smallest total time worth measuring; sizes are scaled up until the first step takes this long
+MIN_SECONDS = 0.02
+
+def _silent(*args, **kwargs):
+    pass
+
+# ---------------------------------------------------------------------------
+# Adversarial inputs: each takes a size n and returns a callable to time
+# ---------------------------------------------------------------------------
+
+def digit_run(n):
+    """One long digit/comma run without decimals - the classic backtracking trap"""
+    text = '1,2' * n
+    return lambda: s1.find_amounts(text)
+
+def many_amounts(n):
+    """A page of lines that are nothing but amounts (capped line length, many lines)"""
+    line = '02 Mar 22 X ' + '1,234.56 ' * 100
+    text = '\n'.join([line] * (n // 100 + 1))
+    return lambda: s1.parse_page_transactions(text, 1, None, _silent, Counter())
+
+def long_lines(n):
+    """Garbled lines past MAX_LINE_LENGTH, which are skipped"""
+    text = '\n'.join(['9' * (s1.MAX_LINE_LENGTH * 2)] * (n // 1000 + 1))
+    return lambda: s1.parse_page_transactions(text, 1, None, _silent, Counter())
+
+def rate_lines(n):
+    """Continuation lines full of exchange rates"""
+    lines = ['02 Mar 22 VIS INT\'L SHOP']
+    for i in range(n // 20 + 1):
+        lines.append(f"@ 1.{i:04d}" * 5 + " 12.34")
+    text = '\n'.join(lines)
+    return lambda: s1.parse_page_transactions(text, 1, None, _silent, Counter())
+
+def orphan_references(n):
+    """Many orphan lines whose reference matches a transaction on the page"""
+    count = n // 20 + 1
+    lines = []
+    for i in range(count):
+        reference = f"ABC{i % 100000:05d}DE{i % 1000:03d}FGH"
+        lines.append(f"02 Mar 22 DR {reference} 1.00")
+        lines.append("02 Mar 22 500.00")
+    for i in range(count):
+        lines.append(f"ABC{i % 100000:05d}DE{i % 1000:03d}FGH 5.00")
+    text = '\n'.join(lines)
+    return lambda: s1.parse_page_transactions(text, 1, None, _silent, Counter())
+
+def _transactions(count):
+    return [{'date': '02 Mar 22', 'description': f'DD PAYEE {i}', 'amount': '1.00', 'balance': ''}
+            for i in range(count)]
+
+def classify(n):
+    """Working balances, debit/credit and the balance-chain check"""
+    transactions = _transactions(n // 10 + 1)
+    for i, trans in enumerate(transactions):
+        if i % 2:
+            trans['balance'] = f'{1000 - i:.2f}'
+        trans['_page'] = i // 40
+
+    def run():
+        working = s1.calculate_working_balances(transactions)
+        classified = s1.determine_debit_credit(transactions, working)
+        s1.find_chain_breaks(classified)
+    return run
+
+def normalize(n):
+    """Distinct descriptions through a fresh DescriptionNormalizer"""
+    descriptions = [f"CRS  REFUND   {i}  " * 3 for i in range(n // 10 + 1)]
+
+    def run():
+        normalizer = s1.DescriptionNormalizer()
+        for desc in descriptions:
+            normalizer.normalize(desc)
+    return run
+
+CASES = {
+    'find_amounts: digit run': digit_run,
+    'parse: lines of amounts': many_amounts,
+    'parse: over-long lines': long_lines,
+    'parse: exchange rates': rate_lines,
+    'parse: orphan references': orphan_references,
+    'classify + chain check': classify,
+    'normalize descriptions': normalize,
+}
+
+# ---------------------------------------------------------------------------
+
+def best_time(make, n, repeat=3):
+    run = make(n)
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def growth_exponent(make, steps, base=1000):
+    """Average exponent k in time ~ n**k over `steps` doublings of n"""
+    n = base
+    while best_time(make, n) < MIN_SECONDS and n < base * 2 ** 12:
+        n *= 2
+    times = [best_time(make, n * 2 ** step) for step in range(steps + 1)]
+    return math.log2(times[-1] / times[0]) / steps, n, times
+
+FUZZ_TOKENS = ['02 Mar 22', '03 Mar 22', 'DD', 'VIS', 'BP', 'CR', ')))', "INT'L", 'Visa Rate', '@', '@ 1.2345',
+               '1,234.56', '12.34', '5.00', '99.999', '12.3', '1234', ',,,', '.', 'RBC08042JE908KCG',
+               'BALANCE', 'BALANCEBROUGHTFORWARD', 'BALANCECARRIEDFORWARD', '100.00BALANCE',
+               '25.0002 Mar 22 BALANCE', 'Sort code 40-11-62', '\n', '\n', '']
+
+def fuzz(count, seed):
+    """Random garbled pages through parse, merge and classification; returns the failures"""
+    rnd = random.Random(seed)
+    failures = []
+    for _ in range(count):
+        text = ''.join(rnd.choice(FUZZ_TOKENS) + rnd.choice([' ', '', '\n'])
+                       for _ in range(rnd.randint(1, 80)))
+        try:
+            transactions, _ = s1.parse_page_transactions(text, 1, None, _silent, Counter())
+            transactions = s1.merge_split_transactions(transactions, _silent)
+            s1.determine_debit_credit(transactions, s1.calculate_working_balances(transactions))
+            s1.fill_missing_balances(transactions, _silent)
+        except Exception as e:
+            failures.append((text, e))
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Adversarial parser benchmark for s1.py")
+    parser.add_argument('--steps', type=int, default=4, help="Doublings of the input size per case")
+    parser.add_argument('--max-exponent', type=float, default=MAX_EXPONENT)
+    parser.add_argument('--fuzz', type=int, default=2000, help="Random pages to parse")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print("="*70)
+    print("  PARSER SCALING BENCHMARK")
+    print("="*70)
+
+    slow = []
+    for name, make in CASES.items():
+        exponent, n, times = growth_exponent(make, args.steps)
+        ok = exponent <= args.max_exponent
+        if not ok:
+            slow.append(name)
+        print(f"{'✅' if ok else '❌'} {name:<28} n={n:<7} {times[0]*1000:8.1f} ms → "
+              f"{times[-1]*1000:8.1f} ms  (time ~ n^{exponent:.2f})")
+
+    print(f"\n📋 Fuzzing the parser with {args.fuzz} random pages (seed {args.seed})...")
+    failures = fuzz(args.fuzz, args.seed)
+    for text, e in failures[:5]:
+        print(f"  ❌ {type(e).__name__}: {e}\n     {text[:120]!r}")
+    if not failures:
+        print("  ✅ No exceptions")
+
+    print("\n" + "="*70)
+    if slow or failures:
+        print(f"❌ FAILED: {len(slow)} stage(s) grow faster than n^{args.max_exponent}, "
+              f"{len(failures)} fuzz failure(s)")
+        print("="*70)
+        sys.exit(1)
+    print("🎉 All stages scale linearly")
+    print("="*70)
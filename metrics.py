@@ -0,0 +1,187 @@
+"""
+Prometheus-format metrics for long-running conversions
+
+The pipeline in s1.py fills a stats Counter as it goes (pages, fallbacks,
+merged lines, excluded rows, ...) plus 'seconds_<stage>' timings. Metrics
+turns those per-PDF stats into counters and per-stage latency histograms and
+exposes them either as a text file (for node_exporter's textfile collector)
+or on a small local scrape endpoint.
+
+Usage:
+    metrics = Metrics()
+    metrics.serve(9108)                     # optional: http://127.0.0.1:9108/metrics
+    process_pdf(path, out_dir, metrics=metrics)
+    metrics.write_textfile("hsbc_convert.prom")
+"""
+
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "hsbc_convert"
+
+# Help text for the counters the pipeline is known to produce
+COUNTER_HELP = {
+    'pdfs': "PDF statements processed",
+    'duplicate_pdfs_skipped': "Input PDFs skipped because another file had the same content",
+    'pdfs_rejected': "PDFs skipped by sniffing because they are not HSBC statements",
+    'pdfs_ocr_queued': "Scanned PDFs without a text layer listed for OCR",
+    'pages': "PDF pages read",
+    'transactions': "Transactions parsed from pages",
+    'pypdf2_failures': "Pages PyPDF2 could not extract",
+    'pdfplumber_fallbacks': "Pages recovered with pdfplumber after PyPDF2 failed",
+    'failed_pages': "Pages neither backend could extract",
+    'page_timeouts': "Page extractions killed for exceeding PAGE_TIMEOUT",
+    'worker_crashes': "Page extraction workers that died",
+    'info_pages_skipped': "Info pages skipped",
+    'long_lines_skipped': "Garbled lines longer than MAX_LINE_LENGTH skipped",
+    'layout_pages': "Pages parsed by table layout",
+    'layout_fallbacks': "Pages where layout extraction fell back to text",
+    'split_merged': "Split transactions merged back together",
+    'orphans_matched': "Orphaned footer transactions matched by reference",
+    'intl_merged': "INT'L transactions merged with their Visa Rate line",
+    'balances_filled': "Missing balances calculated",
+    'chain_breaks': "Printed balances that did not follow from the previous balance and amounts",
+    'pages_reextracted': "Pages re-extracted because their balances did not chain",
+    'pages_repaired': "Re-extracted pages whose new reading fixed chain breaks",
+    'visa_rate_excluded': "Visa Rate info lines excluded from output",
+    'duplicate_fees_excluded': "Duplicate account fee lines excluded from output",
+    'partitions_written': "year=/month= output partitions written because their transactions changed",
+    'partitions_unchanged': "Output partitions left untouched because nothing in them changed",
+    'errors': "PDFs that failed to convert",
+    'rejected_requests': "Server requests refused with 503 because the queue was full",
+    'request_timeouts': "Server requests answered with 504",
+    'worker_recycles': "Worker pools replaced because a timed-out job was still running",
+}
+
+# Latency buckets in seconds (a page takes milliseconds, a big statement seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[idx] += 1
+
+class Metrics:
+    """Thread-safe counters and per-stage latency histograms fed from pipeline stats"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self.last_success = None
+        self._lock = threading.Lock()
+        self._server = None
+
+    def record(self, stats):
+        """
+        Add one conversion's stats.
+
+        'seconds_<stage>' entries become one observation in that stage's latency
+        histogram; every other numeric entry (except memory_* peaks) is added to the
+        counter of that name.
+        """
+        with self._lock:
+            for key, value in stats.items():
+                # memory_* entries are per-stage byte peaks from profile mode, not counters
+                if not isinstance(value, (int, float)) or key.startswith('memory_'):
+                    continue
+                if key.startswith('seconds_'):
+                    stage = key[len('seconds_'):]
+                    self.histograms.setdefault(stage, Histogram(self.buckets)).observe(value)
+                else:
+                    self.counters[key] = self.counters.get(key, 0) + value
+            if not stats.get('errors'):
+                self.last_success = time.time()
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self.histograms.setdefault(stage, Histogram(self.buckets)).observe(seconds)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name in sorted(self.counters):
+                metric = f"{PREFIX}_{name}_total"
+                lines.append(f"# HELP {metric} {COUNTER_HELP.get(name, name.replace('_', ' '))}")
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {_format(self.counters[name])}")
+
+            if self.histograms:
+                metric = f"{PREFIX}_stage_seconds"
+                lines.append(f"# HELP {metric} Time spent per PDF in each pipeline stage")
+                lines.append(f"# TYPE {metric} histogram")
+                for stage in sorted(self.histograms):
+                    histogram = self.histograms[stage]
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{metric}_bucket{{stage="{stage}",le="{_format(bound)}"}} {count}')
+                    lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{metric}_sum{{stage="{stage}"}} {_format(histogram.sum)}')
+                    lines.append(f'{metric}_count{{stage="{stage}"}} {histogram.count}')
+
+            if self.last_success is not None:
+                metric = f"{PREFIX}_last_success_timestamp_seconds"
+                lines.append(f"# HELP {metric} Unix time of the last conversion without errors")
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {_format(self.last_success)}")
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """Write the metrics atomically, so a scraper never reads a half-written file"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+        return path
+
+    def serve(self, port, host="127.0.0.1"):
+        """Expose GET /metrics on a background thread; returns the server"""
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes every few seconds would drown the conversion output
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+def _format(value):
+    """Render numbers without a trailing .0 for whole values"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
@@ -0,0 +1,174 @@
+"""
+Per-PDF CPU and memory profiling for s1.py
+
+Profiler.profile(name) wraps one conversion in cProfile and tracemalloc and
+writes three files per PDF into the profile directory:
+
+    <name>.prof         cProfile stats (snakeviz, `python -m pstats`)
+    <name>.collapsed    Collapsed stacks in microseconds, for flamegraph.pl,
+                        speedscope or inferno
+    <name>.memory.txt   Peak/retained memory per pipeline stage and the
+                        allocation sites still holding the most memory
+
+Usage:
+    profiler = Profiler("profiles")
+    with profiler.profile("2024-04-30_Statement") as stats:
+        process_pdf(path, out_dir, stats=stats)
+    profiler.report()
+
+tracemalloc slows Python down noticeably, so compare CPU timings between
+profiled runs rather than against normal runs.
+"""
+
+import cProfile
+import gc
+import os
+import pstats
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# Stack frames kept per allocation (1 = the allocating line only)
+TRACEMALLOC_FRAMES = 1
+# Allocation sites listed in <name>.memory.txt
+TOP_ALLOCATIONS = 15
+# Deepest stack written to the collapsed output, and the smallest sample kept (µs)
+MAX_STACK_DEPTH = 100
+MIN_SAMPLE_US = 1
+
+def _frame_name(func):
+    """'file.py:function:line' for Python code, the bare name for builtins"""
+    filename, line, name = func
+    if filename == '~':
+        return name.replace(';', ',')
+    return f"{os.path.basename(filename)}:{name}:{line}".replace(';', ',')
+
+def collapsed_stacks(stats):
+    """
+    Turn pstats.Stats into collapsed-stack lines ('a;b;c <microseconds>').
+
+    cProfile only records caller -> callee edges, not whole stacks, so each
+    function's own time is shared out along its call paths in proportion to the
+    cumulative time every caller spent in it.
+    """
+    entries = stats.stats
+    children = defaultdict(list)
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, (_, _, _, cumtime) in callers.items():
+            if caller in entries:
+                children[caller].append((func, cumtime))
+    roots = [func for func, (_, _, _, _, callers) in entries.items()
+             if not any(caller in entries for caller in callers)]
+
+    samples = Counter()
+
+    def walk(func, path, weight):
+        _, _, tottime, cumtime, _ = entries[func]
+        share = min(weight / cumtime, 1.0) if cumtime else 1.0
+        path = path + (_frame_name(func),)
+        samples[';'.join(path)] += tottime * share * 1e6
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for child, edge_time in children[func]:
+            child_weight = edge_time * share
+            # Recursion shows up as a cycle in the call graph; its time stays with the first frame
+            if child_weight * 1e6 >= MIN_SAMPLE_US and _frame_name(child) not in path:
+                walk(child, path, child_weight)
+
+    for root in roots:
+        walk(root, (), entries[root][3])
+    return [f"{stack} {round(us)}" for stack, us in samples.items() if round(us) >= MIN_SAMPLE_US]
+
+def _megabytes(size):
+    return f"{size / (1024 * 1024):8.2f} MB"
+
+class Profiler:
+    """Profile conversions one at a time and keep a summary for report()"""
+
+    def __init__(self, directory, log=print):
+        self.directory = directory
+        self.log = log
+        self.results = []
+        self.names = set()
+        os.makedirs(directory, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+    def _path(self, name, extension):
+        return os.path.join(self.directory, f"{name}{extension}")
+
+    def _unique_name(self, name):
+        """name, or name-2, name-3... if a profile of this run already uses it"""
+        unique, count = name, 1
+        while unique.lower() in self.names:  # Case-insensitive file systems
+            count += 1
+            unique = f"{name}-{count}"
+        self.names.add(unique.lower())
+        return unique
+
+    @contextmanager
+    def profile(self, name):
+        """
+        Profile the block; yields a Counter to pass as the pipeline's stats.
+        A name already used in this run gets a -2, -3... suffix.
+        """
+        name = self._unique_name(name)
+        stats = Counter()
+        profile = cProfile.Profile()
+        start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            yield stats
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - started
+            gc.collect()  # Count only what is really still referenced as retained
+            current, peak = tracemalloc.get_traced_memory()
+            # Stages inside the block reset tracemalloc's peak; their own peaks are in stats
+            peak = max([peak - start] + [value for key, value in stats.items()
+                                         if key.startswith('memory_peak_')])
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ])
+            self._write(name, profile, stats, snapshot, peak, current - start, elapsed)
+
+    def _write(self, name, profile, stats, snapshot, peak, retained, elapsed):
+        profile.dump_stats(self._path(name, '.prof'))
+        with open(self._path(name, '.collapsed'), 'w', encoding='utf-8') as f:
+            f.writelines(line + '\n' for line in collapsed_stacks(pstats.Stats(profile)))
+
+        stages = sorted(key[len('memory_peak_'):] for key in stats if key.startswith('memory_peak_'))
+        with open(self._path(name, '.memory.txt'), 'w', encoding='utf-8') as f:
+            f.write(f"{name}: {elapsed:.3f}s, peak {_megabytes(peak).strip()}, "
+                    f"retained {_megabytes(retained).strip()}\n\n")
+            f.write(f"{'Stage':<14}{'Peak':>14}{'Retained':>14}{'Seconds':>10}\n")
+            for stage in stages:
+                seconds = stats.get(f'seconds_{stage}')
+                f.write(f"{stage:<14}{_megabytes(stats[f'memory_peak_{stage}']):>14}"
+                        f"{_megabytes(stats[f'memory_retained_{stage}']):>14}"
+                        f"{'' if seconds is None else f'{seconds:10.3f}'}\n")
+            f.write(f"\nTop {TOP_ALLOCATIONS} allocation sites still held at the end:\n")
+            for statistic in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                f.write(f"  {statistic}\n")
+
+        # 'pdf' spans the whole conversion, so look for the largest stage inside it
+        biggest = max((stage for stage in stages if stage != 'pdf'),
+                      key=lambda stage: stats[f'memory_peak_{stage}'], default=None)
+        self.results.append((name, elapsed, peak, biggest))
+        self.log(f"🔬 Profile: {self._path(name, '.prof')} ({elapsed:.2f}s, peak {_megabytes(peak).strip()})")
+
+    def report(self):
+        """Print the slowest and most memory-hungry conversions"""
+        if not self.results:
+            return
+        self.log("\n" + "="*70)
+        self.log(f"  PROFILE SUMMARY ({self.directory})")
+        self.log("="*70)
+        for name, elapsed, peak, biggest in sorted(self.results, key=lambda result: -result[1]):
+            stage = f"  (largest stage: {biggest})" if biggest else ""
+            self.log(f"  {name[:36]:<36} {elapsed:8.2f}s {_megabytes(peak)}{stage}")
+        self.log(f"\n💡 Flamegraph: flamegraph.pl {os.path.join(self.directory, '<name>.collapsed')} > out.svg")
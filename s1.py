@@ -1,9 +1,24 @@
 ﻿import PyPDF2
 import pdfplumber
+import asyncio
 import re
 import csv
+import functools
+import gc
+import hashlib
+import io
+import json
+import multiprocessing
 import os
 import sys
+import threading
+import time
+import tracemalloc
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
 from pathlib import Path
 
 # Fix Unicode encoding for Windows console
@@ -27,93 +42,760 @@ PDF_DIRECTORY = r"PDFs"  # Testing from C:\HSBC convert
 #   - OUTPUT_DIRECTORY = r"C:\HSBC convert\CSVs"   # Absolute Windows path
 OUTPUT_DIRECTORY = r"CSVs"  # Separate CSV output folder
 
+# Output formats written in the same pass over the transactions
+#   - OUTPUT_FORMATS = ["csv", "summary"]               # Default: CSV plus <name>.summary.json
+#                                                       # (monthly/statement/payment-type totals)
+#   - OUTPUT_FORMATS = ["csv"]                          # CSV only
+#   - OUTPUT_FORMATS = ["csv", "jsonl", "ofx", "qif"]   # Also JSON Lines, OFX and QIF next to each CSV
+OUTPUT_FORMATS = ["csv", "summary"]
+
+# Write <csv>.idx.json next to each CSV: byte ranges and opening/closing balances per
+# month and per statement, so read_period() can jump straight to them
+PERIOD_INDEX = True
+
 # Output mode: Set to True for single combined CSV, False for separate CSV per PDF
 # Examples:
 #   - COMBINED_OUTPUT = False  # Default: Creates 2022-04-19_Statement_transactions.csv, etc.
 #   - COMBINED_OUTPUT = True   # Creates single All_Transactions_YYYY-MM-DD_to_YYYY-MM-DD.csv
 COMBINED_OUTPUT = True  # False = separate CSV for each PDF, True = one combined CSV
+
+# Partitioned output (combined mode): instead of one big CSV per account, write
+# OUTPUT_DIRECTORY/PARTITION_DIRECTORY/year=YYYY/month=MM/<sortcode>_<account>.csv.
+# Months are written in parallel and only rewritten when their transactions changed.
+#   - PARTITIONED_OUTPUT = True
+#   - PARTITION_PRUNE = True    # Also delete months whose statements are no longer in PDF_DIRECTORY
+#                               # (by default they are kept, e.g. after archiving old PDFs)
+PARTITIONED_OUTPUT = False
+PARTITION_DIRECTORY = "partitioned"
+PARTITION_PRUNE = False
+
+# Extraction mode:
+#   - EXTRACTION_MODE = "text"    # Default: PyPDF2 text + clean-up heuristics
+#   - EXTRACTION_MODE = "layout"  # Read the transaction table by word position (pdfplumber);
+#                                 # pages without a recognisable table fall back to "text"
+EXTRACTION_MODE = "text"
+
+# Page isolation (text mode): extract each page in a supervised worker process
+#   - PAGE_TIMEOUT = None   # Default: extract in-process (fastest)
+#   - PAGE_TIMEOUT = 30     # Give up on a page after 30s, retry it with pdfplumber, then skip it
+PAGE_TIMEOUT = None
+PAGE_MEMORY_LIMIT_MB = 1024  # Per-worker memory cap while PAGE_TIMEOUT is set (Linux/macOS only)
+
+# Balance check: re-read pages whose balances don't add up with the other extraction path
+#   - RECONCILE_PAGES = True    # Default: re-extract only the pages with chain breaks
+#   - RECONCILE_PAGES = False   # Trust the first extraction
+RECONCILE_PAGES = True
+
+# Skip PDFs whose content is identical to another PDF in the folder (e.g. a second
+# download saved as "2024-04-30_Statement (1).pdf"); the original name is kept
+#   - DEDUPE_PDFS = False   # Process every file, even copies
+DEDUPE_PDFS = True
+
+# Format sniffing: look at each PDF's metadata and first page before the full parse.
+# HSBC statements are converted, other documents skipped, and scans without a text
+# layer listed in OCR_QUEUE_FILE (inside the output directory) for OCR.
+#   - SNIFF_PDFS = False            # Parse every PDF in the folder
+#   - OCR_QUEUE_FILE = None         # Only report scans, don't write the list
+SNIFF_PDFS = True
+OCR_QUEUE_FILE = "needs_ocr.txt"
+
+# Prometheus metrics (counters and per-stage timings, see metrics.py)
+#   - METRICS_FILE = None                  # Default: no metrics
+#   - METRICS_FILE = "hsbc_convert.prom"   # Rewrite this file after every PDF (node_exporter textfile)
+#   - METRICS_PORT = 9108                  # Serve http://127.0.0.1:9108/metrics while the batch runs
+METRICS_FILE = None
+METRICS_PORT = None
+
+# Profiling (or run: py s1.py --profile): for each PDF write cProfile stats (.prof),
+# flamegraph-ready collapsed stacks (.collapsed) and peak memory per stage (.memory.txt)
+#   - PROFILE_DIRECTORY = r"CSVs\profiles"   # Anywhere else
+PROFILE = False
+PROFILE_DIRECTORY = r"profiles"
 # ============================================================================
 
-def extract_pdf_text(pdf_path):
-    """Extract text from PDF file page by page"""
-    with open(pdf_path, 'rb') as file:
+def _silent(*args, **kwargs):
+    """Logger that discards everything (used by the library API)"""
+    pass
+
+# Peaks of enclosing _traced stages, so a nested stage resetting the peak doesn't lose them
+# (one stack per thread, since stages nest per thread)
+_trace_state = threading.local()
+
+def _peak_stack():
+    if not hasattr(_trace_state, 'peaks'):
+        _trace_state.peaks = []
+    return _trace_state.peaks
+
+@contextmanager
+def _traced(stats, stage):
+    """
+    Record the peak and retained traced memory of a stage in stats as
+    'memory_peak_<stage>' / 'memory_retained_<stage>' (bytes). Does nothing
+    unless tracemalloc is running (profile mode).
+    """
+    if stats is None or not tracemalloc.is_tracing():
+        yield
+        return
+    peaks = _peak_stack()
+    start, peak = tracemalloc.get_traced_memory()
+    if peaks:
+        peaks[-1] = max(peaks[-1], peak)
+    peaks.append(0)
+    tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        peak = max(tracemalloc.get_traced_memory()[1], peaks.pop())
+        gc.collect()  # Garbage cycles (pdfplumber pages) aren't retained memory
+        current = tracemalloc.get_traced_memory()[0]
+        if peaks:
+            peaks[-1] = max(peaks[-1], peak)
+        stats[f'memory_peak_{stage}'] = max(stats[f'memory_peak_{stage}'], peak - start)
+        stats[f'memory_retained_{stage}'] += current - start
+
+def _open_source(source):
+    """Return a binary stream for a PDF given as a path, raw bytes or file-like object"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(bytes(source))
+    if hasattr(source, 'read'):
+        return source
+    return open(source, 'rb')
+
+def _fallback_source(pdf_path, file):
+    """Give pdfplumber its own stream so it never shares a read position with PyPDF2"""
+    if isinstance(pdf_path, (bytes, bytearray, memoryview)):
+        return io.BytesIO(bytes(pdf_path))
+    if hasattr(pdf_path, 'read'):
+        file.seek(0)
+        return io.BytesIO(file.read())
+    return pdf_path
+
+def iter_pdf_pages(pdf_path, log=print, stats=None):
+    """
+    Yield (page_num, text) for each page as soon as it is extracted.
+    
+    Pages PyPDF2 cannot read are retried with pdfplumber straight away; a page
+    neither library can read is yielded as an empty string. pdf_path may be a
+    filesystem path, the raw PDF bytes or a binary file object.
+    """
+    file = _open_source(pdf_path)
+    plumber_pdf = None
+    plumber_failed = False
+    try:
         pdf_reader = PyPDF2.PdfReader(file)
-        print(f"📄 Total pages in PDF: {len(pdf_reader.pages)}")
-        all_text = []
-        failed_pages = []
+        log(f"📄 Total pages in PDF: {len(pdf_reader.pages)}")
+        if stats is not None:
+            stats['pages'] += len(pdf_reader.pages)
         
         for page_num, page in enumerate(pdf_reader.pages, 1):
+            started = time.perf_counter()
             try:
                 text = page.extract_text()
-                all_text.append(text)
             except Exception as e:
-                print(f"⚠️  Warning: PyPDF2 failed on page {page_num}: {str(e)}")
-                failed_pages.append(page_num - 1)  # Store 0-indexed page number
-                all_text.append("")  # Add empty string temporarily
+                log(f"⚠️  Warning: PyPDF2 failed on page {page_num}: {str(e)}")
+                if stats is not None:
+                    stats['pypdf2_failures'] += 1
+                text = ""
+                
+                # Try the same page with pdfplumber (opened once, on the first failure)
+                if plumber_pdf is None and not plumber_failed:
+                    log(f"   📋 Attempting to extract failed page(s) using pdfplumber...")
+                    try:
+                        plumber_pdf = pdfplumber.open(_fallback_source(pdf_path, file))
+                    except Exception as e:
+                        plumber_failed = True
+                        log(f"   ❌ Could not open PDF with pdfplumber: {str(e)}")
+                if plumber_pdf is not None:
+                    try:
+                        text = plumber_pdf.pages[page_num - 1].extract_text() or ""
+                        if text:
+                            if stats is not None:
+                                stats['pdfplumber_fallbacks'] += 1
+                            log(f"   ✅ Successfully extracted page {page_num} using pdfplumber")
+                        else:
+                            log(f"   ⚠️  Page {page_num} has no extractable text")
+                    except Exception as e:
+                        log(f"   ❌ pdfplumber also failed on page {page_num}: {str(e)}")
+            
+            if stats is not None:
+                stats['seconds_extract'] += time.perf_counter() - started
+            yield page_num, text
+    finally:
+        if plumber_pdf is not None:
+            plumber_pdf.close()
+        if file is not pdf_path:
+            file.close()
+
+def extract_pdf_text(pdf_path, log=print, stats=None):
+    """Extract text from PDF file page by page"""
+    return [text for _, text in iter_pdf_pages(pdf_path, log, stats)]
+
+# ============================================================================
+# DE-DUPLICATION - Process each distinct document once
+# ============================================================================
+
+# How browsers and file managers name a second copy: "x (1).pdf", "x - Copy.pdf", "Copy of x.pdf"
+COPY_NAME_PATTERN = re.compile(r'\(\d+\)$|[\s_-]+copy(\s*\d+)?$|^copy of\s', re.IGNORECASE)
+
+def _looks_like_copy(name):
+    return bool(COPY_NAME_PATTERN.search(os.path.splitext(name)[0].strip()))
+
+def _source_size(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    if hasattr(source, 'read'):
+        return None  # Unknown without reading; always hashed
+    return os.path.getsize(source)
+
+def _source_digest(source):
+    """
+    SHA-256 of a PDF's bytes (a file object's read position is restored), or
+    None for a stream that can't be rewound, since hashing would consume it
+    """
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+        return digest.hexdigest()
+    if hasattr(source, 'read') and not (hasattr(source, 'seekable') and source.seekable()):
+        return None
+    file = _open_source(source)
+    position = file.tell()
+    try:
+        file.seek(0)  # PyPDF2 reads the whole file, whatever the position
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    finally:
+        if file is source:
+            file.seek(position)
+        else:
+            file.close()
+    return digest.hexdigest()
+
+def dedupe_pdfs(sources, workers=None):
+    """
+    Drop sources whose bytes are identical to another source.
+    
+    Only files that share a size with another file are hashed (in parallel
+    threads), so a folder without copies costs one stat per file. Of each set of
+    copies, a name that doesn't look like a copy ("x (1).pdf") is kept, then the
+    first name alphabetically.
+    
+    File objects that can't seek are never treated as copies.
+    
+    Returns (unique, duplicates): unique keeps the input order, duplicates is a
+    list of (skipped, kept) pairs.
+    """
+    sources = list(sources)
+    by_size = {}
+    for idx, source in enumerate(sources):
+        by_size.setdefault(_source_size(source), []).append(idx)
+    to_hash = [idx for size, group in by_size.items() if size is None or len(group) > 1 for idx in group]
+    
+    digests = {}
+    if to_hash:
+        with ThreadPoolExecutor(max_workers=workers or min(8, len(to_hash)),
+                                thread_name_prefix='s1-hash') as executor:
+            digests = dict(zip(to_hash, executor.map(lambda idx: _source_digest(sources[idx]), to_hash)))
+    
+    copies = {}
+    for idx in to_hash:
+        if digests[idx] is not None:
+            copies.setdefault(digests[idx], []).append(idx)
+    skipped = {}
+    for group in copies.values():
+        if len(group) > 1:
+            names = {idx: _source_name(sources[idx]) for idx in group}
+            kept = min(group, key=lambda idx: (_looks_like_copy(names[idx]), names[idx], idx))
+            for idx in group:
+                if idx != kept:
+                    skipped[idx] = kept
+    
+    unique = [source for idx, source in enumerate(sources) if idx not in skipped]
+    duplicates = [(sources[idx], sources[kept]) for idx, kept in sorted(skipped.items())]
+    return unique, duplicates
+
+# ============================================================================
+# SNIFFING - Route a document before paying for the full parse
+# ============================================================================
+
+# Markers searched in the metadata and the squashed, upper-cased first page text
+HSBC_MARKERS = ('HSBC',)
+# HSBC's own wording for the transaction table (header and opening balance line)
+HSBC_TABLE_MARKERS = ('PAYMENTTYPEANDDETAILS', 'BALANCEBROUGHTFORWARD')
+# A first page with fewer non-space characters than this has no usable text layer
+MIN_TEXT_LAYER_CHARS = 20
+
+@dataclass(frozen=True)
+class SniffResult:
+    """Where a document should go: 'hsbc' (parse it), 'reject' or 'ocr'"""
+    kind: str
+    reason: str
+
+def _resources_have_images(resources, seen):
+    """True if a resource dictionary, or a form XObject it uses, holds an image XObject"""
+    xobjects = resources.get('/XObject')
+    if xobjects is None:
+        return False
+    xobjects = xobjects.get_object()
+    for name in xobjects:
+        xobject = xobjects[name].get_object()
+        if id(xobject) in seen:  # Forms can be shared or (in broken files) nest themselves
+            continue
+        seen.add(id(xobject))
+        subtype = xobject.get('/Subtype')
+        if subtype == '/Image':
+            return True
+        if subtype == '/Form' and '/Resources' in xobject:
+            if _resources_have_images(xobject['/Resources'].get_object(), seen):
+                return True
+    return False
+
+# An inline image in a content stream: BI <image dictionary> ID <data> EI
+_INLINE_IMAGE = re.compile(rb'(?:^|\s)BI\s.*?\sID\s', re.DOTALL)
+
+def _page_has_images(page):
+    """True if a PyPDF2 page draws at least one image, as an XObject or inline (what a scan is made of)"""
+    try:
+        if _resources_have_images(page['/Resources'].get_object(), set()):
+            return True
+        contents = page.get_contents()
+        return contents is not None and _INLINE_IMAGE.search(contents.get_data()) is not None
+    except Exception:
+        return False
+
+def sniff_pdf(source):
+    """
+    Decide from the header, metadata and first page alone whether a document is
+    an HSBC statement. Only the first page is extracted, so this takes
+    milliseconds even for long documents. source may be a path, bytes or a
+    binary file object (whose read position is restored afterwards).
+    """
+    file = _open_source(source)
+    position = file.tell()
+    try:
+        file.seek(0)
+        if b'%PDF-' not in file.read(1024):
+            return SniffResult('reject', "not a PDF")
+        file.seek(0)
+        
+        try:
+            reader = PyPDF2.PdfReader(file)
+            if reader.is_encrypted and not reader.decrypt(''):
+                return SniffResult('reject', "password protected")
+            if not reader.pages:
+                return SniffResult('reject', "no pages")
+            metadata = reader.metadata or {}
+            first_page = reader.pages[0]
+        except Exception as e:
+            return SniffResult('reject', f"unreadable PDF ({e})")
         
-        # If there are failed pages, try using pdfplumber
-        if failed_pages:
-            print(f"   📋 Attempting to extract {len(failed_pages)} failed page(s) using pdfplumber...")
+        info = ' '.join(str(value) for value in metadata.values()).upper()
+        try:
+            text = first_page.extract_text() or ''
+        except Exception:
+            text = ''
+        squashed = re.sub(r'\s+', '', text).upper()
+        
+        if len(squashed) < MIN_TEXT_LAYER_CHARS:
+            if _page_has_images(first_page):
+                return SniffResult('ocr', "no text layer on page 1 (scanned?)")
+            return SniffResult('reject', "page 1 has no text or images")
+        if any(marker in squashed for marker in HSBC_MARKERS):
+            return SniffResult('hsbc', "HSBC named on page 1")
+        if any(marker in info for marker in HSBC_MARKERS):
+            return SniffResult('hsbc', "HSBC named in the PDF metadata")
+        if any(marker in squashed for marker in HSBC_TABLE_MARKERS):
+            return SniffResult('hsbc', "HSBC transaction table on page 1")
+        # The only HSBC mark may be the logo, so leave pages with images for OCR to decide
+        if _page_has_images(first_page):
+            return SniffResult('ocr', "no HSBC text on page 1, but it has images (logo or scan?)")
+        producer = metadata.get('/Producer')
+        return SniffResult('reject', f"no HSBC markers (producer: {producer})" if producer
+                           else "no HSBC markers")
+    finally:
+        if file is source:
+            file.seek(position)
+        else:
+            file.close()
+
+# ============================================================================
+# PAGE ISOLATION - Extract pages in a supervised worker with hard limits
+# ============================================================================
+
+def _read_source_bytes(source):
+    """Return the whole PDF as bytes (worker processes get their own copy)"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, 'read'):
+        source.seek(0)
+        return source.read()
+    with open(source, 'rb') as file:
+        return file.read()
+
+def _page_worker(conn, data, memory_limit_mb):
+    """Worker process: open the PDF lazily per backend and extract requested pages"""
+    if memory_limit_mb:
+        try:
+            import resource
+            limit = memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError):
+            pass  # No address-space limits on this platform (e.g. Windows)
+    
+    pypdf2_reader = None
+    plumber_pdf = None
+    try:
+        while True:
+            request = conn.recv()
+            if request is None:
+                break
+            backend, page_idx = request
             try:
-                with pdfplumber.open(pdf_path) as pdf:
-                    for page_idx in failed_pages:
-                        try:
-                            page = pdf.pages[page_idx]
-                            text = page.extract_text()
-                            if text:
-                                all_text[page_idx] = text
-                                print(f"   ✅ Successfully extracted page {page_idx + 1} using pdfplumber")
-                            else:
-                                print(f"   ⚠️  Page {page_idx + 1} has no extractable text")
-                        except Exception as e:
-                            print(f"   ❌ pdfplumber also failed on page {page_idx + 1}: {str(e)}")
+                if backend in ('count', 'pypdf2') and pypdf2_reader is None:
+                    pypdf2_reader = PyPDF2.PdfReader(io.BytesIO(data))
+                if backend == 'count':
+                    conn.send(('ok', len(pypdf2_reader.pages)))
+                elif backend == 'pypdf2':
+                    conn.send(('ok', pypdf2_reader.pages[page_idx].extract_text()))
+                else:
+                    if plumber_pdf is None:
+                        plumber_pdf = pdfplumber.open(io.BytesIO(data))
+                    if backend == 'words':
+                        conn.send(('ok', plumber_pdf.pages[page_idx].extract_words()))
+                    else:
+                        conn.send(('ok', plumber_pdf.pages[page_idx].extract_text() or ""))
+            except MemoryError:
+                conn.send(('error', f"memory limit of {memory_limit_mb} MB exceeded"))
+            except Exception as e:
+                conn.send(('error', str(e)))
+    except (EOFError, KeyboardInterrupt):
+        pass
+
+class IsolatedPageWorker:
+    """
+    Supervisor for one page-extraction worker process.
+    
+    request() waits at most `timeout` seconds for an answer. A worker that times
+    out or dies is killed, and a fresh one is started for the next request, so a
+    pathological page can never stall (or take down) the caller.
+    """
+    
+    def __init__(self, data, timeout, memory_limit_mb=None):
+        self.data = data
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self._process = None
+        self._conn = None
+    
+    def _start(self):
+        self._conn, child_conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_page_worker,
+                                                args=(child_conn, self.data, self.memory_limit_mb),
+                                                daemon=True)
+        self._process.start()
+        child_conn.close()
+    
+    def _kill(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.join()
+            self._conn.close()
+        self._process = None
+        self._conn = None
+    
+    def request(self, backend, page_idx=None):
+        """Returns ('ok', value), ('error', message), ('timeout', None) or ('crashed', None)"""
+        if self._process is None:
+            self._start()
+        try:
+            self._conn.send((backend, page_idx))
+            if self._conn.poll(self.timeout):
+                return self._conn.recv()
+            self._kill()
+            return ('timeout', None)
+        except (EOFError, OSError):
+            self._kill()
+            return ('crashed', None)
+    
+    def close(self):
+        if self._process is not None:
+            try:
+                self._conn.send(None)
+            except OSError:
+                pass
+            self._process.join(1)
+            self._kill()
+
+def _isolation_failure(status, value, timeout):
+    """Readable reason for an IsolatedPageWorker answer other than 'ok'"""
+    return {'timeout': f"timed out after {timeout}s", 'crashed': "worker crashed"}.get(status, value)
+
+def _count_pages(data):
+    """Page count read in-process, with PyPDF2 and then pdfplumber"""
+    try:
+        return len(PyPDF2.PdfReader(io.BytesIO(data)).pages)
+    except Exception:
+        with pdfplumber.open(io.BytesIO(data)) as pdf:
+            return len(pdf.pages)
+
+def iter_pdf_pages_isolated(pdf_path, timeout, memory_limit_mb=None, log=print, stats=None):
+    """
+    Like iter_pdf_pages, but every page is extracted in a supervised worker process.
+    
+    A page that errors, exceeds `timeout` seconds or the memory limit is retried with
+    pdfplumber; if that fails as well the page is reported, counted in
+    stats['failed_pages'] and yielded as empty text so the rest of the batch continues.
+    If the worker can't count the pages they are counted in-process instead.
+    """
+    data = _read_source_bytes(pdf_path)
+    worker = IsolatedPageWorker(data, timeout, memory_limit_mb)
+    try:
+        status, page_count = worker.request('count')
+        if status != 'ok':
+            reason = _isolation_failure(status, page_count, timeout)
+            log(f"⚠️  Warning: Could not count pages in the worker ({reason}) - counting them here")
+            if stats is not None:
+                stats[{'timeout': 'page_timeouts', 'crashed': 'worker_crashes'}.get(status, 'page_errors')] += 1
+            try:
+                page_count = _count_pages(data)
             except Exception as e:
-                print(f"   ❌ Could not open PDF with pdfplumber: {str(e)}")
+                raise ValueError(f"Could not read PDF ({reason}; in-process: {str(e)})")
+        log(f"📄 Total pages in PDF: {page_count}")
+        if stats is not None:
+            stats['pages'] += page_count
         
-        return all_text
+        for page_idx in range(page_count):
+            page_num = page_idx + 1
+            started = time.perf_counter()
+            text = None
+            for backend in ('pypdf2', 'pdfplumber'):
+                status, value = worker.request(backend, page_idx)
+                if status == 'ok':
+                    text = value
+                    if backend == 'pdfplumber':
+                        if stats is not None:
+                            stats['pdfplumber_fallbacks'] += 1
+                        log(f"   ✅ Successfully extracted page {page_num} using pdfplumber")
+                    break
+                
+                reason = _isolation_failure(status, value, timeout)
+                log(f"⚠️  Warning: {'PyPDF2' if backend == 'pypdf2' else 'pdfplumber'} failed on page {page_num}: {reason}")
+                if stats is not None:
+                    stats[{'timeout': 'page_timeouts', 'crashed': 'worker_crashes'}.get(status, 'page_errors')] += 1
+                    if backend == 'pypdf2':
+                        stats['pypdf2_failures'] += 1
+            
+            if text is None:
+                log(f"   ❌ Page {page_num} could not be extracted - skipping it")
+                if stats is not None:
+                    stats['failed_pages'] += 1
+                text = ""
+            if stats is not None:
+                stats['seconds_extract'] += time.perf_counter() - started
+            yield page_num, text
+    finally:
+        worker.close()
 
 def clean_amount(amount_str):
     """Clean amount string by removing commas"""
     return amount_str.replace(',', '')
 
-def extract_payment_type(description):
-    """Extract payment type from description"""
-    payment_types = {
-        'DD': 'Direct Debit',
-        'VISA': 'Visa Card',
-        'VIS': 'Visa Card',
-        'BP': 'Bank Payment',
-        'CR': 'Credit',
-        ')))': 'Contactless',
-        'CRS': 'Credit Transfer',
-        'CRA': 'Credit Transfer'
-    }
+# Lines longer than this are garbled extractions (a real statement line is well under
+# 200 characters); they are skipped so no single line can dominate the parse time
+MAX_LINE_LENGTH = 1000
+
+_AMOUNT_RUN = re.compile(r'[\d,]+')
+_RATE_PATTERN = re.compile(r'@\s*[\d,]+\.\d+')
+_REFERENCE_PATTERN = re.compile(r'[A-Z]{3}\d{5}[A-Z]{2}\d{3}[A-Z]{3}')
+# Same pattern as a lookahead, so overlapping references inside descriptions are found too
+_REFERENCE_LOOKAHEAD = re.compile(r'(?=([A-Z]{3}\d{5}[A-Z]{2}\d{3}[A-Z]{3}))')
+
+def find_amounts(text):
+    r"""
+    Return the (start, end) spans of amounts like 1,234.56 in text.
+    
+    Finds the same matches as re.finditer(r'[\d,]+\.\d{2}', text), but in time
+    linear in len(text): the regex retries every start position inside a long
+    digit/comma run that has no decimals, this skips the whole run at once.
+    """
+    spans = []
+    pos = 0
+    while True:
+        run = _AMOUNT_RUN.search(text, pos)
+        if run is None:
+            return spans
+        end = run.end()
+        decimals = text[end + 1:end + 3]
+        if text[end:end + 1] == '.' and len(decimals) == 2 and decimals.isdecimal():
+            spans.append((run.start(), end + 3))
+            pos = end + 3
+        else:
+            pos = end
+
+def _amounts_outside_rates(line):
+    """find_amounts for the parts of line outside exchange rates (@ X.XXXX)"""
+    spans = []
+    pos = 0
+    for rate in _RATE_PATTERN.finditer(line):
+        spans.extend((pos + start, pos + end) for start, end in find_amounts(line[pos:rate.start()]))
+        pos = rate.end()
+    spans.extend((pos + start, pos + end) for start, end in find_amounts(line[pos:]))
+    return spans
+
+def _remove_spans(text, spans):
+    """text without the given (sorted, non-overlapping) spans"""
+    parts = []
+    pos = 0
+    for start, end in spans:
+        parts.append(text[pos:start])
+        pos = end
+    parts.append(text[pos:])
+    return ''.join(parts)
+
+# Payment type codes HSBC prints at the start of a description.
+# Add your own here - the longest matching code wins, so 'CRS' beats 'CR'.
+PAYMENT_TYPES = {
+    'DD': 'Direct Debit',
+    'VISA': 'Visa Card',
+    'VIS': 'Visa Card',
+    'BP': 'Bank Payment',
+    'CR': 'Credit',
+    ')))': 'Contactless',
+    'CRS': 'Credit Transfer',
+    'CRA': 'Credit Transfer'
+}
+
+class PaymentCodeTrie:
+    """Prefix trie over payment codes; match() finds the longest code a description starts with"""
+    
+    _END = object()  # Key marking "a code ends at this node"
+    
+    def __init__(self, codes):
+        self._root = {}
+        for code, full_name in codes.items():
+            node = self._root
+            for char in code:
+                node = node.setdefault(char, {})
+            node[self._END] = (code, full_name)
+    
+    def match(self, text):
+        """Return (code, full_name) for the longest matching prefix of text, or None"""
+        node = self._root
+        best = None
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            best = node.get(self._END, best)
+        return best
+
+@dataclass(frozen=True)
+class NormalizedDescription:
+    """Everything the export needs from a raw description, computed once"""
+    payment_type: str
+    details: str
+    excluded: str = None  # 'duplicate_fee', 'visa_rate' or None
+
+class DescriptionNormalizer:
+    """
+    Computes payment type, cleaned details and exclusion flags for descriptions.
+    
+    Results are memoized per description, so recurring merchants and standing
+    orders across years of statements are only normalized once.
+    
+    Args:
+        payment_types: Code table to use (PAYMENT_TYPES by default)
+        cache_size: Distinct descriptions remembered before the cache is reset
+    """
+    
+    def __init__(self, payment_types=None, cache_size=100000):
+        self.trie = PaymentCodeTrie(PAYMENT_TYPES if payment_types is None else payment_types)
+        self.cache_size = cache_size
+        self._cache = {}
     
-    for code, full_name in payment_types.items():
-        if description.startswith(code):
-            return full_name
+    def normalize(self, description):
+        result = self._cache.get(description)
+        if result is None:
+            result = self._normalize(description)
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[description] = result
+        return result
     
-    return 'Other'
+    def _normalize(self, desc):
+        match = self.trie.match(desc)
+        payment_type = match[1] if match else 'Other'
+        
+        # Remove payment type prefix
+        details = desc[len(match[0]):] if match else desc
+        # Remove DR prefix from "DRNon-Sterling Transaction Fee"
+        details = re.sub(r'^DR(Non-Sterling Transaction Fee)', r'\1', details)
+        # Remove multiple spaces
+        details = re.sub(r'\s+', ' ', details).strip()
+        
+        excluded = None
+        # "Fee for maintaining the account Monthly" is a duplicate of DRINS ASPECTS FEE
+        if "Fee for maintaining the account Monthly" in details:
+            excluded = 'duplicate_fee'
+        # "Visa Rate" entries are just exchange rate info lines, not actual transactions
+        elif "Visa Rate" in details:
+            excluded = 'visa_rate'
+        
+        return NormalizedDescription(payment_type, details, excluded)
+
+_default_normalizer = DescriptionNormalizer()
+
+# Payment types (from PAYMENT_TYPES) that always move money in or out of the account
+CREDIT_PAYMENT_TYPES = ('Credit', 'Credit Transfer')
+DEBIT_PAYMENT_TYPES = ('Direct Debit', 'Visa Card', 'Contactless')
+
+def _payment_type(desc):
+    """Full name of the longest payment code desc starts with, or None"""
+    match = _default_normalizer.trie.match(desc)
+    return match[1] if match else None
+
+def extract_payment_type(description):
+    """Extract payment type from description"""
+    return _default_normalizer.normalize(description).payment_type
 
 def clean_description(desc):
     """Clean up description by removing payment type codes and extra spaces"""
-    # Remove payment type prefixes
-    desc = re.sub(r'^(DD|VISA|VIS|BP|CR|CRS|CRA|\)\)\))', '', desc)
-    # Remove DR prefix from "DRNon-Sterling Transaction Fee"
-    desc = re.sub(r'^DR(Non-Sterling Transaction Fee)', r'\1', desc)
-    # Remove multiple spaces
-    desc = re.sub(r'\s+', ' ', desc)
-    return desc.strip()
-
-def parse_page_transactions(page_text, page_num, last_date_from_prev_page=None):
+    return _default_normalizer.normalize(desc).details
+
+def merge_international_transactions(transactions, log=print, stats=None):
+    """Merge INT'L transactions with their Visa Rate lines (in place)"""
+    # INT'L transactions are followed by a "Visa Rate" line showing the GBP equivalent
+    # We need to use the Visa Rate amount as the actual transaction amount
+    i = 0
+    while i < len(transactions):
+        trans = transactions[i]
+        if "INT'L" in trans['description'] or 'International' in trans['description']:
+            # Look for the next transaction on same date with "Visa Rate" in description
+            if i + 1 < len(transactions):
+                next_trans = transactions[i + 1]
+                if next_trans['date'] == trans['date'] and 'Visa Rate' in next_trans['description']:
+                    # Merge: use Visa Rate amount as the actual GBP amount
+                    gbp_amount = next_trans['amount']
+                    trans['amount'] = gbp_amount
+                    # Remove the Visa Rate line
+                    transactions.pop(i + 1)
+                    if stats is not None:
+                        stats['intl_merged'] += 1
+                    log(f"  🔗 Merged INT'L transaction: {trans['description'][:40]} - GBP amount: £{gbp_amount}")
+        i += 1
+    return transactions
+
+def parse_page_transactions(page_text, page_num, last_date_from_prev_page=None, log=print, stats=None):
     """Parse transactions from a single page"""
-    print(f"\n{'='*70}")
-    print(f"PROCESSING PAGE {page_num}")
-    print('='*70)
+    log(f"\n{'='*70}")
+    log(f"PROCESSING PAGE {page_num}")
+    log('='*70)
     
     # Skip info pages
     if 'Commercial Banking Customers' in page_text or 'Personal Banking Customers' in page_text:
-        print("⏭️  Skipping info page...")
+        log("⏭️  Skipping info page...")
+        if stats is not None:
+            stats['info_pages_skipped'] += 1
         return [], None
     
     transactions = []
@@ -123,10 +805,18 @@ def parse_page_transactions(page_text, page_num, last_date_from_prev_page=None):
     # But some transactions are merged with these markers, so we need to extract them first
     
     # Replace merged markers to separate transactions
-    page_text = re.sub(r'(\d+\.\d{2})(\d{2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{2})\s+BALANCE', r'\1\n\2 BALANCE', page_text)
-    page_text = re.sub(r'(\d+\.\d{2})BALANCE', r'\1\nBALANCE', page_text)
+    # ((?<!\d) only lets a match start at the beginning of a digit run - the same matches,
+    # without retrying from every digit of a long run)
+    page_text = re.sub(r'(?<!\d)(\d+\.\d{2})(\d{2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{2})\s+BALANCE', r'\1\n\2 BALANCE', page_text)
+    page_text = re.sub(r'(?<!\d)(\d+\.\d{2})BALANCE', r'\1\nBALANCE', page_text)
     
     lines = page_text.split('\n')
+    long_lines = sum(1 for line in lines if len(line) > MAX_LINE_LENGTH)
+    if long_lines:
+        log(f"⚠️  Skipping {long_lines} garbled line(s) longer than {MAX_LINE_LENGTH} characters")
+        if stats is not None:
+            stats['long_lines_skipped'] += long_lines
+        lines = ['' if len(line) > MAX_LINE_LENGTH else line for line in lines]
     transaction_lines = []
     
     # First, collect all transaction lines (skip BALANCEBROUGHTFORWARD, stop at BALANCECARRIEDFORWARD footer)
@@ -163,7 +853,7 @@ def parse_page_transactions(page_text, page_num, last_date_from_prev_page=None):
         if not found_first_transaction:
             # Check if this line starts a transaction (has date OR payment code)
             has_date = re.match(r'^(\d{2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{2})', line)
-            has_payment_code = re.match(r'^(DD|VISA|VIS|BP|CR|CRS|CRA|\)\)\))', line)
+            has_payment_code = _default_normalizer.trie.match(line)
             
             if not has_date and not has_payment_code:
                 # Skip this header line
@@ -180,13 +870,12 @@ def parse_page_transactions(page_text, page_num, last_date_from_prev_page=None):
             rest = date_match.group(2).strip()
             
             # Check if amounts are on this line
-            amounts = re.findall(r'[\d,]+\.\d{2}', rest)
+            spans = find_amounts(rest)
+            amounts = [rest[start:end] for start, end in spans]
             
             if amounts:
                 # Complete transaction on one line
-                desc = rest
-                for amt in amounts:
-                    desc = desc.replace(amt, '').strip()
+                desc = _remove_spans(rest, spans).strip()
                 
                 if len(amounts) >= 2:
                     trans_amt = clean_amount(amounts[-2])
@@ -210,7 +899,7 @@ def parse_page_transactions(page_text, page_num, last_date_from_prev_page=None):
                     'amount': trans_amt,
                     'balance': balance
                 })
-                print(f"  ✓ {current_date} | {desc[:35]:<35} | £{trans_amt:<10} | Bal: £{balance}")
+                log(f"  ✓ {current_date} | {desc[:35]:<35} | £{trans_amt:<10} | Bal: £{balance}")
                 current_desc_parts = []
             else:
                 # Description starts, continues on next lines
@@ -219,15 +908,13 @@ def parse_page_transactions(page_text, page_num, last_date_from_prev_page=None):
         elif current_date:
             # Line without date - continuation or amount line
             # First, check for exchange rates (@ X.XXXX) and exclude them from amount detection
-            line_without_rates = re.sub(r'@\s*[\d,]+\.\d+', '@', line)  # Replace rate with just @ symbol
-            amounts = re.findall(r'[\d,]+\.\d{2}', line_without_rates)
+            spans = _amounts_outside_rates(line)
+            amounts = [line[start:end] for start, end in spans]
             
             if amounts:
                 # This line has the amounts - complete the transaction
                 # Use original line for description (keep @ symbol for filtering later)
-                desc_part = line
-                for amt in amounts:
-                    desc_part = desc_part.replace(amt, '').strip()
+                desc_part = _remove_spans(line, spans).strip()
                 
                 if desc_part:
                     current_desc_parts.append(desc_part)
@@ -253,7 +940,7 @@ def parse_page_transactions(page_text, page_num, last_date_from_prev_page=None):
                     'amount': trans_amt,
                     'balance': balance
                 })
-                print(f"  ✓ {current_date} | {full_desc[:35]:<35} | £{trans_amt:<10} | Bal: £{balance}")
+                log(f"  ✓ {current_date} | {full_desc[:35]:<35} | £{trans_amt:<10} | Bal: £{balance}")
                 current_desc_parts = []
             else:
                 # No amounts yet, keep building description
@@ -263,23 +950,7 @@ def parse_page_transactions(page_text, page_num, last_date_from_prev_page=None):
         i += 1
     
     # INTERNATIONAL TRANSACTION PASS: Merge INT'L transactions with their Visa Rate lines
-    # INT'L transactions are followed by a "Visa Rate" line showing the GBP equivalent
-    # We need to use the Visa Rate amount as the actual transaction amount
-    i = 0
-    while i < len(transactions):
-        trans = transactions[i]
-        if "INT'L" in trans['description'] or 'International' in trans['description']:
-            # Look for the next transaction on same date with "Visa Rate" in description
-            if i + 1 < len(transactions):
-                next_trans = transactions[i + 1]
-                if next_trans['date'] == trans['date'] and 'Visa Rate' in next_trans['description']:
-                    # Merge: use Visa Rate amount as the actual GBP amount
-                    gbp_amount = next_trans['amount']
-                    trans['amount'] = gbp_amount
-                    # Remove the Visa Rate line
-                    transactions.pop(i + 1)
-                    print(f"  🔗 Merged INT'L transaction: {trans['description'][:40]} - GBP amount: £{gbp_amount}")
-        i += 1
+    merge_international_transactions(transactions, log, stats)
     
     # FINAL PASS: Look for orphaned transactions (no date, but have reference + amount)
     # These might be related charges that got separated in PDF extraction
@@ -288,6 +959,10 @@ def parse_page_transactions(page_text, page_num, last_date_from_prev_page=None):
     # Search in ALL lines (not just transaction_lines), as orphans may be in footer section
     
     orphans_to_insert = []  # List of (index_to_insert_after, orphan_transaction)
+    # First transaction mentioning each reference, and first balance-only line per date
+    # (built on first use, so each orphan is a lookup rather than a scan of the page)
+    reference_index = None
+    balance_lines = None
     
     for idx in range(len(lines)):
         line = lines[idx].strip()
@@ -295,65 +970,72 @@ def parse_page_transactions(page_text, page_num, last_date_from_prev_page=None):
         if re.match(r'^\d{2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{2}', line):
             continue
         # Skip if no amount
-        if not re.search(r'[\d,]+\.\d{2}', line):
+        spans = find_amounts(line)
+        if not spans:
             continue
         # Skip if it's just a balance line or common text
         if 'BALANCE' in line or 'Date Payment' in line:
             continue
             
         # Look for reference codes (e.g., RBC08042JE908KCG)
-        ref_match = re.search(r'[A-Z]{3}\d{5}[A-Z]{2}\d{3}[A-Z]{3}', line)
+        ref_match = _REFERENCE_PATTERN.search(line)
         if ref_match:
             reference = ref_match.group()
-            amounts = re.findall(r'[\d,]+\.\d{2}', line)
+            amounts = [line[start:end] for start, end in spans]
             if amounts:
                 orphan_amount = clean_amount(amounts[-1])
+                if reference_index is None:
+                    reference_index = {}
+                    balance_lines = {}
+                    for t_idx, t in enumerate(transactions):
+                        for found in _REFERENCE_LOOKAHEAD.finditer(t['description']):
+                            reference_index.setdefault(found.group(1), t_idx)
+                        if not t['description'] and not t['amount'] and t['balance']:
+                            balance_lines.setdefault(t['date'], t_idx)
                 # Try to find a transaction with matching reference and its index
                 # We want to insert AFTER the balance-only line (not after the description line)
                 # because they will be merged later
-                for trans_idx, trans in enumerate(transactions):
-                    if reference in trans['description']:
-                        print(f"  🔗 Found orphaned transaction matching {reference}: £{orphan_amount}")
-                        # Create a new transaction with same date and reference
-                        desc_parts = line.replace(reference, '').strip()
-                        for amt in amounts:
-                            desc_parts = desc_parts.replace(amt, '').strip()
-                        
-                        # Find the balance-only line with same date (this is what will be merged)
-                        orphan_balance = ''
-                        balance_line_idx = trans_idx
-                        balance_line_trans = None
-                        for t_idx, t in enumerate(transactions):
-                            if t['date'] == trans['date'] and not t['description'] and not t['amount'] and t['balance']:
-                                orphan_balance = t['balance']
-                                balance_line_idx = t_idx  # Insert after this line instead
-                                balance_line_trans = t
-                                break
-                        
-                        # Calculate the correct balance for the balance-only line (before orphan deduction)
-                        # The balance-only line currently shows balance AFTER orphan, but it should show balance BEFORE
-                        if orphan_balance:
-                            try:
-                                balance_after = float(orphan_balance)
-                                orphan_amt = float(orphan_amount)
-                                balance_before = balance_after + orphan_amt  # Add back the orphan amount
-                                # Update the balance-only line's balance
-                                if balance_line_trans:
-                                    balance_line_trans['balance'] = f"{balance_before:.2f}"
-                                    print(f"  ℹ️  Adjusted balance-only line balance: £{balance_after:.2f} → £{balance_before:.2f}")
-                            except:
-                                pass
-                        
-                        orphan_trans = {
-                            'date': trans['date'],
-                            'description': desc_parts + ' ' + reference if desc_parts else '',
-                            'amount': orphan_amount,
-                            'balance': orphan_balance,  # This will be the balance AFTER the orphan is deducted
-                            '_is_orphan_debit': True  # Mark as orphaned debit for direction logic
-                        }
-                        orphans_to_insert.append((balance_line_idx, orphan_trans))  # Insert after balance line
-                        print(f"  ✓ {trans['date']} | {(desc_parts + ' ' + reference if desc_parts else '')[:35]:<35} | £{orphan_amount:<10} | Bal: £{orphan_balance}")
-                        break
+                trans_idx = reference_index.get(reference)
+                if trans_idx is not None:
+                    trans = transactions[trans_idx]
+                    log(f"  🔗 Found orphaned transaction matching {reference}: £{orphan_amount}")
+                    # Create a new transaction with same date and reference
+                    desc_parts = _remove_spans(line, spans).replace(reference, '').strip()
+                    
+                    # Find the balance-only line with same date (this is what will be merged)
+                    orphan_balance = ''
+                    balance_line_idx = trans_idx
+                    balance_line_trans = None
+                    if trans['date'] in balance_lines:
+                        balance_line_idx = balance_lines[trans['date']]  # Insert after this line instead
+                        balance_line_trans = transactions[balance_line_idx]
+                        orphan_balance = balance_line_trans['balance']
+                    
+                    # Calculate the correct balance for the balance-only line (before orphan deduction)
+                    # The balance-only line currently shows balance AFTER orphan, but it should show balance BEFORE
+                    if orphan_balance:
+                        try:
+                            balance_after = float(orphan_balance)
+                            orphan_amt = float(orphan_amount)
+                            balance_before = balance_after + orphan_amt  # Add back the orphan amount
+                            # Update the balance-only line's balance
+                            if balance_line_trans:
+                                balance_line_trans['balance'] = f"{balance_before:.2f}"
+                                log(f"  ℹ️  Adjusted balance-only line balance: £{balance_after:.2f} → £{balance_before:.2f}")
+                        except:
+                            pass
+                    
+                    orphan_trans = {
+                        'date': trans['date'],
+                        'description': desc_parts + ' ' + reference if desc_parts else '',
+                        'amount': orphan_amount,
+                        'balance': orphan_balance,  # This will be the balance AFTER the orphan is deducted
+                        '_is_orphan_debit': True  # Mark as orphaned debit for direction logic
+                    }
+                    orphans_to_insert.append((balance_line_idx, orphan_trans))  # Insert after balance line
+                    if stats is not None:
+                        stats['orphans_matched'] += 1
+                    log(f"  ✓ {trans['date']} | {(desc_parts + ' ' + reference if desc_parts else '')[:35]:<35} | £{orphan_amount:<10} | Bal: £{orphan_balance}")
     
     # Insert orphans in reverse order (so indices don't shift)
     for insert_idx, orphan_trans in reversed(orphans_to_insert):
@@ -362,8 +1044,213 @@ def parse_page_transactions(page_text, page_num, last_date_from_prev_page=None):
     # Return transactions and the last date seen on this page
     return transactions, current_date
 
-def merge_split_transactions(transactions):
+# ============================================================================
+# LAYOUT EXTRACTION - Read the transaction table by word coordinates
+# ============================================================================
+
+LAYOUT_DATE_PATTERN = re.compile(r'^\d{2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{2}$')
+LAYOUT_AMOUNT_PATTERN = re.compile(r'^[\d,]+\.\d{2}$')
+
+def _group_word_lines(words, tolerance=3):
+    """Group pdfplumber words into visual lines (top-to-bottom, left-to-right)"""
+    lines = []
+    for word in sorted(words, key=lambda w: (w['top'], w['x0'])):
+        if lines and abs(word['top'] - lines[-1][0]['top']) <= tolerance:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+    return [sorted(line, key=lambda w: w['x0']) for line in lines]
+
+def _squash(line):
+    """Line text without spaces, upper-cased (HSBC markers come out both with and without spaces)"""
+    return ''.join(w['text'] for w in line).replace(' ', '').upper()
+
+def find_table_columns(lines):
+    """
+    Locate the 'Date | Payment type and details | Paid out | Paid in | Balance' header.
+    
+    Returns (header_line_index, columns) where columns holds the x positions needed
+    to assign words, or None if this page has no transaction table header.
+    """
+    for idx, line in enumerate(lines):
+        squashed = _squash(line)
+        if not squashed.startswith('DATE') or 'PAIDOUT' not in squashed or 'BALANCE' not in squashed:
+            continue
+        
+        texts = [w['text'].lower() for w in line]
+        try:
+            details_word = line[1]
+            out_word = next(w for i, w in enumerate(line) if texts[i] in ('out', 'paidout'))
+            in_word = next(w for i, w in enumerate(line) if texts[i] in ('in', 'paidin'))
+            balance_word = next(w for i, w in enumerate(line) if texts[i] == 'balance')
+        except (IndexError, StopIteration):
+            continue
+        
+        # Amounts are right-aligned under their headers, so columns are keyed on x1
+        columns = {
+            'details_x0': details_word['x0'],
+            'out': out_word['x1'],
+            'in': in_word['x1'],
+            'balance': balance_word['x1'],
+        }
+        # Anything right of here that looks like an amount belongs to an amount column
+        columns['amounts_x1'] = columns['out'] - (columns['in'] - columns['out']) / 2
+        return idx, columns
+    return None
+
+def parse_page_layout(words, page_num, last_date_from_prev_page=None, log=print, stats=None):
+    """
+    Parse transactions from a page's pdfplumber words (page.extract_words()) using their coordinates.
+    
+    Only words between the table header and BALANCE CARRIED FORWARD are read, and each
+    word is assigned to Date / Payment type and details / Paid out / Paid in / Balance
+    by its x position. Paid in vs paid out therefore comes straight from the column
+    (stored as '_column'), and none of the text-flow heuristics are needed.
+    
+    Returns (transactions, last_date), or None if the page has no recognisable table
+    (callers then fall back to parse_page_transactions).
+    """
+    lines = _group_word_lines(words)
+    found = find_table_columns(lines)
+    if found is None:
+        return None
+    header_idx, columns = found
+    
+    log(f"\n{'='*70}")
+    log(f"PROCESSING PAGE {page_num} (layout)")
+    log('='*70)
+    
+    transactions = []
+    current_date = last_date_from_prev_page
+    current_desc_parts = []
+    
+    for line in lines[header_idx + 1:]:
+        squashed = _squash(line)
+        # The table (and the region we read) ends at the footer marker
+        if 'BALANCECARRIEDFORWARD' in squashed:
+            break
+        
+        date_words, desc_words, amounts = [], [], {}
+        for word in line:
+            if word['x1'] > columns['amounts_x1'] and LAYOUT_AMOUNT_PATTERN.match(word['text']):
+                column = min(('out', 'in', 'balance'), key=lambda c: abs(columns[c] - word['x1']))
+                amounts[column] = clean_amount(word['text'])
+            elif word['x1'] <= columns['details_x0']:
+                date_words.append(word['text'])
+            else:
+                desc_words.append(word['text'])
+        
+        date_text = ' '.join(date_words)
+        if LAYOUT_DATE_PATTERN.match(date_text):
+            current_date = date_text
+        
+        if 'BALANCEBROUGHTFORWARD' in squashed:
+            continue
+        if desc_words:
+            current_desc_parts.append(' '.join(desc_words))
+        if not current_date:
+            continue
+        
+        if 'out' in amounts or 'in' in amounts:
+            column = 'out' if 'out' in amounts else 'in'
+            trans = {
+                'date': current_date,
+                'description': ' '.join(current_desc_parts).strip(),
+                'amount': amounts[column],
+                'balance': amounts.get('balance', ''),
+                '_column': column
+            }
+            transactions.append(trans)
+            current_desc_parts = []
+            log(f"  ✓ {current_date} | {trans['description'][:35]:<35} | £{trans['amount']:<10} | Bal: £{trans['balance']}")
+        elif 'balance' in amounts:
+            # Balance printed on its own line: it belongs to the last transaction above it
+            if transactions and not transactions[-1]['balance']:
+                transactions[-1]['balance'] = amounts['balance']
+            else:
+                transactions.append({'date': current_date, 'description': '', 'amount': '',
+                                     'balance': amounts['balance']})
+    
+    merge_international_transactions(transactions, log, stats)
+    if stats is not None:
+        stats['layout_pages'] += 1
+    return transactions, current_date
+
+def iter_layout_transactions(pdf_path, log=print, stats=None):
+    """
+    Yield (page_num, transactions) per page using layout extraction.
+    
+    Pages without a recognisable table (info pages, odd layouts) fall back to the
+    text path: PyPDF2 text with the usual parse_page_transactions heuristics.
+    """
+    file = _open_source(pdf_path)
+    pdf_reader = None
+    try:
+        with pdfplumber.open(_fallback_source(pdf_path, file)) as pdf:
+            log(f"📄 Total pages in PDF: {len(pdf.pages)}")
+            if stats is not None:
+                stats['pages'] += len(pdf.pages)
+            
+            last_date = None
+            accounts = AccountTagger()
+            for page_num, page in enumerate(pdf.pages, 1):
+                words = []
+                started = time.perf_counter()
+                try:
+                    words = page.extract_words()
+                    parsed = parse_page_layout(words, page_num, last_date, log, stats)
+                except Exception as e:
+                    log(f"⚠️  Warning: layout extraction failed on page {page_num}: {str(e)}")
+                    parsed = None
+                text = ' '.join(w['text'] for w in words)
+                
+                if parsed is None:
+                    if stats is not None:
+                        stats['layout_fallbacks'] += 1
+                    if pdf_reader is None:
+                        pdf_reader = PyPDF2.PdfReader(file)
+                    try:
+                        text = pdf_reader.pages[page_num - 1].extract_text()
+                    except Exception as e:
+                        log(f"⚠️  Warning: PyPDF2 failed on page {page_num}: {str(e)}")
+                        text = page.extract_text() or ""
+                    parsed = parse_page_transactions(text, page_num, last_date, log, stats)
+                
+                page_transactions, last_date = parsed
+                _tag_page(page_transactions, page_num)
+                accounts.tag(page_transactions, text)
+                if stats is not None:
+                    # Layout pages are extracted and parsed in one go
+                    stats['seconds_extract'] += time.perf_counter() - started
+                    stats['transactions'] += len(page_transactions)
+                yield page_num, page_transactions
+    finally:
+        if file is not pdf_path:
+            file.close()
+
+def iter_statement_pages(pdf_path, mode=None, log=print, stats=None, page_timeout=None, memory_limit_mb=None):
+    """
+    Yield (page_num, transactions) for each page of a statement.
+    
+    mode is 'text' (PyPDF2 text + heuristics) or 'layout' (word coordinates,
+    falling back to text per page); None means EXTRACTION_MODE. With a
+    page_timeout, text-mode pages are extracted in a supervised worker process
+    (see iter_pdf_pages_isolated).
+    """
+    mode = mode or EXTRACTION_MODE
+    if mode == 'layout':
+        return iter_layout_transactions(pdf_path, log, stats)
+    if mode != 'text':
+        raise ValueError(f"Unknown extraction mode '{mode}' (use 'text' or 'layout')")
+    if page_timeout:
+        pages = iter_pdf_pages_isolated(pdf_path, page_timeout, memory_limit_mb, log, stats)
+    else:
+        pages = iter_pdf_pages(pdf_path, log, stats)
+    return iter_page_transactions(pages, log, stats)
+
+def merge_split_transactions(transactions, log=print, stats=None):
     """Merge transactions that were split between page body and footer"""
+    started = time.perf_counter()
     # Find transactions with only balance (date + balance, no description/amount)
     # Find transactions with description but no balance (from footer)
     # Match and merge them based on balance calculations
@@ -413,9 +1300,15 @@ def merge_split_transactions(transactions):
                 'amount': desc_trans['amount'],
                 'balance': bal_trans['balance']
             }
+            # Keep the internal tags (paid in/out column, account) of the detail line
+            for tag in ('_column', '_account', '_page', '_statement'):
+                if tag in desc_trans:
+                    merged_trans[tag] = desc_trans[tag]
             replacements[bal_idx] = merged_trans
             skip_indices.add(desc_idx)
-            print(f"  ✓ Merged: {bal_trans['date']} {desc_trans['description'][:30]} £{desc_trans['amount']} Bal:£{bal_trans['balance']}")
+            if stats is not None:
+                stats['split_merged'] += 1
+            log(f"  ✓ Merged: {bal_trans['date']} {desc_trans['description'][:30]} £{desc_trans['amount']} Bal:£{bal_trans['balance']}")
     
     # Build final list maintaining original order
     result = []
@@ -427,6 +1320,8 @@ def merge_split_transactions(transactions):
         else:
             result.append(trans)  # Keep original
     
+    if stats is not None:
+        stats['seconds_merge'] += time.perf_counter() - started
     return result
 
 def calculate_working_balances(transactions):
@@ -456,8 +1351,9 @@ def calculate_working_balances(transactions):
                     amt = 0
                 
                 desc = transactions[i]['description']
-                # Credits (CR/CRS/CRA) add to balance, everything else subtracts
-                if desc.startswith(('CR', 'CRS', 'CRA')):
+                # Credits (CR/CRS/CRA, or the Paid in column) add to balance, everything else subtracts
+                if transactions[i].get('_column') == 'in' or (
+                        '_column' not in transactions[i] and _payment_type(desc) in CREDIT_PAYMENT_TYPES):
                     # Money IN
                     last_known_balance += amt
                 else:
@@ -488,9 +1384,17 @@ def determine_debit_credit(all_transactions, working_balances=None):
         # Determine IN/OUT based on transaction prefix codes from PDF
         desc = trans['description']
         
+        # Layout extraction read the Paid in / Paid out column directly - no guessing needed
+        if trans.get('_column') == 'in':
+            trans['paid_in'] = trans['amount']
+            trans['paid_out'] = ''
+        elif trans.get('_column') == 'out':
+            trans['paid_out'] = trans['amount']
+            trans['paid_in'] = ''
+        
         # PAID IN (Credits to account):
         # - CR*/CRADVICE/CRA = Credits (always incoming)
-        if desc.startswith(('CR', 'CRA', 'CRADVICE')):
+        elif _payment_type(desc) in CREDIT_PAYMENT_TYPES:
             trans['paid_in'] = trans['amount']
             trans['paid_out'] = ''
         
@@ -524,7 +1428,7 @@ def determine_debit_credit(all_transactions, working_balances=None):
         # - ))) = Contactless payment
         # - DR = Debit/Fee
         # Note: TFR (Transfer) removed - can be in OR out, needs balance check
-        elif desc.startswith(('DD', 'VIS', 'ATM', ')))', 'DR')):
+        elif _payment_type(desc) in DEBIT_PAYMENT_TYPES or desc.startswith(('ATM', 'DR')):
             trans['paid_out'] = trans['amount']
             trans['paid_in'] = ''
         
@@ -583,59 +1487,1124 @@ def determine_debit_credit(all_transactions, working_balances=None):
     
     return all_transactions
 
-def export_to_csv(transactions, output_file='statement_transactions.csv'):
-    """Export transactions to CSV with all 6 required fields"""
-    print(f"\n💾 Exporting to {output_file}...")
-    
-    # Filter out duplicate and unwanted entries
-    filtered_transactions = []
-    excluded_count = 0
-    visa_rate_count = 0
-    
-    for trans in transactions:
-        clean_desc = clean_description(trans['description'])
-        
-        # Skip "Fee for maintaining the account Monthly" as it's a duplicate of DRINS ASPECTS FEE
-        if "Fee for maintaining the account Monthly" in clean_desc:
-            excluded_count += 1
-            print(f"  ⏭️  Excluding duplicate fee: {trans['date']} | {clean_desc}")
+def fill_missing_balances(transactions, log=print, stats=None):
+    """Fill in missing balances by propagating from the previous known balance"""
+    for i in range(len(transactions)):
+        trans = transactions[i]
+        # If this transaction already has a balance, use it
+        if trans.get('balance'):
             continue
         
-        # Skip "Visa Rate" entries - these are just exchange rate info lines, not actual transactions
-        if "Visa Rate" in clean_desc:
-            visa_rate_count += 1
-            print(f"  ⏭️  Excluding Visa Rate info line: {trans['date']} | {clean_desc}")
-            continue
+        # Find the previous transaction with a balance
+        prev_balance = None
+        for j in range(i-1, -1, -1):
+            if transactions[j].get('balance'):
+                try:
+                    prev_balance = float(transactions[j]['balance'])
+                    break
+                except:
+                    pass
         
-        filtered_transactions.append(trans)
-    
-    if excluded_count > 0:
-        print(f"  ℹ️  Excluded {excluded_count} duplicate bank fee transaction(s)")
-    if visa_rate_count > 0:
-        print(f"  ℹ️  Excluded {visa_rate_count} Visa Rate info line(s)")
+        # If we found a previous balance, calculate this transaction's balance
+        if prev_balance is not None:
+            try:
+                paid_out = float(trans.get('paid_out', 0) or 0)
+                paid_in = float(trans.get('paid_in', 0) or 0)
+                new_balance = prev_balance - paid_out + paid_in
+                trans['balance'] = f"{new_balance:.2f}"
+                if stats is not None:
+                    stats['balances_filled'] += 1
+                log(f"  ✓ Calculated balance for {trans['date']} {trans['description'][:30]}: £{new_balance:.2f}")
+            except Exception as e:
+                log(f"  ⚠️  Could not calculate balance for {trans['date']}: {e}")
     
-    with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['Date', 'Payment type', 'Details', '£Paid out', '£Paid in', '£Balance']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        writer.writeheader()
-        for trans in filtered_transactions:
-            payment_type = extract_payment_type(trans['description'])
-            clean_desc = clean_description(trans['description'])
+    return transactions
+
+# ============================================================================
+# RECONCILIATION - Re-extract pages whose balances don't chain
+# ============================================================================
+
+def find_chain_breaks(transactions):
+    """
+    Check in one pass that each printed balance equals the previous printed
+    balance plus the paid in and minus the paid out amounts in between.
+    
+    Transactions must already be classified (determine_debit_credit). A break is
+    blamed on every page the rows between the two balances came from.
+    
+    Returns (breaks, verified): a Counter {page_num: breaks} and the number of
+    balances that did add up.
+    """
+    breaks = Counter()
+    verified = 0
+    previous_balance = None
+    movement = 0.0
+    pages = set()
+    
+    for trans in transactions:
+        try:
+            amount = float(trans['amount'] or 0)
+        except ValueError:
+            amount = 0
+        movement += amount if trans.get('paid_in') else -amount
+        pages.add(trans.get('_page'))
+        
+        if trans['balance']:
+            balance = float(trans['balance'])
+            if previous_balance is not None:
+                if abs(previous_balance + movement - balance) > 0.005:
+                    for page_num in pages:
+                        breaks[page_num] += 1
+                else:
+                    verified += 1
+            previous_balance = balance
+            movement = 0.0
+            pages = set()
+    
+    return breaks, verified
+
+def _chain_breaks(transactions):
+    """Merge and classify a copy of a statement's transactions, then find_chain_breaks"""
+    checked = merge_split_transactions([dict(trans) for trans in transactions], _silent)
+    checked = determine_debit_credit(checked, calculate_working_balances(checked))
+    return find_chain_breaks(checked)
+
+def _reextract_isolated(pdf_path, page_nums, mode, last_dates, timeout, memory_limit_mb):
+    """reextract_pages in a supervised worker; a backend that fails on a page adds no candidate"""
+    worker = IsolatedPageWorker(_read_source_bytes(pdf_path), timeout, memory_limit_mb)
+    try:
+        for page_num in page_nums:
+            last_date = last_dates.get(page_num)
+            candidates = []
+            for backend in ('pypdf2' if mode == 'layout' else 'words', 'pdfplumber'):
+                status, value = worker.request(backend, page_num - 1)
+                if status != 'ok':
+                    continue
+                if backend == 'words':
+                    parsed = parse_page_layout(value, page_num, last_date, _silent)
+                    if parsed is not None:
+                        candidates.append(('layout', parsed[0]))
+                else:
+                    label = 'PyPDF2' if backend == 'pypdf2' else 'pdfplumber'
+                    candidates.append((label, parse_page_transactions(value or "", page_num, last_date, _silent)[0]))
+            yield page_num, candidates
+    finally:
+        worker.close()
+
+def reextract_pages(pdf_path, page_nums, mode=None, last_dates=None, page_timeout=None, memory_limit_mb=None):
+    """
+    Parse the given pages again with the other extraction paths.
+    
+    Yields (page_num, candidates), where candidates is a list of (label, transactions):
+    text-mode pages are re-read by word coordinates and with pdfplumber's text,
+    layout-mode pages with PyPDF2's and pdfplumber's text. last_dates maps page_num
+    to the date carried over from the previous page. With page_timeout set the pages
+    are re-read in a supervised worker process, as in iter_pdf_pages_isolated.
+    """
+    mode = mode or EXTRACTION_MODE
+    last_dates = last_dates or {}
+    if page_timeout:
+        yield from _reextract_isolated(pdf_path, page_nums, mode, last_dates, page_timeout, memory_limit_mb)
+        return
+    file = _open_source(pdf_path)
+    try:
+        pdf_reader = PyPDF2.PdfReader(file) if mode == 'layout' else None
+        with pdfplumber.open(_fallback_source(pdf_path, file)) as pdf:
+            for page_num in page_nums:
+                page = pdf.pages[page_num - 1]
+                last_date = last_dates.get(page_num)
+                candidates = []
+                if pdf_reader is not None:
+                    text = pdf_reader.pages[page_num - 1].extract_text()
+                    candidates.append(('PyPDF2', parse_page_transactions(text, page_num, last_date, _silent)[0]))
+                else:
+                    parsed = parse_page_layout(page.extract_words(), page_num, last_date, _silent)
+                    if parsed is not None:
+                        candidates.append(('layout', parsed[0]))
+                text = page.extract_text() or ""
+                candidates.append(('pdfplumber', parse_page_transactions(text, page_num, last_date, _silent)[0]))
+                yield page_num, candidates
+    finally:
+        if file is not pdf_path:
+            file.close()
+
+def reconcile_pages(pdf_path, transactions, mode=None, log=print, stats=None, page_timeout=None,
+                    memory_limit_mb=None):
+    """
+    Re-extract only the pages of one statement whose balances don't chain.
+    
+    A break between two pages is blamed on both, so the pages whose own rows
+    don't chain are re-read first, and a page that only shares a broken link with
+    a neighbour is re-read only if that link is still broken afterwards.
+    
+    A re-read page replaces the original one if it lowers the number of chain
+    breaks and verifies more balances (a page read as empty has no breaks, but
+    verifies nothing); otherwise the first extraction is kept. page_timeout and
+    memory_limit_mb re-read the pages in a supervised worker (see reextract_pages).
+    Returns the (possibly updated) list of parsed transactions.
+    """
+    started = time.perf_counter()
+    breaks, _ = _chain_breaks(transactions)
+    broken_pages = sorted(page_num for page_num in breaks if page_num is not None)
+    if stats is not None:
+        stats['chain_breaks'] += sum(breaks.values())
+        stats['seconds_reconcile'] += time.perf_counter() - started
+    if not broken_pages:
+        return transactions
+    started = time.perf_counter()
+    
+    log(f"\n📋 Balances don't add up on page(s) {', '.join(map(str, broken_pages))} - re-extracting them...")
+    account = next((trans['_account'] for trans in transactions if trans.get('_account')), None)
+    
+    # Group rows by page (in order), and note the date each page continues from
+    by_page = {}
+    last_dates = {}
+    last_date = None
+    for trans in transactions:
+        page_num = trans.get('_page')
+        if page_num not in by_page:
+            by_page[page_num] = []
+            last_dates[page_num] = last_date
+        by_page[page_num].append(trans)
+        last_date = trans.get('date') or last_date
+    
+    def reread(page_nums):
+        for page_num, candidates in reextract_pages(pdf_path, page_nums, mode, last_dates,
+                                                    page_timeout, memory_limit_mb):
+            if stats is not None:
+                stats['pages_reextracted'] += 1
+            # A page only affects the links to its neighbours, so compare on that window
+            # (keeps the check linear however many pages are broken)
+            before = by_page.get(page_num - 1, [])
+            after = by_page.get(page_num + 1, [])
+            window_breaks, verified = _chain_breaks(before + by_page[page_num] + after)
+            window_breaks = sum(window_breaks.values())
             
-            writer.writerow({
-                'Date': trans['date'].replace(' ', '-'),  # Convert "21 Mar 22" to "21-Mar-22"
-                'Payment type': payment_type,
-                'Details': clean_desc,
-                '£Paid out': trans.get('paid_out', ''),
-                '£Paid in': trans.get('paid_in', ''),
-                '£Balance': trans['balance']
-            })
+            best = None
+            for label, page_transactions in candidates:
+                _tag_page(page_transactions, page_num)
+                _tag_account(page_transactions, account)
+                candidate_breaks, candidate_verified = _chain_breaks(before + page_transactions + after)
+                candidate_breaks = sum(candidate_breaks.values())
+                if candidate_breaks < window_breaks and candidate_verified > verified and (
+                        best is None or candidate_breaks < best[1]):
+                    best = (label, candidate_breaks, page_transactions)
+            
+            if best is None:
+                log(f"  ⚠️  Page {page_num}: re-extraction didn't help, keeping the original")
+                continue
+            label, candidate_breaks, by_page[page_num] = best
+            log(f"  ✓ Page {page_num}: {window_breaks - candidate_breaks} chain break(s) fixed by re-reading it with {label}")
+            if stats is not None:
+                stats['pages_repaired'] += 1
+    
+    own_breaks = [page_num for page_num in broken_pages if _chain_breaks(by_page[page_num])[0]]
+    try:
+        reread(own_breaks)
+        # Links between pages that are still broken: neither page's own rows were to blame
+        shared = [page_num for page_num in broken_pages if page_num not in own_breaks]
+        if shared:
+            remaining, _ = _chain_breaks([trans for page_transactions in by_page.values() for trans in page_transactions])
+            reread([page_num for page_num in shared if remaining[page_num]])
+    except Exception as e:
+        log(f"  ⚠️  Re-extraction failed: {str(e)}")
+    
+    transactions = [trans for page_transactions in by_page.values() for trans in page_transactions]
+    if stats is not None:
+        stats['seconds_reconcile'] += time.perf_counter() - started
+    return transactions
+
+# ============================================================================
+# PERIOD INDEX - Byte ranges per month and statement for random access into CSVs
+# ============================================================================
+
+def period_index_path(csv_path):
+    """Sidecar index file for a CSV"""
+    return f"{csv_path}.idx.json"
+
+class PeriodIndexBuilder:
+    """
+    Collect byte ranges, row ranges and balances per calendar month and per statement
+    while a CSV is written.
+    
+    Each period keeps a list of spans [offset, length, first_row, rows]; combined
+    output is chronological, so that is normally a single span per period.
+    """
+    
+    def __init__(self, csv_name):
+        self.csv_name = csv_name
+        self.offset = 0
+        self.row_count = 0
+        self.balances = OpeningBalances()
+        self.periods = {'months': {}, 'statements': {}}
+    
+    def add_header(self, size):
+        self.offset += size
+    
+    def add_row(self, trans, row, size):
+        sortable = parse_transaction_date(trans['date'])
+        keys = [('months', f"{sortable[:4]}-{sortable[4:6]}")]
+        if trans.get('_statement'):
+            keys.append(('statements', trans['_statement']))
+        for kind, key in keys:
+            period = self.periods[kind].get(key)
+            if period is None:
+                period = self.periods[kind][key] = {
+                    'spans': [], 'rows': 0, 'opening_balance': None, 'closing_balance': None,
+                }
+            spans = period['spans']
+            if spans and spans[-1][0] + spans[-1][1] == self.offset:
+                spans[-1][1] += size
+                spans[-1][3] += 1
+            else:
+                spans.append([self.offset, size, self.row_count, 1])
+            period['rows'] += 1
+            if row['£Balance']:
+                period['closing_balance'] = row['£Balance']
+        for (kind, key), opening in self.balances.add(row, keys):
+            self.periods[kind][key]['opening_balance'] = f"{opening:.2f}"
+        
+        self.offset += size
+        self.row_count += 1
+    
+    def to_dict(self):
+        return {
+            'version': 1,
+            'csv': self.csv_name,
+            'size': self.offset,
+            'rows': self.row_count,
+            'columns': CSV_FIELDNAMES,
+            'months': self.periods['months'],
+            'statements': self.periods['statements'],
+        }
+
+class OpeningBalances:
+    """
+    Opening balance of each period, carried through rows that have no printed balance.
+    
+    A period that starts before the first printed balance keeps the money moved
+    since it started, and gets its opening balance as soon as one turns up.
+    """
+    
+    def __init__(self):
+        self.balance = None  # After the last row, None until a balance is printed
+        self.started = set()
+        self.pending = {}  # period -> movement since it started, while the balance is unknown
+    
+    def add(self, row, periods):
+        """Move past one row of the given periods; returns [(period, opening)] that became known"""
+        movement = float(row['£Paid in'] or 0) - float(row['£Paid out'] or 0)
+        if row['£Balance']:
+            before = float(row['£Balance']) - movement
+        else:
+            before = self.balance
+        
+        known = []
+        for period in periods:
+            if period not in self.started:
+                self.started.add(period)
+                self.pending[period] = 0.0
+            if period in self.pending:
+                if before is None:
+                    self.pending[period] += movement
+                else:
+                    known.append((period, before - self.pending.pop(period)))
+        
+        if row['£Balance']:
+            self.balance = float(row['£Balance'])
+        elif self.balance is not None:
+            self.balance += movement
+        return known
+
+def load_period_index(csv_path):
+    """Load a CSV's period index, refusing one that no longer matches the CSV"""
+    with open(period_index_path(csv_path), encoding='utf-8') as f:
+        index = json.load(f)
+    if os.path.getsize(csv_path) != index['size']:
+        raise ValueError(f"Period index for {csv_path} is out of date - export the CSV again")
+    return index
+
+def read_period(csv_path, month=None, statement=None, index=None):
+    """
+    Read one calendar month ('YYYY-MM') or one statement (PDF file name) from a CSV
+    written with PERIOD_INDEX, seeking straight to its rows.
+    
+    Returns a list of row dicts (like csv.DictReader); empty if the period isn't in the file.
+    """
+    if (month is None) == (statement is None):
+        raise ValueError("Give either month or statement")
+    index = index or load_period_index(csv_path)
+    period = index['months'].get(month) if month else index['statements'].get(statement)
+    if period is None:
+        return []
+    
+    rows = []
+    with open(csv_path, 'rb') as f:
+        for offset, length, _, _ in period['spans']:
+            f.seek(offset)
+            text = f.read(length).decode('utf-8')
+            rows.extend(csv.DictReader(io.StringIO(text, newline=''), fieldnames=index['columns']))
+    return rows
+
+# ============================================================================
+# SUMMARY - Monthly, per-statement and payment-type totals computed during export
+# ============================================================================
+
+# Merchants tracked per group; when full, the smallest is evicted (space-saving),
+# so memory stays constant however many distinct payees a period has
+MERCHANT_SLOTS = 50
+# Merchants listed per group in the summary file
+TOP_MERCHANTS = 10
+
+def _pennies(amount):
+    return round(float(amount) * 100) if amount else 0
+
+def _pounds(pennies):
+    return f"{pennies / 100:.2f}"
+
+class SummaryGroup:
+    """Running totals for one month, statement or the whole file (constant size)"""
+    
+    def __init__(self, opening_balance):
+        self.rows = 0
+        self.paid_in = self.paid_out = 0
+        self.in_count = self.out_count = 0
+        self.opening_balance = opening_balance
+        self.closing_balance = None
+        self.first_date = self.last_date = None
+        self.payment_types = {}
+        self.merchants = {}  # details -> [spent, count, error]
+    
+    def add(self, date, row):
+        paid_in, paid_out = _pennies(row['£Paid in']), _pennies(row['£Paid out'])
+        self.rows += 1
+        self.paid_in += paid_in
+        self.paid_out += paid_out
+        self.in_count += bool(paid_in)
+        self.out_count += bool(paid_out)
+        if row['£Balance']:
+            self.closing_balance = row['£Balance']
+        self.first_date = min(self.first_date or date, date)
+        self.last_date = max(self.last_date or date, date)
+        
+        totals = self.payment_types.setdefault(row['Payment type'], [0, 0, 0])
+        totals[0] += 1
+        totals[1] += paid_in
+        totals[2] += paid_out
+        if paid_out and row['Details']:
+            self._add_merchant(row['Details'], paid_out)
+    
+    def _add_merchant(self, details, spent):
+        entry = self.merchants.get(details)
+        if entry is None:
+            error = 0
+            if len(self.merchants) >= MERCHANT_SLOTS:
+                # Take over the smallest slot; its total becomes this merchant's possible overcount
+                smallest = min(self.merchants, key=lambda name: self.merchants[name][0])
+                error = self.merchants.pop(smallest)[0]
+            entry = self.merchants[details] = [error, 0, error]
+        entry[0] += spent
+        entry[1] += 1
+    
+    def to_dict(self):
+        top = sorted(self.merchants.items(), key=lambda item: -item[1][0])[:TOP_MERCHANTS]
+        return {
+            'first_date': self.first_date,
+            'last_date': self.last_date,
+            'rows': self.rows,
+            'paid_in': _pounds(self.paid_in),
+            'paid_out': _pounds(self.paid_out),
+            'net': _pounds(self.paid_in - self.paid_out),
+            'in_count': self.in_count,
+            'out_count': self.out_count,
+            'opening_balance': None if self.opening_balance is None else f"{self.opening_balance:.2f}",
+            'closing_balance': self.closing_balance,
+            'payment_types': {
+                payment_type: {'rows': count, 'paid_in': _pounds(paid_in), 'paid_out': _pounds(paid_out)}
+                for payment_type, (count, paid_in, paid_out) in sorted(self.payment_types.items())
+            },
+            'top_merchants': [
+                {'details': details, 'paid_out': _pounds(spent), 'rows': count,
+                 'approximate': bool(error)}
+                for details, (spent, count, error) in top
+            ],
+        }
+
+class SummaryBuilder:
+    """Totals for the whole file, each calendar month and each statement, one row at a time"""
+    
+    def __init__(self, csv_name):
+        self.csv_name = csv_name
+        self.balances = OpeningBalances()
+        self.total = None
+        self.groups = {'months': {}, 'statements': {}}
+    
+    def add_row(self, trans, row):
+        sortable = parse_transaction_date(trans['date'])
+        date = f"{sortable[:4]}-{sortable[4:6]}-{sortable[6:8]}"
+        groups = [('months', date[:7])]
+        if trans.get('_statement'):
+            groups.append(('statements', trans['_statement']))
+        
+        if self.total is None:
+            self.total = SummaryGroup(None)
+        self.total.add(date, row)
+        for kind, key in groups:
+            group = self.groups[kind].get(key)
+            if group is None:
+                group = self.groups[kind][key] = SummaryGroup(None)
+            group.add(date, row)
+        for period, opening in self.balances.add(row, [('total', None)] + groups):
+            group = self.total if period[0] == 'total' else self.groups[period[0]][period[1]]
+            group.opening_balance = opening
+    
+    def to_dict(self):
+        return {
+            'version': 1,
+            'csv': self.csv_name,
+            'total': (self.total or SummaryGroup(None)).to_dict(),
+            'months': {key: group.to_dict() for key, group in self.groups['months'].items()},
+            'statements': {key: group.to_dict() for key, group in self.groups['statements'].items()},
+        }
+
+# ============================================================================
+# ACCOUNTS - Keep statements for different accounts apart
+# ============================================================================
+
+SORT_CODE_PATTERN = re.compile(r'Sort\s*code\s*:?\s*(\d{2}-\d{2}-\d{2})', re.IGNORECASE)
+ACCOUNT_NUMBER_PATTERN = re.compile(r'Account\s*(?:number|no\.?)\s*:?\s*(\d{8})\b', re.IGNORECASE)
+
+def detect_account(page_text):
+    """Return 'sortcode accountnumber' (e.g. '40-11-62 12345678') from a statement header, or None"""
+    if not page_text:
+        return None
+    sort_code = SORT_CODE_PATTERN.search(page_text)
+    account_number = ACCOUNT_NUMBER_PATTERN.search(page_text)
+    if not sort_code and not account_number:
+        return None
+    return ' '.join(m.group(1) for m in (sort_code, account_number) if m)
+
+def _tag_page(transactions, page_num):
+    """Record the page transactions came from (used to re-extract pages that don't reconcile)"""
+    for trans in transactions:
+        trans['_page'] = page_num
+
+def _tag_statement(transactions, name):
+    """Record the statement (PDF file name) transactions came from, for the period index"""
+    for trans in transactions:
+        trans.setdefault('_statement', name)
+
+def _tag_account(transactions, account):
+    """Record which account transactions belong to (kept through merging as '_account')"""
+    if account:
+        for trans in transactions:
+            trans.setdefault('_account', account)
+
+class AccountTagger:
+    """
+    Tag one statement's pages with its account as they are read.
+    
+    Rows from pages before the header that names the account are held on to
+    and tagged as soon as it turns up, so a statement is never split between
+    its account and "unknown".
+    """
+    
+    def __init__(self):
+        self.account = None
+        self.untagged = []
     
-    print(f"✅ Successfully exported {len(filtered_transactions)} transactions to {output_file}")
-    return output_file
+    def tag(self, transactions, page_text):
+        if self.account is None:
+            self.account = detect_account(page_text)
+            if self.account is None:
+                self.untagged.extend(transactions)
+                return
+            _tag_account(self.untagged, self.account)
+            self.untagged = []
+        _tag_account(transactions, self.account)
+
+def partition_by_account(transactions):
+    """Split transactions into {account: [transactions]} keeping PDF order (None = not detected)"""
+    partitions = {}
+    for trans in transactions:
+        partitions.setdefault(trans.get('_account'), []).append(trans)
+    return partitions
+
+def finalize_combined_transactions(transactions, log=print, stats=None):
+    """Merge split lines, classify IN/OUT and fill balances for one account's combined transactions"""
+    transactions = merge_split_transactions(transactions, log, stats)
+    working_balances = calculate_working_balances(transactions)
+    transactions = determine_debit_credit(transactions, working_balances)
+    fill_missing_balances(transactions, log, stats)
+    return transactions
+
+def _finalize_partition(transactions, log=_silent):
+    """Finalize one partition with its own stats (worker entry point for finalize_partitions)"""
+    stats = Counter()
+    return finalize_combined_transactions(transactions, log, stats), stats
 
-def process_pdf(pdf_path, output_dir, export=True):
+def finalize_partitions(partitions, log=print, workers=None, stats=None):
+    """
+    Run finalize_combined_transactions on every account partition.
+    
+    Partitions are independent, so with more than one (and workers != 1) they are
+    processed in parallel worker processes. Returns {account: transactions}; pass
+    a dict as stats to collect {account: Counter} of each partition's merge counters.
+    """
+    if len(partitions) <= 1 or workers == 1:
+        results = [_finalize_partition(transactions, log) for transactions in partitions.values()]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_finalize_partition, partitions.values()))
+    
+    finalized = {}
+    for account, (transactions, partition_stats) in zip(partitions.keys(), results):
+        finalized[account] = transactions
+        if stats is not None:
+            stats.setdefault(account, Counter()).update(partition_stats)
+    return finalized
+
+def parse_transaction_date(date_str):
+    """Convert '21 Mar 22' to datetime-sortable format"""
+    months = {
+        'Jan': '01', 'Feb': '02', 'Mar': '03', 'Apr': '04',
+        'May': '05', 'Jun': '06', 'Jul': '07', 'Aug': '08',
+        'Sep': '09', 'Oct': '10', 'Nov': '11', 'Dec': '12'
+    }
+    parts = date_str.split()
+    if len(parts) == 3:
+        day, month_name, year = parts
+        month = months.get(month_name, '00')
+        full_year = f"20{year}"  # Assume 20xx for years
+        return f"{full_year}{month}{day.zfill(2)}"  # YYYYMMDD format for sorting
+    return date_str
+
+def combined_output_filename(transactions, account=None):
+    """
+    Build All_Transactions_YYYY-MM-DD_to_YYYY-MM-DD.csv from the first and last transaction dates
+    
+    With an account the name becomes All_Transactions_<sortcode>_<account>_<from>_to_<to>.csv.
+    """
+    first_sortable = parse_transaction_date(transactions[0]['date'])
+    last_sortable = parse_transaction_date(transactions[-1]['date'])
+    
+    # Format for filename: YYYY-MM-DD
+    first_formatted = f"{first_sortable[:4]}-{first_sortable[4:6]}-{first_sortable[6:8]}"
+    last_formatted = f"{last_sortable[:4]}-{last_sortable[4:6]}-{last_sortable[6:8]}"
+    
+    account_part = f"{account.replace(' ', '_')}_" if account else ''
+    return f"All_Transactions_{account_part}{first_formatted}_to_{last_formatted}.csv"
+
+CSV_FIELDNAMES = ['Date', 'Payment type', 'Details', '£Paid out', '£Paid in', '£Balance']
+
+def filter_transactions(transactions, log=print, stats=None, normalizer=None):
+    """Drop duplicate fee lines and Visa Rate info lines that are not real transactions"""
+    normalizer = normalizer or _default_normalizer
+    filtered_transactions = []
+    excluded_count = 0
+    visa_rate_count = 0
+    
+    for trans in transactions:
+        normalized = normalizer.normalize(trans['description'])
+        
+        if normalized.excluded == 'duplicate_fee':
+            excluded_count += 1
+            log(f"  ⏭️  Excluding duplicate fee: {trans['date']} | {normalized.details}")
+            continue
+        
+        if normalized.excluded == 'visa_rate':
+            visa_rate_count += 1
+            log(f"  ⏭️  Excluding Visa Rate info line: {trans['date']} | {normalized.details}")
+            continue
+        
+        filtered_transactions.append(trans)
+    
+    if excluded_count > 0:
+        log(f"  ℹ️  Excluded {excluded_count} duplicate bank fee transaction(s)")
+    if visa_rate_count > 0:
+        log(f"  ℹ️  Excluded {visa_rate_count} Visa Rate info line(s)")
+    if stats is not None:
+        stats['duplicate_fees_excluded'] += excluded_count
+        stats['visa_rate_excluded'] += visa_rate_count
+    
+    return filtered_transactions
+
+def csv_row(trans, normalizer=None):
+    """Map a classified transaction to the 6 output columns"""
+    normalized = (normalizer or _default_normalizer).normalize(trans['description'])
+    
+    return {
+        'Date': trans['date'].replace(' ', '-'),  # Convert "21 Mar 22" to "21-Mar-22"
+        'Payment type': normalized.payment_type,
+        'Details': normalized.details,
+        '£Paid out': trans.get('paid_out', ''),
+        '£Paid in': trans.get('paid_in', ''),
+        '£Balance': trans['balance']
+    }
+
+def write_csv(transactions, csvfile, normalizer=None):
+    """Write already-filtered transactions as CSV rows to an open text file"""
+    writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES)
+    
+    writer.writeheader()
+    for trans in transactions:
+        writer.writerow(csv_row(trans, normalizer))
+
+def _temp_path(path):
+    """A temporary name next to path that no other process or thread writing path uses"""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+class OutputSink(ABC):
+    """
+    Buffered writer for one output format.
+    
+    Rows go to a temporary file next to the target, which only replaces the
+    target in commit() (after close()), so a crash never leaves a half-written
+    statement behind.
+    """
+    extension = None
+    encoding = 'utf-8'
+    
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = _temp_path(path)
+        self.file = open(self.tmp_path, 'w', newline='', encoding=self.encoding, errors='replace',
+                         buffering=1 << 16)
+    
+    @abstractmethod
+    def write(self, trans, row):
+        """Add one filtered transaction and its CSV row"""
+    
+    def finish(self):
+        """Write anything that has to come after the rows"""
+        pass
+    
+    def close(self):
+        self.finish()
+        self.file.close()
+    
+    def commit(self):
+        os.replace(self.tmp_path, self.path)
+        return self.path
+    
+    def abort(self):
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+class CsvSink(OutputSink):
+    """
+    The 6-column CSV (same output as write_csv).
+    
+    With period_index, every row is measured as it is written and a
+    PeriodIndexBuilder sidecar is saved next to the CSV (see read_period).
+    """
+    extension = '.csv'
+    
+    def __init__(self, path, period_index=False):
+        super().__init__(path)
+        self.index = None
+        if period_index:
+            self.index = PeriodIndexBuilder(os.path.basename(path))
+            self.line = io.StringIO(newline='')
+            self.writer = csv.DictWriter(self.line, fieldnames=CSV_FIELDNAMES)
+        else:
+            self.writer = csv.DictWriter(self.file, fieldnames=CSV_FIELDNAMES)
+        self.writer.writeheader()
+        if self.index is not None:
+            self.index.add_header(self._flush_line())
+    
+    def _flush_line(self):
+        """Write the buffered row and return its size in bytes"""
+        text = self.line.getvalue()
+        self.line.seek(0)
+        self.line.truncate()
+        self.file.write(text)
+        return len(text.encode('utf-8'))
+    
+    def write(self, trans, row):
+        self.writer.writerow(row)
+        if self.index is not None:
+            self.index.add_row(trans, row, self._flush_line())
+    
+    def close(self):
+        super().close()
+        if self.index is not None:
+            self.index_tmp_path = _temp_path(period_index_path(self.path))
+            with open(self.index_tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.index.to_dict(), f, separators=(',', ':'))
+    
+    def commit(self):
+        super().commit()
+        if self.index is not None:
+            os.replace(self.index_tmp_path, period_index_path(self.path))
+        return self.path
+    
+    def abort(self):
+        super().abort()
+        tmp_path = getattr(self, 'index_tmp_path', None)
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _iso_date(date_str):
+    sortable = parse_transaction_date(date_str)
+    return f"{sortable[:4]}-{sortable[4:6]}-{sortable[6:8]}"
+
+def _signed_amount(row):
+    """Paid out as a negative amount string, paid in as a positive one"""
+    if row['£Paid out']:
+        return f"-{row['£Paid out']}"
+    return row['£Paid in'] or '0.00'
+
+class JsonLinesSink(OutputSink):
+    """One JSON object per transaction, with ISO dates and numeric amounts"""
+    extension = '.jsonl'
+    
+    def write(self, trans, row):
+        record = {
+            'date': _iso_date(trans['date']),
+            'payment_type': row['Payment type'],
+            'details': row['Details'],
+            'paid_out': float(row['£Paid out']) if row['£Paid out'] else None,
+            'paid_in': float(row['£Paid in']) if row['£Paid in'] else None,
+            'balance': float(row['£Balance']) if row['£Balance'] else None,
+            'account': trans.get('_account'),
+        }
+        self.file.write(json.dumps(record, ensure_ascii=False))
+        self.file.write('\n')
+
+class QifSink(OutputSink):
+    """Quicken Interchange Format bank register (UK day-first dates)"""
+    extension = '.qif'
+    
+    def __init__(self, path):
+        super().__init__(path)
+        self.file.write('!Type:Bank\n')
+    
+    def write(self, trans, row):
+        sortable = parse_transaction_date(trans['date'])
+        self.file.write(f"D{sortable[6:8]}/{sortable[4:6]}/{sortable[:4]}\n")
+        self.file.write(f"T{_signed_amount(row)}\n")
+        self.file.write(f"P{row['Details']}\n")
+        self.file.write(f"M{row['Payment type']}\n")
+        self.file.write('^\n')
+
+class OfxSink(OutputSink):
+    """
+    OFX 1.0.2 bank statement.
+    
+    The statement header needs the date range, so transactions are collected in
+    memory and the whole document is written in finish(). FITIDs are derived from
+    the transaction itself, so re-exporting the same statement gives the same IDs
+    and accounting tools skip what they already imported.
+    """
+    extension = '.ofx'
+    encoding = 'cp1252'  # What the header declares; OFX 1.x SGML has no UTF-8
+    
+    def __init__(self, path):
+        super().__init__(path)
+        self.entries = []
+        self.seen = Counter()
+        self.account = None
+        self.first_date = self.last_date = None
+        self.closing_balance = None
+    
+    def write(self, trans, row):
+        posted = parse_transaction_date(trans['date'])
+        amount = _signed_amount(row)
+        key = f"{posted}|{amount}|{row['£Balance']}|{row['Details']}"
+        self.seen[key] += 1
+        fitid = hashlib.sha1(f"{key}|{self.seen[key]}".encode('utf-8')).hexdigest()[:16]
+        self.entries.append(
+            "<STMTTRN>\n"
+            f"<TRNTYPE>{'DEBIT' if amount.startswith('-') else 'CREDIT'}\n"
+            f"<DTPOSTED>{posted}\n"
+            f"<TRNAMT>{amount}\n"
+            f"<FITID>{fitid}\n"
+            f"<NAME>{_ofx_text(row['Details'][:32])}\n"
+            f"<MEMO>{_ofx_text(row['Payment type'])}\n"
+            "</STMTTRN>\n"
+        )
+        self.account = self.account or trans.get('_account')
+        self.first_date = min(self.first_date or posted, posted)
+        self.last_date = max(self.last_date or posted, posted)
+        if row['£Balance']:
+            self.closing_balance = row['£Balance']
+    
+    def finish(self):
+        sort_code, _, account_number = (self.account or '').partition(' ')
+        self.file.write(
+            "OFXHEADER:100\nDATA:OFXSGML\nVERSION:102\nSECURITY:NONE\n"
+            "ENCODING:USASCII\nCHARSET:1252\nCOMPRESSION:NONE\nOLDFILEUID:NONE\nNEWFILEUID:NONE\n\n"
+            "<OFX>\n<BANKMSGSRSV1>\n<STMTTRNRS>\n<TRNUID>1\n"
+            "<STATUS>\n<CODE>0\n<SEVERITY>INFO\n</STATUS>\n"
+            "<STMTRS>\n<CURDEF>GBP\n"
+            f"<BANKACCTFROM>\n<BANKID>{sort_code.replace('-', '')}\n"
+            f"<ACCTID>{account_number or 'UNKNOWN'}\n<ACCTTYPE>CHECKING\n</BANKACCTFROM>\n"
+            f"<BANKTRANLIST>\n<DTSTART>{self.first_date or ''}\n<DTEND>{self.last_date or ''}\n"
+        )
+        self.file.writelines(self.entries)
+        self.file.write("</BANKTRANLIST>\n")
+        if self.closing_balance is not None:
+            self.file.write(f"<LEDGERBAL>\n<BALAMT>{self.closing_balance}\n<DTASOF>{self.last_date}\n</LEDGERBAL>\n")
+        self.file.write("</STMTRS>\n</STMTTRNRS>\n</BANKMSGSRSV1>\n</OFX>\n")
+
+def _ofx_text(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+class SummarySink(OutputSink):
+    """Monthly, per-statement and payment-type totals (see SummaryBuilder) as JSON"""
+    extension = '.summary.json'
+    
+    def __init__(self, path):
+        super().__init__(path)
+        csv_name = os.path.basename(path)[:-len(self.extension)] + '.csv'
+        self.summary = SummaryBuilder(csv_name)
+    
+    def write(self, trans, row):
+        self.summary.add_row(trans, row)
+    
+    def finish(self):
+        json.dump(self.summary.to_dict(), self.file, indent=2, ensure_ascii=False)
+        self.file.write('\n')
+
+OUTPUT_SINKS = {
+    'csv': CsvSink,
+    'jsonl': JsonLinesSink,
+    'ofx': OfxSink,
+    'qif': QifSink,
+    'summary': SummarySink,
+}
+
+def export_transactions(transactions, output_file, formats, log=print, stats=None, normalizer=None,
+                        period_index=False):
+    """
+    Write transactions in every requested format in one pass.
+    
+    Each transaction is filtered and normalized once and handed to all sinks.
+    CSV goes to output_file, other formats to the same name with their own
+    extension. No file is replaced unless every format was written successfully.
+    period_index=True also writes the CSV's period index.
+    
+    Returns {format: path}.
+    """
+    if not formats:
+        raise ValueError(f"No output formats given (use {', '.join(OUTPUT_SINKS)})")
+    unknown = [fmt for fmt in formats if fmt not in OUTPUT_SINKS]
+    if unknown:
+        raise ValueError(f"Unknown output format(s): {', '.join(unknown)} (use {', '.join(OUTPUT_SINKS)})")
+    
+    base = os.path.splitext(output_file)[0]
+    paths = {fmt: output_file if fmt == 'csv' else base + OUTPUT_SINKS[fmt].extension
+             for fmt in formats}
+    log(f"\n💾 Exporting to {', '.join(paths.values())}...")
+    started = time.perf_counter()
+    
+    # Filter out duplicate and unwanted entries
+    filtered_transactions = filter_transactions(transactions, log, stats, normalizer)
+    
+    sinks = []
+    try:
+        for fmt in formats:
+            if fmt == 'csv':
+                sinks.append(OUTPUT_SINKS[fmt](paths[fmt], period_index))
+            else:
+                sinks.append(OUTPUT_SINKS[fmt](paths[fmt]))
+        for trans in filtered_transactions:
+            row = csv_row(trans, normalizer)
+            for sink in sinks:
+                sink.write(trans, row)
+        for sink in sinks:
+            sink.close()
+    except BaseException:
+        for sink in sinks:
+            sink.abort()
+        raise
+    for sink in sinks:
+        sink.commit()
+    if stats is not None:
+        stats['seconds_export'] += time.perf_counter() - started
+    
+    log(f"✅ Successfully exported {len(filtered_transactions)} transactions to {', '.join(paths.values())}")
+    return paths
+
+def export_to_csv(transactions, output_file='statement_transactions.csv', log=print, stats=None,
+                  period_index=PERIOD_INDEX):
+    """Export transactions to CSV with all 6 required fields (and the period index if enabled)"""
+    return export_transactions(transactions, output_file, ['csv'], log, stats,
+                               period_index=period_index)['csv']
+
+# ============================================================================
+# PARTITIONED OUTPUT - year=YYYY/month=MM folders, rewritten only when they change
+# ============================================================================
+
+PARTITION_MANIFEST = "_manifest.json"
+
+def partition_by_month(transactions):
+    """Split transactions into {(year, month): transactions}, keeping their order"""
+    months = {}
+    for trans in transactions:
+        sortable = parse_transaction_date(trans['date'])
+        months.setdefault((sortable[:4], sortable[4:6]), []).append(trans)
+    return months
+
+def _partition_fingerprint(transactions, formats):
+    """Hash of everything that ends up in a partition's files"""
+    digest = hashlib.sha256(json.dumps(sorted(formats)).encode('utf-8'))
+    for trans in transactions:
+        digest.update(json.dumps([trans['date'], trans['description'], trans.get('paid_out', ''),
+                                  trans.get('paid_in', ''), trans['balance'],
+                                  trans.get('_statement')]).encode('utf-8'))
+    return digest.hexdigest()
+
+def _load_partition_manifest(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'partitions': {}}
+
+def _remove_partition(root, relative_csv, formats):
+    """Delete a partition file with its other formats and index, and its folders once empty"""
+    csv_path = os.path.join(root, relative_csv)
+    base = os.path.splitext(csv_path)[0]
+    paths = [csv_path, period_index_path(csv_path)]
+    paths += [base + OUTPUT_SINKS[fmt].extension for fmt in formats if fmt in OUTPUT_SINKS and fmt != 'csv']
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    folder = os.path.dirname(csv_path)
+    while folder != root and os.path.isdir(folder) and not os.listdir(folder):
+        os.rmdir(folder)
+        folder = os.path.dirname(folder)
+
+def write_partitioned(partitions, root, formats, log=print, stats=None, normalizer=None, prune=False,
+                      period_index=False):
+    """
+    Write classified transactions as root/year=YYYY/month=MM/<account>.csv (plus
+    the other formats), one file per account and month.
+    
+    partitions is {account: transactions} as returned by finalize_partitions.
+    A manifest in root keeps a fingerprint and the source statements of every
+    partition, so a month whose transactions didn't change since the last run
+    is left untouched.
+    
+    A published partition is only rewritten or removed when every statement it
+    came from was read again in this run; months from statements that are
+    missing now (archived PDFs, a PDF that failed or was skipped) are kept as
+    they are. prune=True removes partitions this run has no transactions for.
+    period_index=True also writes each CSV's period index.
+    
+    Returns {'written': [...], 'unchanged': [...], 'kept': [...], 'removed': [...]}
+    of CSV paths relative to root.
+    """
+    if not formats:
+        raise ValueError(f"No output formats given (use {', '.join(OUTPUT_SINKS)})")
+    formats = list(formats)
+    os.makedirs(root, exist_ok=True)
+    manifest_path = os.path.join(root, PARTITION_MANIFEST)
+    previous = _load_partition_manifest(manifest_path)
+    previous_formats = previous.get('formats', formats)
+    
+    read_statements = {trans['_statement'] for transactions in partitions.values()
+                       for trans in transactions if trans.get('_statement')}
+    
+    def fully_read(entry):
+        """True if this run re-read every statement a published partition came from"""
+        return prune or set(entry.get('statements') or ()) <= read_statements
+    
+    entries = {}
+    jobs = []
+    kept = []
+    for account, transactions in partitions.items():
+        filename = f"{account.replace(' ', '_')}.csv" if account else "transactions.csv"
+        for (year, month), month_transactions in partition_by_month(transactions).items():
+            relative = '/'.join((f"year={year}", f"month={month}", filename))
+            old = previous['partitions'].get(relative)
+            if old and not fully_read(old):
+                # Rewriting would drop the rows of the statements that weren't read
+                entries[relative] = old
+                kept.append(relative)
+                continue
+            fingerprint = _partition_fingerprint(month_transactions, formats)
+            entries[relative] = {
+                'fingerprint': fingerprint,
+                'rows': len(month_transactions),
+                'statements': sorted({t['_statement'] for t in month_transactions if t.get('_statement')}),
+            }
+            if old and old['fingerprint'] == fingerprint and os.path.exists(os.path.join(root, relative)):
+                continue
+            jobs.append((relative, month_transactions))
+    
+    removed = []
+    for relative, old in previous['partitions'].items():
+        if relative in entries:
+            continue
+        if fully_read(old):
+            _remove_partition(root, relative, previous_formats)
+            removed.append(relative)
+        else:
+            entries[relative] = old
+            kept.append(relative)
+    if kept:
+        log(f"⚠️  Keeping {len(kept)} published partition(s) whose statements were not all read this run")
+    
+    # Written one after another: formatting rows is CPU-bound, so threads don't help (GIL),
+    # and pickling each month's rows to a worker process cost more than it saved when measured
+    log(f"\n💾 Writing {len(jobs)} of {len(entries)} month partition(s) to {root}...")
+    started = time.perf_counter()
+    export_stats = Counter()
+    for relative, month_transactions in jobs:
+        output_path = os.path.join(root, *relative.split('/'))
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        export_transactions(month_transactions, output_path, formats, _silent, export_stats, normalizer,
+                            period_index)
+    if stats is not None:
+        stats.update({key: value for key, value in export_stats.items() if key != 'seconds_export'})
+        stats['seconds_export'] += time.perf_counter() - started
+        stats['partitions_written'] += len(jobs)
+        stats['partitions_unchanged'] += len(entries) - len(jobs) - len(kept)
+    
+    # Written last, so an interrupted run rewrites its partitions next time
+    tmp_path = _temp_path(manifest_path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': 1, 'formats': formats, 'partitions': entries}, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    
+    written = [relative for relative, _ in jobs]
+    skipped = set(written) | set(kept)
+    unchanged = [relative for relative in entries if relative not in skipped]
+    log(f"✅ {len(written)} written, {len(unchanged)} unchanged, {len(kept)} kept, {len(removed)} removed")
+    return {'written': written, 'unchanged': unchanged, 'kept': kept, 'removed': removed}
+
+def iter_page_transactions(pages, log=print, stats=None):
+    """
+    Parse (page_num, text) pairs lazily, yielding (page_num, transactions) per page.
+    
+    The last seen date is carried from one page to the next, exactly as in parse_pdf_pages.
+    Rows from pages before the account header are tagged (in place) once it is read.
+    """
+    last_date = None
+    accounts = AccountTagger()
+    for page_num, page_text in pages:
+        started = time.perf_counter()
+        page_transactions, last_date = parse_page_transactions(page_text, page_num, last_date, log, stats)
+        _tag_page(page_transactions, page_num)
+        accounts.tag(page_transactions, page_text)
+        if stats is not None:
+            stats['seconds_parse'] += time.perf_counter() - started
+            stats['transactions'] += len(page_transactions)
+        yield page_num, page_transactions
+
+def parse_pdf_pages(pages, log=print, stats=None):
+    """Parse every page's text in order, carrying the last seen date across pages"""
+    all_transactions = []
+    for _, page_transactions in iter_page_transactions(enumerate(pages, 1), log, stats):
+        all_transactions.extend(page_transactions)
+    return all_transactions
+
+def process_pdf(pdf_path, output_dir, export=True, log=print, stats=None, mode=None, metrics=None):
     """
     Process a single PDF file and create CSV output.
     
@@ -643,47 +2612,77 @@ def process_pdf(pdf_path, output_dir, export=True):
         pdf_path: Path to the PDF file
         output_dir: Directory for CSV output
         export: If True, export to CSV immediately. If False, return transactions for later export.
+        log: Callable used for progress output (print by default)
+        stats: Optional Counter that receives pipeline counters
+        mode: Extraction mode, 'text' or 'layout' (EXTRACTION_MODE if None)
+        metrics: Optional metrics.Metrics that records this PDF's counters and stage timings
     """
-    print("\n" + "="*70)
-    print(f"  Processing: {os.path.basename(pdf_path)}")
-    print("="*70)
-    
-    print("\n📋 STEP 1: Reading PDF...")
-    pages = extract_pdf_text(pdf_path)
+    # Count this PDF on its own so metrics see per-PDF timings, then add it to stats
+    pdf_stats = Counter()
+    started = time.perf_counter()
+    try:
+        with _traced(pdf_stats, 'pdf'):
+            result = _process_pdf(pdf_path, output_dir, export, log, pdf_stats, mode)
+    except Exception:
+        pdf_stats['errors'] += 1
+        raise
+    finally:
+        pdf_stats['seconds_pdf'] += time.perf_counter() - started
+        if stats is not None:
+            stats.update(pdf_stats)
+        if metrics is not None:
+            metrics.record(pdf_stats)
+    return result
+
+def _process_pdf(pdf_path, output_dir, export, log, stats, mode):
+    log("\n" + "="*70)
+    log(f"  Processing: {os.path.basename(pdf_path)}")
+    log("="*70)
     
-    print("\n📋 STEP 2: Processing pages...")
+    log("\n📋 STEP 1-2: Reading PDF and processing pages...")
     all_transactions = []
-    last_date = None
+    page_count = 0
+    pages = iter_statement_pages(pdf_path, mode, log, stats, PAGE_TIMEOUT, PAGE_MEMORY_LIMIT_MB)
+    with _traced(stats, 'read_pages'):
+        for page_count, page_transactions in pages:
+            all_transactions.extend(page_transactions)
+    stats['pdfs'] += 1
     
-    for page_num, page_text in enumerate(pages, 1):
-        page_transactions, last_date = parse_page_transactions(page_text, page_num, last_date)
-        all_transactions.extend(page_transactions)
+    log("\n" + "="*70)
+    log(f"✅ Found {len(all_transactions)} transactions across {page_count} pages")
+    log("="*70)
     
-    print("\n" + "="*70)
-    print(f"✅ Found {len(all_transactions)} transactions across {len(pages)} pages")
-    print("="*70)
+    # Re-read pages whose balances don't chain (under the same limits as the first read)
+    if RECONCILE_PAGES:
+        with _traced(stats, 'reconcile'):
+            all_transactions = reconcile_pages(pdf_path, all_transactions, mode, log, stats,
+                                               PAGE_TIMEOUT, PAGE_MEMORY_LIMIT_MB)
+    _tag_statement(all_transactions, os.path.basename(pdf_path))
     
     # Merge split transactions (only if exporting individually, not in combined mode)
     if export:
-        print("\n📋 Merging split transactions...")
-        all_transactions = merge_split_transactions(all_transactions)
-        print(f"✅ After merging: {len(all_transactions)} transactions")
+        log("\n📋 Merging split transactions...")
+        with _traced(stats, 'merge'):
+            all_transactions = merge_split_transactions(all_transactions, log, stats)
+        log(f"✅ After merging: {len(all_transactions)} transactions")
     
     # Calculate working balances for determining IN/OUT (without modifying balance field)
-    print("\n📋 Calculating balances for debit/credit determination...")
-    working_balances = calculate_working_balances(all_transactions)
-    
-    print("\n📋 STEP 3: Determining debits vs credits...")
-    all_transactions = determine_debit_credit(all_transactions, working_balances)
+    log("\n📋 Calculating balances for debit/credit determination...")
+    started = time.perf_counter()
+    with _traced(stats, 'classify'):
+        working_balances = calculate_working_balances(all_transactions)
+        
+        log("\n📋 STEP 3: Determining debits vs credits...")
+        all_transactions = determine_debit_credit(all_transactions, working_balances)
+    stats['seconds_classify'] += time.perf_counter() - started
     
     # Show summary
-    print("\n📊 Sample transactions (first 5):")
+    log("\n📊 Sample transactions (first 5):")
     for trans in all_transactions[:5]:
-        payment_type = extract_payment_type(trans['description'])
-        clean_desc = clean_description(trans['description'])
+        normalized = _default_normalizer.normalize(trans['description'])
         paid_out = trans.get('paid_out', '')
         paid_in = trans.get('paid_in', '')
-        print(f"  • {trans['date']} | {payment_type:15} | {clean_desc[:30]:<30} | Out:£{paid_out if paid_out else '-':<8} | In:£{paid_in if paid_in else '-':<8}")
+        log(f"  • {trans['date']} | {normalized.payment_type:15} | {normalized.details[:30]:<30} | Out:£{paid_out if paid_out else '-':<8} | In:£{paid_in if paid_in else '-':<8}")
     
     # Export to CSV or return transactions
     if export:
@@ -691,17 +2690,323 @@ def process_pdf(pdf_path, output_dir, export=True):
         pdf_basename = os.path.splitext(os.path.basename(pdf_path))[0]
         output_filename = f"{pdf_basename}_transactions.csv"
         output_path = os.path.join(output_dir, output_filename)
-        csv_file = export_to_csv(all_transactions, output_file=output_path)
+        with _traced(stats, 'export'):
+            paths = export_transactions(all_transactions, output_path, OUTPUT_FORMATS, log, stats,
+                                        period_index=PERIOD_INDEX)
+        csv_file = paths.get('csv') or next(iter(paths.values()))
         
-        print("\n" + "="*70)
-        print(f"🎉 DONE! Your transactions are in {csv_file}")
-        print("="*70)
+        log("\n" + "="*70)
+        log(f"🎉 DONE! Your transactions are in {csv_file}")
+        log("="*70)
     else:
         # Return transactions for combined export
         return all_transactions
     
     return csv_file
 
+# ============================================================================
+# LIBRARY API - Reentrant converter for embedding in other programs
+# ============================================================================
+
+@dataclass
+class ConversionResult:
+    """Classified transactions for one statement (or a combined set) plus pipeline counters"""
+    name: str
+    transactions: list
+    stats: dict = field(default_factory=dict)
+    normalizer: DescriptionNormalizer = field(default=None, repr=False, compare=False)
+    
+    @property
+    def filename(self):
+        """CSV filename the command-line script would use for this result"""
+        if self.name.startswith('All_Transactions_'):
+            return self.name
+        return f"{os.path.splitext(self.name)[0]}_transactions.csv"
+    
+    def rows(self):
+        """Transactions that make it into the CSV (duplicate fees and Visa Rate lines removed)"""
+        return filter_transactions(self.transactions, _silent, normalizer=self.normalizer)
+    
+    def to_csv(self):
+        """Render the CSV output as a string"""
+        buffer = io.StringIO(newline='')
+        write_csv(self.rows(), buffer, self.normalizer)
+        return buffer.getvalue()
+    
+    def to_dict(self):
+        """JSON-friendly form: name, counters and the CSV rows as dicts"""
+        return {
+            'name': self.name,
+            'stats': self.stats,
+            'transactions': [csv_row(trans, self.normalizer) for trans in self.rows()],
+        }
+
+class Converter:
+    """
+    Reentrant HSBC statement converter.
+    
+    Unlike the script entry point this keeps all configuration on the instance,
+    never prints and never writes files unless asked to, so one instance can be
+    shared by a thread pool or several can run side by side in one process.
+    
+    Args:
+        output_dir: Default directory used by write()
+        log: Optional callable receiving progress messages (silent by default)
+        payment_types: Payment code table (PAYMENT_TYPES by default)
+        mode: Extraction mode, 'text' or 'layout'
+        page_timeout: Seconds allowed per page; extracts pages in a supervised worker
+            process when set (text mode)
+        page_memory_limit_mb: Memory cap for that worker process
+        partition_workers: Processes used by convert_by_account (1 = no extra processes)
+        reconcile: Re-extract pages whose balances don't chain
+        sniff: Check each source with sniff_pdf() first and raise ValueError for documents
+            that are not HSBC statements or need OCR
+        dedupe: Convert byte-identical sources only once in convert_combined and
+            convert_by_account (see dedupe_pdfs)
+        period_index: Write a period index next to every CSV (see read_period)
+    """
+    
+    def __init__(self, output_dir=None, log=None, payment_types=None, mode='text',
+                 page_timeout=None, page_memory_limit_mb=PAGE_MEMORY_LIMIT_MB, partition_workers=1, reconcile=True,
+                 sniff=False, dedupe=True, period_index=False):
+        self.output_dir = output_dir
+        self.log = log or _silent
+        self.mode = mode
+        self.page_timeout = page_timeout
+        self.page_memory_limit_mb = page_memory_limit_mb
+        self.partition_workers = partition_workers
+        self.reconcile = reconcile
+        self.sniff = sniff
+        self.dedupe = dedupe
+        self.period_index = period_index
+        if payment_types is None:
+            self.normalizer = _default_normalizer
+        else:
+            self.normalizer = DescriptionNormalizer(payment_types)
+    
+    def _check(self, source, stats):
+        """Per-document step before extraction: sniff the source when sniff is on"""
+        if not self.sniff:
+            return
+        started = time.perf_counter()
+        sniffed = sniff_pdf(source)
+        stats['seconds_sniff'] += time.perf_counter() - started
+        if sniffed.kind != 'hsbc':
+            action = "needs OCR" if sniffed.kind == 'ocr' else "is not an HSBC statement"
+            raise ValueError(f"{_source_name(source)} {action}: {sniffed.reason}")
+    
+    def _pages(self, source, stats):
+        return iter_statement_pages(source, self.mode, self.log, stats,
+                                    self.page_timeout, self.page_memory_limit_mb)
+    
+    def _complete(self, source, transactions, stats):
+        """Per-document step after extraction: reconcile broken pages and tag the statement"""
+        if self.reconcile:
+            transactions = reconcile_pages(source, transactions, self.mode, self.log, stats,
+                                           self.page_timeout, self.page_memory_limit_mb)
+        _tag_statement(transactions, _source_name(source))
+        stats['pdfs'] += 1
+        return transactions
+    
+    def _parse(self, source, stats):
+        self._check(source, stats)
+        transactions = []
+        for _, page_transactions in self._pages(source, stats):
+            transactions.extend(page_transactions)
+        return self._complete(source, transactions, stats)
+    
+    def convert(self, source, name=None):
+        """
+        Convert one statement.
+        
+        Args:
+            source: Path to a PDF, the PDF bytes or a binary file object
+            name: Name used for the result (defaults to the file name of a path source)
+        """
+        stats = Counter()
+        started = time.perf_counter()
+        transactions = self._parse(source, stats)
+        result = self.finalize(transactions, stats, name or _source_name(source))
+        result.stats['seconds_pdf'] = time.perf_counter() - started
+        return result
+    
+    def finalize(self, transactions, stats, name):
+        """Merge and classify one statement's parsed transactions into a result"""
+        transactions = merge_split_transactions(transactions, self.log, stats)
+        working_balances = calculate_working_balances(transactions)
+        transactions = determine_debit_credit(transactions, working_balances)
+        filter_transactions(transactions, _silent, stats, self.normalizer)
+        return ConversionResult(name, transactions, dict(stats), self.normalizer)
+    
+    def _unique(self, sources):
+        """(sources without byte-identical copies, [(skipped, kept)]) when dedupe is on"""
+        if not self.dedupe:
+            return list(sources), []
+        sources, duplicates = dedupe_pdfs(sources)
+        for duplicate, kept in duplicates:
+            self.log(f"⏭️  Skipping {_source_name(duplicate)} (same content as {_source_name(kept)})")
+        return sources, duplicates
+    
+    def convert_combined(self, sources):
+        """Convert several statements into one chronological result, like COMBINED_OUTPUT"""
+        stats = Counter()
+        sources, duplicates = self._unique(sources)
+        stats['duplicate_pdfs_skipped'] += len(duplicates)
+        transactions = []
+        for source in sources:
+            page_transactions = self._parse(source, stats)
+            working_balances = calculate_working_balances(page_transactions)
+            transactions.extend(determine_debit_credit(page_transactions, working_balances))
+        
+        transactions = finalize_combined_transactions(transactions, self.log, stats)
+        filter_transactions(transactions, _silent, stats, self.normalizer)
+        name = combined_output_filename(transactions) if transactions else 'All_Transactions.csv'
+        return ConversionResult(name, transactions, dict(stats), self.normalizer)
+    
+    def convert_by_account(self, sources):
+        """
+        Like convert_combined, but statements are grouped by the account (sort code and
+        account number) found in their headers, giving one result per account.
+        Each result's stats only count the statements of its own account.
+        """
+        sources, duplicates = self._unique(sources)
+        copies = Counter(id(kept) for _, kept in duplicates)
+        stats_by_account = {}
+        transactions = []
+        for source in sources:
+            stats = Counter()
+            stats['duplicate_pdfs_skipped'] += copies[id(source)]
+            page_transactions = self._parse(source, stats)
+            account = next((t['_account'] for t in page_transactions if t.get('_account')), None)
+            stats_by_account.setdefault(account, Counter()).update(stats)
+            working_balances = calculate_working_balances(page_transactions)
+            transactions.extend(determine_debit_credit(page_transactions, working_balances))
+        
+        partition_stats = {}
+        partitions = finalize_partitions(partition_by_account(transactions), self.log,
+                                         self.partition_workers, partition_stats)
+        results = []
+        for account, account_transactions in partitions.items():
+            account_stats = stats_by_account.get(account, Counter())
+            account_stats.update(partition_stats[account])
+            filter_transactions(account_transactions, _silent, account_stats, self.normalizer)
+            name = combined_output_filename(account_transactions, account or 'unknown-account')
+            results.append(ConversionResult(name, account_transactions, dict(account_stats), self.normalizer))
+        return results
+    
+    def write(self, result, output_dir=None):
+        """Write a result's CSV into output_dir (or the instance default) and return the path"""
+        return self.export(result, ['csv'], output_dir)['csv']
+    
+    def export(self, result, formats, output_dir=None):
+        """Write a result in several formats ('csv', 'jsonl', 'ofx', 'qif') in one pass; returns {format: path}"""
+        output_dir = output_dir or self.output_dir
+        if output_dir is None:
+            raise ValueError("No output directory given")
+        output_path = os.path.join(output_dir, result.filename)
+        return export_transactions(result.transactions, output_path, formats, _silent,
+                                   normalizer=result.normalizer, period_index=self.period_index)
+    
+    def write_partitioned(self, results, output_dir=None, formats=('csv',), prune=False):
+        """
+        Write results (e.g. from convert_by_account) as year=YYYY/month=MM/<account>.csv
+        under output_dir, rewriting only months that changed (see write_partitioned()).
+        """
+        output_dir = output_dir or self.output_dir
+        if output_dir is None:
+            raise ValueError("No output directory given")
+        partitions = {}
+        for result in results:
+            account = next((t['_account'] for t in result.transactions if t.get('_account')), None)
+            partitions.setdefault(account, []).extend(result.transactions)
+        return write_partitioned(partitions, output_dir, formats, self.log, normalizer=self.normalizer,
+                                 prune=prune, period_index=self.period_index)
+
+class AsyncConverter:
+    """
+    asyncio front end for Converter.
+    
+    Extraction and parsing run in a thread pool one page at a time, so the event
+    loop is never blocked and a cancelled task stops at the next page boundary.
+    At most max_concurrent documents are in flight at once; callers beyond that
+    wait their turn without holding a worker thread.
+    
+    Args:
+        max_concurrent: Documents converted at the same time
+        converter: Converter supplying configuration (a silent default if omitted)
+        executor: concurrent.futures executor to run pages on (a thread pool of
+            max_concurrent threads if omitted)
+    """
+    
+    def __init__(self, max_concurrent=4, converter=None, executor=None):
+        self.converter = converter or Converter()
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_concurrent,
+                                                       thread_name_prefix='s1-async')
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+    
+    async def _stream(self, source, stats):
+        """
+        Sniff the source (when the converter does), then yield (page_num, transactions)
+        per page, advancing the parser off the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.converter._check, source, stats)
+        pages = self.converter._pages(source, stats)
+        future = None
+        try:
+            while True:
+                future = self.executor.submit(next, pages, None)
+                item = await asyncio.wrap_future(future)
+                if item is None:
+                    break
+                yield item
+        finally:
+            # Close the generator (and the PDF) once no worker is still advancing it
+            if future is None:
+                pages.close()
+            else:
+                future.add_done_callback(lambda _: pages.close())
+    
+    async def iter_pages(self, source):
+        """
+        Async iterator of (page_num, transactions) as each page is parsed.
+        
+        Transactions are as parsed from the page and tagged with the statement name:
+        split lines are not merged, pages are not reconciled and paid in/out is not
+        classified yet, since all of that needs the whole statement.
+        """
+        async with self._semaphore:
+            stats = Counter()
+            stats['pdfs'] += 1
+            name = _source_name(source)
+            async for page_num, page_transactions in self._stream(source, stats):
+                _tag_statement(page_transactions, name)
+                yield page_num, page_transactions
+    
+    async def convert(self, source, name=None):
+        """Convert one statement without blocking the event loop (see Converter.convert)"""
+        async with self._semaphore:
+            stats = Counter()
+            transactions = []
+            async for _, page_transactions in self._stream(source, stats):
+                transactions.extend(page_transactions)
+            
+            loop = asyncio.get_running_loop()
+            transactions = await loop.run_in_executor(self.executor, self.converter._complete,
+                                                      source, transactions, stats)
+            return await loop.run_in_executor(self.executor, self.converter.finalize,
+                                              transactions, stats, name or _source_name(source))
+    
+    def close(self):
+        """Shut down the page executor"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def _source_name(source):
+    """Best-effort display name for a path, bytes or file-object source"""
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.basename(source)
+    return os.path.basename(getattr(source, 'name', '')) or 'statement.pdf'
+
 if __name__ == "__main__":
     print("="*70)
     print("  HSBC BANK STATEMENT TO CSV CONVERTER")
@@ -763,6 +3068,75 @@ if __name__ == "__main__":
     for pdf in pdf_files:
         print(f"   - {pdf.name}")
     
+    metrics = None
+    if METRICS_FILE or METRICS_PORT:
+        from metrics import Metrics
+        metrics = Metrics()
+        if METRICS_PORT:
+            metrics.serve(METRICS_PORT)
+            print(f"📈 Metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+    
+    def publish_metrics():
+        if metrics is not None and METRICS_FILE:
+            metrics.write_textfile(METRICS_FILE)
+    
+    profiler = None
+    if PROFILE or '--profile' in sys.argv[1:]:
+        from profiling import Profiler
+        profiler = Profiler(str(Path(PROFILE_DIRECTORY).resolve()))
+        print(f"🔬 Profiling each PDF into {profiler.directory} (slower than a normal run)")
+    
+    def profiled(name):
+        """Profile a block when profiling is on; yields the stats Counter to fill (or None)"""
+        return profiler.profile(name) if profiler is not None else nullcontext()
+    
+    # Process each distinct document once, however many copies the folder has
+    if DEDUPE_PDFS:
+        pdf_files, duplicates = dedupe_pdfs(pdf_files)
+        if duplicates:
+            print(f"\n🧬 Skipping {len(duplicates)} duplicate PDF(s):")
+            for duplicate, kept in duplicates:
+                print(f"   ⏭️  {duplicate.name} (same content as {kept.name})")
+            if metrics is not None:
+                metrics.increment('duplicate_pdfs_skipped', len(duplicates))
+    
+    # Route each PDF on its first page: parse HSBC statements, skip the rest, list scans for OCR
+    if SNIFF_PDFS:
+        print(f"\n🔎 Checking which PDFs are HSBC statements...")
+        statements, needs_ocr, sniff_stats = [], [], Counter()
+        for pdf in pdf_files:
+            started = time.perf_counter()
+            sniffed = sniff_pdf(str(pdf))
+            if metrics is not None:
+                metrics.observe('sniff', time.perf_counter() - started)
+            if sniffed.kind == 'hsbc':
+                statements.append(pdf)
+                continue
+            if sniffed.kind == 'ocr':
+                needs_ocr.append(pdf)
+                sniff_stats['pdfs_ocr_queued'] += 1
+                print(f"   🖨️  {pdf.name}: needs OCR - {sniffed.reason}")
+            else:
+                sniff_stats['pdfs_rejected'] += 1
+                print(f"   ⏭️  {pdf.name}: skipped - {sniffed.reason}")
+        if metrics is not None:
+            for name, count in sniff_stats.items():
+                metrics.increment(name, count)
+        
+        # The queue lists this run's scans only, so drop a list left over from an earlier run
+        queue_path = os.path.join(str(output_dir), OCR_QUEUE_FILE) if OCR_QUEUE_FILE else None
+        if queue_path and needs_ocr:
+            with open(queue_path, 'w', encoding='utf-8') as f:
+                f.writelines(f"{pdf}\n" for pdf in needs_ocr)
+            print(f"   📝 {len(needs_ocr)} scan(s) listed in {queue_path}")
+        elif queue_path and os.path.exists(queue_path):
+            os.remove(queue_path)
+        print(f"   ✅ {len(statements)} of {len(pdf_files)} PDF(s) are HSBC statements")
+        pdf_files = statements
+        if not pdf_files:
+            publish_metrics()
+            exit(0)
+    
     print(f"\n📋 Mode: {'Combined output (one CSV for all PDFs)' if COMBINED_OUTPUT else 'Separate output (one CSV per PDF)'}")
     
     # Process based on mode
@@ -773,7 +3147,9 @@ if __name__ == "__main__":
         
         for pdf_path in pdf_files:
             try:
-                transactions = process_pdf(str(pdf_path), str(output_dir), export=False)
+                with profiled(pdf_path.stem) as pdf_stats:
+                    transactions = process_pdf(str(pdf_path), str(output_dir), export=False,
+                                               stats=pdf_stats, metrics=metrics)
                 all_combined_transactions.extend(transactions)
                 processed_count += 1
             except Exception as e:
@@ -781,6 +3157,8 @@ if __name__ == "__main__":
                 import traceback
                 traceback.print_exc()
                 continue
+            finally:
+                publish_metrics()
         
         if all_combined_transactions:
             # Sort all transactions by date
@@ -788,97 +3166,82 @@ if __name__ == "__main__":
             print(f"📋 Combining and sorting {len(all_combined_transactions)} transactions...")
             print("="*70)
             
-            # Convert date format from "21 Mar 22" to sortable format for proper ordering
-            def parse_transaction_date(date_str):
-                """Convert '21 Mar 22' to datetime-sortable format"""
-                months = {
-                    'Jan': '01', 'Feb': '02', 'Mar': '03', 'Apr': '04',
-                    'May': '05', 'Jun': '06', 'Jul': '07', 'Aug': '08',
-                    'Sep': '09', 'Oct': '10', 'Nov': '11', 'Dec': '12'
-                }
-                parts = date_str.split()
-                if len(parts) == 3:
-                    day, month_name, year = parts
-                    month = months.get(month_name, '00')
-                    full_year = f"20{year}"  # Assume 20xx for years
-                    return f"{full_year}{month}{day.zfill(2)}"  # YYYYMMDD format for sorting
-                return date_str
-            
             # Keep PDF's original order - don't sort by date
             # (Transactions are already in chronological order as they appear in the PDFs)
             print(f"✅ Keeping original PDF order for {len(all_combined_transactions)} transactions")
             
-            # Merge split transactions
-            print("\n📋 Merging split transactions...")
-            all_combined_transactions = merge_split_transactions(all_combined_transactions)
-            print(f"✅ After merging: {len(all_combined_transactions)} transactions")
-            
-            # Re-calculate working balances and direction after merging
-            print("\n📋 Recalculating balances for debit/credit determination...")
-            working_balances = calculate_working_balances(all_combined_transactions)
-            all_combined_transactions = determine_debit_credit(all_combined_transactions, working_balances)
-            
-            # Fill in missing balances by propagating from known balances
-            print("\n📋 Filling in missing balances...")
-            for i in range(len(all_combined_transactions)):
-                trans = all_combined_transactions[i]
-                # If this transaction already has a balance, use it
-                if trans.get('balance'):
-                    continue
-                
-                # Find the previous transaction with a balance
-                prev_balance = None
-                for j in range(i-1, -1, -1):
-                    if all_combined_transactions[j].get('balance'):
-                        try:
-                            prev_balance = float(all_combined_transactions[j]['balance'])
-                            break
-                        except:
-                            pass
-                
-                # If we found a previous balance, calculate this transaction's balance
-                if prev_balance is not None:
-                    try:
-                        paid_out = float(trans.get('paid_out', 0) or 0)
-                        paid_in = float(trans.get('paid_in', 0) or 0)
-                        new_balance = prev_balance - paid_out + paid_in
-                        trans['balance'] = f"{new_balance:.2f}"
-                        print(f"  ✓ Calculated balance for {trans['date']} {trans['description'][:30]}: £{new_balance:.2f}")
-                    except Exception as e:
-                        print(f"  ⚠️  Could not calculate balance for {trans['date']}: {e}")
-            
-            # Get date range from first and last transactions
-            first_date = all_combined_transactions[0]['date']
-            last_date = all_combined_transactions[-1]['date']
-            first_sortable = parse_transaction_date(first_date)
-            last_sortable = parse_transaction_date(last_date)
-            
-            # Format for filename: YYYY-MM-DD
-            first_formatted = f"{first_sortable[:4]}-{first_sortable[4:6]}-{first_sortable[6:8]}"
-            last_formatted = f"{last_sortable[:4]}-{last_sortable[4:6]}-{last_sortable[6:8]}"
+            # Balances only chain within one account, so keep each account's statements apart
+            partitions = partition_by_account(all_combined_transactions)
+            if len(partitions) > 1:
+                print(f"\n📋 Found {len(partitions)} accounts - processing them in parallel:")
+                for account, transactions in partitions.items():
+                    print(f"   - {account or 'Unknown account'}: {len(transactions)} transactions")
             
-            # Create combined CSV filename
-            output_filename = f"All_Transactions_{first_formatted}_to_{last_formatted}.csv"
-            output_path = os.path.join(str(output_dir), output_filename)
+            # Merge split transactions, re-calculate direction and fill in missing balances
+            print("\n📋 Merging split transactions, classifying and filling in balances...")
+            started = time.perf_counter()
+            partition_stats = {}
+            with profiled('_combined') as combined_stats, _traced(combined_stats, 'combine'):
+                # One process while profiling, so cProfile sees the work
+                partitions = finalize_partitions(partitions, workers=1 if profiler else None,
+                                                 stats=partition_stats)
+                if combined_stats is not None:
+                    for account_stats in partition_stats.values():
+                        combined_stats.update(account_stats)
+            if metrics is not None:
+                metrics.observe('finalize', time.perf_counter() - started)
+                for account_stats in partition_stats.values():
+                    metrics.record(account_stats)
             
-            csv_file = export_to_csv(all_combined_transactions, output_file=output_path)
-            
-            print("\n" + "="*70)
-            print(f"🎉 DONE! Combined {len(all_combined_transactions)} transactions in {csv_file}")
-            print("="*70)
+            if PARTITIONED_OUTPUT:
+                export_stats = Counter()
+                write_partitioned(partitions, os.path.join(str(output_dir), PARTITION_DIRECTORY),
+                                  OUTPUT_FORMATS, stats=export_stats, prune=PARTITION_PRUNE,
+                                  period_index=PERIOD_INDEX)
+                if metrics is not None:
+                    metrics.record(export_stats)
+            else:
+                for account, transactions in partitions.items():
+                    if not transactions:
+                        continue
+                    # Create combined CSV filename from the first and last transaction dates
+                    # (only name accounts in the file when there is more than one)
+                    output_filename = combined_output_filename(
+                        transactions, (account or 'unknown-account') if len(partitions) > 1 else None)
+                    output_path = os.path.join(str(output_dir), output_filename)
+                    
+                    export_stats = Counter()
+                    paths = export_transactions(transactions, output_path, OUTPUT_FORMATS, stats=export_stats,
+                                                period_index=PERIOD_INDEX)
+                    csv_file = paths.get('csv') or next(iter(paths.values()))
+                    if metrics is not None:
+                        metrics.record(export_stats)
+                    
+                    print("\n" + "="*70)
+                    print(f"🎉 DONE! Combined {len(transactions)} transactions in {csv_file}")
+                    print("="*70)
     else:
         # Separate mode: Export each PDF individually
         processed_count = 0
         for pdf_path in pdf_files:
             try:
-                process_pdf(str(pdf_path), str(output_dir), export=True)
+                with profiled(pdf_path.stem) as pdf_stats:
+                    process_pdf(str(pdf_path), str(output_dir), export=True, stats=pdf_stats, metrics=metrics)
                 processed_count += 1
             except Exception as e:
                 print(f"\n❌ ERROR processing {pdf_path.name}: {str(e)}")
                 import traceback
                 traceback.print_exc()
                 continue
+            finally:
+                publish_metrics()
     
     print("\n" + "="*70)
     print(f"🎉 COMPLETE! Successfully processed {processed_count} of {len(pdf_files)} PDF file(s)")
     print("="*70)
+    
+    publish_metrics()
+    if metrics is not None:
+        metrics.shutdown()
+    if profiler is not None:
+        profiler.report()
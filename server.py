@@ -0,0 +1,274 @@
+"""
+Local conversion server for HSBC statements
+
+Keeps a pool of worker processes with s1.py (PyPDF2 + pdfplumber) already
+imported, so each request only pays for the conversion itself instead of
+interpreter startup and library imports.
+
+Usage:
+    py server.py                          # http://127.0.0.1:8765
+    py server.py --port 9000 --workers 4
+
+Endpoints:
+    POST /convert?format=csv|json   Body: the PDF bytes (Content-Type: application/pdf)
+                                    or JSON {"path": "2024-04-30_Statement.pdf"}
+    GET  /health                    Pool size and in-flight request count
+    GET  /metrics                   Prometheus counters and stage timings (see metrics.py)
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import s1
+from metrics import Metrics
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+HOST = "127.0.0.1"          # Only listen locally
+PORT = 8765
+WORKERS = os.cpu_count() or 2   # Pre-warmed worker processes
+MAX_QUEUE = 16              # Requests allowed to wait for a worker before we answer 503
+REQUEST_TIMEOUT = 120       # Seconds before a request is answered with 504
+PAGE_TIMEOUT = None         # Seconds per page in a supervised extraction process (see s1.py);
+                            # None extracts in the worker itself and relies on REQUEST_TIMEOUT
+MAX_UPLOAD_MB = 50          # Largest PDF accepted in a request body
+# Directory that {"path": ...} requests are resolved against; paths outside it are refused
+ALLOWED_DIRECTORY = s1.PDF_DIRECTORY
+# ============================================================================
+
+_converter = None
+
+def _warm_worker(page_timeout=PAGE_TIMEOUT):
+    """Worker initializer: build the converter once per process"""
+    global _converter
+    # Sniff uploads so other banks' PDFs and scans are refused before the full parse. A
+    # pathological page is cut off by REQUEST_TIMEOUT (the pool is recycled); page_timeout
+    # adds a supervised process per document on top of that
+    _converter = s1.Converter(sniff=True, page_timeout=page_timeout)
+
+def _ping(_):
+    return os.getpid()
+
+def _convert_job(source, name, output_format):
+    """Run one conversion inside a worker process and return (content type, body, stats)"""
+    result = _converter.convert(source, name=name)
+    if output_format == 'json':
+        return 'application/json', json.dumps(result.to_dict()).encode('utf-8'), result.stats
+    return 'text/csv; charset=utf-8', result.to_csv().encode('utf-8'), result.stats
+
+class ConversionPool:
+    """Process pool with a bounded number of admitted requests"""
+
+    def __init__(self, workers=WORKERS, max_queue=MAX_QUEUE, timeout=REQUEST_TIMEOUT, page_timeout=PAGE_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self.page_timeout = page_timeout
+        self.executor = self._new_executor()
+        # A slot is held from admission until the job really finishes (not just until
+        # the HTTP request times out), so runaway jobs keep counting against the limit
+        # until recycle() kills their worker
+        self.capacity = workers + max_queue
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.metrics = Metrics()
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker,
+                                   initargs=(self.page_timeout,))
+
+    def recycle(self):
+        """
+        Replace the worker processes after a timed-out request.
+
+        A running job can't be cancelled, so new requests go to a fresh pool and
+        the old one is killed once its other jobs have had a full request timeout
+        to finish. That frees the worker (and the queue slot) the stuck job held.
+        """
+        with self._lock:
+            old, self.executor = self.executor, self._new_executor()
+
+        def retire():
+            time.sleep(self.timeout)
+            # ProcessPoolExecutor has no public way to stop a running job
+            for process in list((old._processes or {}).values()):
+                process.terminate()
+            old.shutdown(wait=False, cancel_futures=True)
+
+        threading.Thread(target=retire, daemon=True).start()
+
+    def warm_up(self):
+        """Start every worker process now rather than on the first requests"""
+        pids = set(self.executor.map(_ping, range(self.workers * 2)))
+        return len(pids)
+
+    @property
+    def in_flight(self):
+        with self._lock:
+            return self._in_flight
+
+    def _release(self, future):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def submit(self, source, name, output_format):
+        """Queue a conversion, or return None when the server is saturated"""
+        if not self._slots.acquire(blocking=False):
+            return None
+        with self._lock:
+            self._in_flight += 1
+            executor = self.executor
+        future = executor.submit(_convert_job, source, name, output_format)
+        future.add_done_callback(self._release)
+        return future
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    server_version = "HSBCConvert/1.0"
+    pool = None  # Set by serve()
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        if isinstance(body, dict):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/health':
+            self._send(200, {'workers': self.pool.workers, 'in_flight': self.pool.in_flight,
+                             'capacity': self.pool.capacity})
+        elif path == '/metrics':
+            self._send(200, self.pool.metrics.render().encode('utf-8'),
+                       'text/plain; version=0.0.4; charset=utf-8')
+        else:
+            self._send(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/convert':
+            self._send(404, {'error': 'Not found'})
+            return
+
+        output_format = parse_qs(url.query).get('format', ['csv'])[0]
+        if output_format not in ('csv', 'json'):
+            self._send(400, {'error': f"Unknown format '{output_format}' (use csv or json)"})
+            return
+
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self._send(411, {'error': 'Content-Length required'})
+            return
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send(400, {'error': 'Invalid Content-Length'})
+            return
+        if length > MAX_UPLOAD_MB * 1024 * 1024:
+            self._send(413, {'error': f'PDF larger than {MAX_UPLOAD_MB} MB'})
+            return
+        body = self.rfile.read(length)
+
+        try:
+            source, name = self._read_source(body)
+        except (ValueError, PermissionError) as e:
+            self._send(403 if isinstance(e, PermissionError) else 400, {'error': str(e)})
+            return
+
+        metrics = self.pool.metrics
+        future = self.pool.submit(source, name, output_format)
+        if future is None:
+            metrics.increment('rejected_requests')
+            self._send(503, {'error': 'Server busy, retry later'}, headers={'Retry-After': '1'})
+            return
+
+        started = time.perf_counter()
+        try:
+            content_type, payload, stats = future.result(timeout=self.pool.timeout)
+        except TimeoutError:
+            if not future.cancel():  # Already running: the worker is stuck on it
+                self.pool.recycle()
+                metrics.increment('worker_recycles')
+            metrics.increment('request_timeouts')
+            self._send(504, {'error': f'Conversion took longer than {self.pool.timeout}s'})
+            return
+        except Exception as e:
+            metrics.increment('errors')
+            self._send(422, {'error': f'Could not convert {name}: {e}'})
+            return
+        finally:
+            metrics.observe('request', time.perf_counter() - started)
+
+        metrics.record(stats)
+        self._send(200, payload, content_type)
+
+    def _read_source(self, body):
+        """Return (source, name) for a PDF upload or a {"path": ...} request"""
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            try:
+                requested = json.loads(body)['path']
+            except (ValueError, KeyError, TypeError):
+                raise ValueError('Expected JSON body {"path": "..."}')
+            root = Path(ALLOWED_DIRECTORY).resolve()
+            pdf_path = (root / requested).resolve()
+            if root != pdf_path and root not in pdf_path.parents:
+                raise PermissionError(f'{requested} is outside {root}')
+            if not pdf_path.is_file():
+                raise ValueError(f'{requested} not found')
+            return str(pdf_path), pdf_path.name
+
+        if not body.startswith(b'%PDF'):
+            raise ValueError('Body is not a PDF')
+        return body, self.headers.get('X-Filename', 'upload.pdf')
+
+    def log_message(self, format, *args):
+        sys.stderr.write(f"🌐 {self.address_string()} {format % args}\n")
+
+def serve(host=HOST, port=PORT, workers=WORKERS, max_queue=MAX_QUEUE, timeout=REQUEST_TIMEOUT,
+          page_timeout=PAGE_TIMEOUT):
+    """Start the worker pool and serve requests until interrupted"""
+    pool = ConversionPool(workers, max_queue, timeout, page_timeout)
+    print(f"🔥 Warming up {workers} worker process(es)...")
+    pool.warm_up()
+
+    ConversionHandler.pool = pool
+    httpd = ThreadingHTTPServer((host, port), ConversionHandler)
+    print(f"✅ Listening on http://{host}:{port} (POST /convert, GET /health, GET /metrics)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Shutting down...")
+    finally:
+        httpd.server_close()
+        pool.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local HSBC statement conversion server")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--max-queue', type=int, default=MAX_QUEUE)
+    parser.add_argument('--timeout', type=float, default=REQUEST_TIMEOUT)
+    parser.add_argument('--page-timeout', type=float, default=PAGE_TIMEOUT)
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.workers, args.max_queue, args.timeout, args.page_timeout)
@@ -1,11 +1,29 @@
 """
 Test script to compare generated CSV with known-correct CSV
 Focuses on essential columns: Date, Payment type, Details, Paid out, Paid in, Balance
+
+Both files are streamed and rows are aligned by key (date + amounts + balance)
+within a bounded look-ahead window, so one inserted or missing row is reported
+once instead of shifting every row after it.
+
+Usage:
+    py t1.py                                      # default generated/known-correct pair
+    py t1.py generated.csv known-correct.csv
+    py t1.py CSVs/ known-correct/ --workers 8     # every same-named pair in two folders
 """
 
+import argparse
 import csv
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+# How many rows ahead to look for a match before treating two rows as "changed"
+DEFAULT_WINDOW = 50
+# Differences kept (and printed) per file; everything else is only counted
+MAX_REPORTED_DIFFERENCES = 20
+
 def normalize_date(date_str):
     """Normalize date format for comparison (remove leading zeros, handle dashes vs spaces)"""
     # Convert "21 Mar 22" to "21-Mar-22" format or vice versa
@@ -13,7 +31,10 @@ def normalize_date(date_str):
     # Remove leading zeros from day
     parts = date_str.replace('-', ' ').split()
     if len(parts) == 3:
-        day = str(int(parts[0]))  # Remove leading zero
+        try:
+            day = str(int(parts[0]))  # Remove leading zero
+        except ValueError:
+            return date_str
         month = parts[1]
         year = parts[2]
         return f"{day}-{month}-{year}"
@@ -30,184 +51,291 @@ def normalize_amount(amount_str):
     except:
         return amount_str
 
-def compare_csvs(generated_file, known_correct_file):
-    """Compare the two CSV files line by line"""
-    
+def find_column(headers, search_terms):
+    """Find column name that contains any of the search terms (handles different encodings of £)"""
+    for term in search_terms:
+        for h in headers:
+            if term.lower() in h.lower():
+                return h
+    return None
+
+def iter_rows(csv_file):
+    """Stream (row_number, normalized row) pairs from a statement CSV"""
+    with open(csv_file, 'r', encoding='utf-8-sig', newline='') as f:  # utf-8-sig to handle BOM
+        reader = csv.DictReader(f)
+        headers = reader.fieldnames or []
+        paid_out = find_column(headers, ['paid out', 'paidout'])
+        paid_in = find_column(headers, ['paid in', 'paidin'])
+        balance = find_column(headers, ['balance', 'bal'])
+
+        for row_number, row in enumerate(reader, 2):  # +2 for header and 1-indexed
+            yield row_number, {
+                'Date': normalize_date(row.get('Date') or ''),
+                'Type': (row.get('Payment type') or '').strip(),
+                'Details': (row.get('Details') or '').strip(),
+                'Paid out': normalize_amount(row.get(paid_out) or ''),
+                'Paid in': normalize_amount(row.get(paid_in) or ''),
+                'Balance': normalize_amount(row.get(balance) or ''),
+            }
+
+def row_key(row):
+    """Alignment key: date + amounts + balance"""
+    return (row['Date'], row['Paid out'], row['Paid in'], row['Balance'])
+
+def _field_diffs(gen, known):
+    return [f"{name}: '{gen[name]}' vs '{known[name]}'" for name in gen if gen[name] != known[name]]
+
+def diff_rows(generated_rows, known_rows, window=DEFAULT_WINDOW):
+    """
+    Align two row streams and yield events, holding at most `window` rows of each in memory.
+
+    Events are ('match', gen, known), ('changed', gen, known, diffs),
+    ('extra', gen) for rows only in the generated file and ('missing', known)
+    for rows only in the known-correct file. gen/known are (row_number, row) pairs.
+    Raises ValueError straight away if window is less than 1.
+    """
+    if window < 1:
+        raise ValueError(f"window must be at least 1 row (got {window})")
+    return _diff_rows(generated_rows, known_rows, window)
+
+def _diff_rows(generated_rows, known_rows, window):
+    generated_rows, known_rows = iter(generated_rows), iter(known_rows)
+    gen_buffer, known_buffer = deque(), deque()
+
+    def fill(buffer, rows):
+        while len(buffer) < window:
+            item = next(rows, None)
+            if item is None:
+                break
+            buffer.append(item)
+
+    def find(buffer, key):
+        for idx, (_, row) in enumerate(buffer):
+            if row_key(row) == key:
+                return idx
+        return None
+
+    while True:
+        fill(gen_buffer, generated_rows)
+        fill(known_buffer, known_rows)
+        if not gen_buffer and not known_buffer:
+            return
+        if not known_buffer:
+            yield ('extra', gen_buffer.popleft())
+            continue
+        if not gen_buffer:
+            yield ('missing', known_buffer.popleft())
+            continue
+
+        gen, known = gen_buffer[0], known_buffer[0]
+        if row_key(gen[1]) != row_key(known[1]):
+            # Is the generated row further down the known file (rows missing), or vice versa?
+            missing_run = find(known_buffer, row_key(gen[1]))
+            extra_run = find(gen_buffer, row_key(known[1]))
+            if missing_run is not None and (extra_run is None or missing_run <= extra_run):
+                for _ in range(missing_run):
+                    yield ('missing', known_buffer.popleft())
+                continue
+            if extra_run is not None:
+                for _ in range(extra_run):
+                    yield ('extra', gen_buffer.popleft())
+                continue
+
+        # Same key, or no realignment possible within the window: compare field by field
+        gen_buffer.popleft()
+        known_buffer.popleft()
+        diffs = _field_diffs(gen[1], known[1])
+        yield ('changed', gen, known, diffs) if diffs else ('match', gen, known)
+
+def diff_files(generated_file, known_correct_file, window=DEFAULT_WINDOW):
+    """Diff two CSVs and return a summary dict (counts plus the first few differences)"""
+    summary = {
+        'generated': str(generated_file), 'known_correct': str(known_correct_file),
+        'matches': 0, 'changed': 0, 'extra': 0, 'missing': 0,
+        'balance_only': 0, 'generated_rows': 0, 'known_rows': 0, 'differences': [],
+    }
+
+    for event in diff_rows(iter_rows(generated_file), iter_rows(known_correct_file), window):
+        kind = event[0]
+        if kind in ('match', 'changed', 'extra'):
+            summary['generated_rows'] += 1
+        if kind in ('match', 'changed', 'missing'):
+            summary['known_rows'] += 1
+
+        if kind == 'match':
+            summary['matches'] += 1
+            continue
+        summary[kind] += 1
+
+        if kind == 'changed':
+            (row_number, gen), _, diffs = event[1], event[2], event[3]
+            if len(diffs) == 1 and diffs[0].startswith('Balance'):
+                summary['balance_only'] += 1
+            diff = {'row': row_number, 'date': gen['Date'], 'details': gen['Details'][:40], 'diffs': diffs}
+        elif kind == 'extra':
+            row_number, gen = event[1]
+            diff = {'row': row_number, 'date': gen['Date'], 'details': gen['Details'][:40],
+                    'issue': 'Extra row in generated file'}
+        else:
+            row_number, known = event[1]
+            diff = {'row': row_number, 'date': known['Date'], 'details': known['Details'][:40],
+                    'issue': 'Missing in generated file (known-correct row number)'}
+
+        if len(summary['differences']) < MAX_REPORTED_DIFFERENCES:
+            summary['differences'].append(diff)
+
+    return summary
+
+def _total_differences(summary):
+    return summary['changed'] + summary['extra'] + summary['missing']
+
+def _aligned_rows(summary):
+    return summary['matches'] + _total_differences(summary)
+
+def compare_csvs(generated_file, known_correct_file, window=DEFAULT_WINDOW):
+    """Compare the two CSV files and print a report; returns True on a perfect match"""
+
     print("=" * 80)
     print("  CSV COMPARISON TEST")
     print("=" * 80)
     print(f"Generated: {generated_file}")
     print(f"Known-Correct: {known_correct_file}")
     print()
-    
-    # Read both files
-    with open(generated_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        generated = list(reader)
-        gen_headers = reader.fieldnames
-    
-    with open(known_correct_file, 'r', encoding='utf-8-sig') as f:  # utf-8-sig to handle BOM
-        reader = csv.DictReader(f)
-        known_correct = list(reader)
-        known_headers = reader.fieldnames
-    
-    # Create a mapping for column names (handle different encodings of £ symbol)
-    def find_column(headers, search_terms):
-        """Find column name that contains any of the search terms"""
-        for term in search_terms:
-            for h in headers:
-                if term.lower() in h.lower():
-                    return h
-        return None
-    
-    gen_paid_out = find_column(gen_headers, ['paid out', 'paidout'])
-    gen_paid_in = find_column(gen_headers, ['paid in', 'paidin'])
-    gen_balance = find_column(gen_headers, ['balance'])
-    
-    known_paid_out = find_column(known_headers, ['paid out', 'paidout'])
-    known_paid_in = find_column(known_headers, ['paid in', 'paidin'])
-    known_balance = find_column(known_headers, ['balance', 'bal'])
-    
-    print(f"Column mapping:")
-    print(f"   Generated: '{gen_paid_out}', '{gen_paid_in}', '{gen_balance}'")
-    print(f"   Known-Correct: '{known_paid_out}', '{known_paid_in}', '{known_balance}'")
-    print()
-    
+
+    summary = diff_files(generated_file, known_correct_file, window)
+
     print(f"Row counts:")
-    print(f"   Generated: {len(generated)} transactions")
-    print(f"   Known-Correct: {len(known_correct)} transactions")
+    print(f"   Generated: {summary['generated_rows']} transactions")
+    print(f"   Known-Correct: {summary['known_rows']} transactions")
     print()
-    
-    if len(generated) != len(known_correct):
-        print(f"MISMATCH: Row count differs by {abs(len(generated) - len(known_correct))} rows")
+
+    if summary['generated_rows'] != summary['known_rows']:
+        print(f"MISMATCH: Row count differs by {abs(summary['generated_rows'] - summary['known_rows'])} rows")
         print()
     else:
         print("Row count matches!")
         print()
-    
-    # Compare row by row
-    differences = []
-    matches = 0
-    
-    max_rows = max(len(generated), len(known_correct))
-    
-    for i in range(max_rows):
-        if i >= len(generated):
-            differences.append({
-                'row': i + 2,  # +2 for header and 1-indexed
-                'issue': 'Missing in generated file',
-                'known_correct': known_correct[i]
-            })
-            continue
-        
-        if i >= len(known_correct):
-            differences.append({
-                'row': i + 2,
-                'issue': 'Extra row in generated file',
-                'generated': generated[i]
-            })
-            continue
-        
-        gen = generated[i]
-        known = known_correct[i]
-        
-        row_diffs = []
-        
-        # Compare Date
-        gen_date = normalize_date(gen.get('Date', ''))
-        known_date = normalize_date(known.get('Date', ''))
-        if gen_date != known_date:
-            row_diffs.append(f"Date: '{gen_date}' vs '{known_date}'")
-        
-        # Compare Payment type
-        gen_type = gen.get('Payment type', '').strip()
-        known_type = known.get('Payment type', '').strip()
-        if gen_type != known_type:
-            row_diffs.append(f"Type: '{gen_type}' vs '{known_type}'")
-        
-        # Compare Details
-        gen_details = gen.get('Details', '').strip()
-        known_details = known.get('Details', '').strip()
-        if gen_details != known_details:
-            row_diffs.append(f"Details: '{gen_details}' vs '{known_details}'")
-        
-        # Compare Paid out (use column name with £ symbol)
-        gen_out = normalize_amount(gen.get(gen_paid_out, ''))
-        known_out = normalize_amount(known.get(known_paid_out, ''))
-        if gen_out != known_out:
-            row_diffs.append(f"Paid out: '{gen_out}' vs '{known_out}'")
-        
-        # Compare Paid in
-        gen_in = normalize_amount(gen.get(gen_paid_in, ''))
-        known_in = normalize_amount(known.get(known_paid_in, ''))
-        if gen_in != known_in:
-            row_diffs.append(f"Paid in: '{gen_in}' vs '{known_in}'")
-        
-        # Compare Balance
-        gen_bal = normalize_amount(gen.get(gen_balance, ''))
-        known_bal = normalize_amount(known.get(known_balance, ''))
-        if gen_bal != known_bal:
-            row_diffs.append(f"Balance: '{gen_bal}' vs '{known_bal}'")
-        
-        if row_diffs:
-            differences.append({
-                'row': i + 2,
-                'date': gen_date,
-                'details': gen_details[:40],
-                'diffs': row_diffs
-            })
-        else:
-            matches += 1
-    
+
+    differences = summary['differences']
+    total_differences = _total_differences(summary)
+
     # Print summary
     print("=" * 80)
     print("  RESULTS")
     print("=" * 80)
-    print(f"Matching rows: {matches}")
-    print(f"Rows with differences: {len(differences)}")
+    print(f"Matching rows: {summary['matches']}")
+    print(f"Rows with differences: {summary['changed']}")
+    print(f"Extra rows in generated file: {summary['extra']}")
+    print(f"Rows missing from generated file: {summary['missing']}")
     print()
-    
+
     if differences:
         print("=" * 80)
         print("  DIFFERENCES FOUND")
         print("=" * 80)
-        for diff in differences[:20]:  # Show first 20 differences
+        for diff in differences:
             print(f"\nRow {diff['row']}: {diff.get('date', 'N/A')} - {diff.get('details', 'N/A')[:40]}")
             if 'issue' in diff:
                 print(f"  ⚠️  {diff['issue']}")
             else:
                 for d in diff['diffs']:
                     print(f"  • {d}")
-        
-        if len(differences) > 20:
-            print(f"\n... and {len(differences) - 20} more differences")
-    
+
+        if total_differences > len(differences):
+            print(f"\n... and {total_differences - len(differences)} more differences")
+
     print("\n" + "=" * 80)
-    if len(differences) == 0:
+    if total_differences == 0:
         print("PERFECT MATCH! All rows identical!")
         return True
     else:
-        print(f"Found {len(differences)} differences out of {max_rows} rows")
-        print(f"   Accuracy: {matches}/{max_rows} = {100*matches/max_rows:.1f}%")
-        
+        aligned = _aligned_rows(summary)
+        print(f"Found {total_differences} differences out of {aligned} rows")
+        print(f"   Accuracy: {summary['matches']}/{aligned} = {100*summary['matches']/aligned:.1f}%")
+
         # Categorize differences
-        balance_only = sum(1 for d in differences if 'diffs' in d and len(d['diffs']) == 1 and 'Balance' in d['diffs'][0])
-        print(f"   Balance-only differences: {balance_only}")
-        print(f"   Other differences: {len(differences) - balance_only}")
+        print(f"   Balance-only differences: {summary['balance_only']}")
+        print(f"   Other differences: {total_differences - summary['balance_only']}")
         return False
+
+def _diff_pair(pair):
+    generated_file, known_correct_file, window = pair
+    return diff_files(generated_file, known_correct_file, window)
+
+def compare_directory(generated_dir, known_dir, workers=None, window=DEFAULT_WINDOW):
+    """
+    Diff every known-correct CSV against the same-named generated CSV, in parallel.
+
+    Prints one line per file plus an overall accuracy summary; returns True if
+    every pair matches perfectly.
+    """
+    known_files = sorted(Path(known_dir).glob("*.csv"))
+    pairs = [(Path(generated_dir) / known.name, known, window) for known in known_files]
+    absent = [str(gen) for gen, _, _ in pairs if not gen.exists()]
+    pairs = [pair for pair in pairs if pair[0].exists()]
+
+    print("=" * 80)
+    print(f"  CSV COMPARISON TEST - {len(pairs)} file pair(s)")
+    print("=" * 80)
+
+    totals = {'matches': 0, 'changed': 0, 'extra': 0, 'missing': 0}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for summary in executor.map(_diff_pair, pairs, chunksize=4):
+            for key in totals:
+                totals[key] += summary[key]
+            aligned = _aligned_rows(summary)
+            accuracy = 100 * summary['matches'] / aligned if aligned else 100.0
+            print(f"{accuracy:6.1f}%  {Path(summary['known_correct']).name}"
+                  f"  (changed {summary['changed']}, extra {summary['extra']}, missing {summary['missing']})")
+
+    for gen in absent:
+        print(f"  ⚠️  Generated file not found: {gen}")
+
+    aligned = _aligned_rows(totals)
+    total_differences = _total_differences(totals)
+    print("\n" + "=" * 80)
+    print(f"Rows compared: {aligned}")
+    print(f"   Matching: {totals['matches']}")
+    print(f"   Changed: {totals['changed']}  Extra: {totals['extra']}  Missing: {totals['missing']}")
+    if aligned:
+        print(f"   Accuracy: {totals['matches']}/{aligned} = {100*totals['matches']/aligned:.2f}%")
     print("=" * 80)
+    return total_differences == 0 and not absent
+
+def _window(value):
+    """argparse type for --window: a whole number of rows, at least 1"""
+    try:
+        window = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"must be a whole number of rows (got '{value}')")
+    if window < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1 row (got {window})")
+    return window
 
 if __name__ == '__main__':
-    generated = Path('CSVs/All_Transactions_2022-03-21_to_2022-06-17.csv')
-    known_correct = Path('known-correct-2.csv')
-    
+    parser = argparse.ArgumentParser(description="Compare generated CSVs with known-correct CSVs")
+    parser.add_argument('generated', nargs='?', default='CSVs/All_Transactions_2022-03-21_to_2022-06-17.csv',
+                        help="Generated CSV, or a folder of them")
+    parser.add_argument('known_correct', nargs='?', default='known-correct-2.csv',
+                        help="Known-correct CSV, or a folder of same-named CSVs")
+    parser.add_argument('--window', type=_window, default=DEFAULT_WINDOW,
+                        help="Rows to look ahead when realigning after an insertion/deletion")
+    parser.add_argument('--workers', type=int, default=None, help="Parallel workers for folder mode")
+    args = parser.parse_args()
+
+    generated = Path(args.generated)
+    known_correct = Path(args.known_correct)
+
     if not generated.exists():
         print(f"Generated file not found: {generated}")
         exit(1)
-    
+
     if not known_correct.exists():
         print(f"Known-correct file not found: {known_correct}")
         exit(1)
-    
-    success = compare_csvs(generated, known_correct)
+
+    if generated.is_dir() and known_correct.is_dir():
+        success = compare_directory(generated, known_correct, args.workers, args.window)
+    else:
+        success = compare_csvs(generated, known_correct, args.window)
     exit(0 if success else 1)
@@ -0,0 +1,133 @@
+"""
+Shared fixtures: synthetic statements and transactions (no real bank data)
+
+The scripts live in the repository root rather than a package, so the root is
+put on sys.path here.
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ACCOUNT = ('40-11-62', '12345678')
+OTHER_ACCOUNT = ('40-22-33', '87654321')
+
+def transaction(date, description, paid_out='', paid_in='', balance='', **tags):
+    """A classified transaction as finalize_combined_transactions leaves it"""
+    trans = {'date': date, 'description': description, 'paid_out': paid_out,
+             'paid_in': paid_in, 'balance': balance}
+    trans.update({f'_{key}': value for key, value in tags.items()})
+    return trans
+
+def statement_rows(month='Mar', count=20, seed=1):
+    """(date, description, amount, direction) rows like an HSBC statement's table"""
+    rng = random.Random(seed)
+    rows = []
+    for day in range(2, 2 + count):
+        description = rng.choice(['DD EDF ENERGY', 'VIS TESCO STORES', 'CR SALARY ACME', 'BP J SMITH RENT'])
+        rows.append((f'{day:02d} {month} 22', description, round(rng.uniform(1, 300), 2),
+                     'in' if description.startswith('CR') else 'out'))
+    return rows
+
+def write_statement(path, account=ACCOUNT, month='Mar', rows=None, opening=1500.0,
+                    header=True, account_on_page=1):
+    """
+    Draw a text-layer statement PDF with reportlab.
+
+    account_on_page puts the sort code/account number line on a later page, and
+    header=False leaves out every 'HSBC' so only the table wording identifies it.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    rows = statement_rows(month) if rows is None else rows
+    c = canvas.Canvas(str(path), pagesize=A4)
+    page = 1
+
+    def start_page(balance):
+        y = 800
+        if header:
+            c.drawString(40, y, 'HSBC UK Your Statement')
+            y -= 15
+        if page == account_on_page:
+            c.drawString(40, y, f'Sortcode {account[0]} Account number {account[1]}')
+            y -= 25
+        c.drawString(40, y, 'Date  Payment type and details   Paid out   Paid in   Balance')
+        y -= 15
+        c.drawString(40, y, f'01 {month} 22 BALANCEBROUGHTFORWARD {balance:,.2f}')
+        return y - 15
+
+    balance = opening
+    y = start_page(balance)
+    for idx, (date, description, amount, direction) in enumerate(rows):
+        balance = balance - amount if direction == 'out' else balance + amount
+        c.drawString(40, y, f'{date} {description} {amount:,.2f}' + (f' {balance:,.2f}' if idx % 2 else ''))
+        y -= 15
+        if y < 100 or (account_on_page > page and idx == len(rows) // 2):
+            c.drawString(40, y, f'BALANCECARRIEDFORWARD {balance:,.2f}')
+            c.showPage()
+            page += 1
+            y = start_page(balance)
+    c.drawString(40, y, f'BALANCECARRIEDFORWARD {balance:,.2f}')
+    c.showPage()
+    c.save()
+    return path
+
+# Right edges of the amount columns in write_layout_statement
+LAYOUT_COLUMNS = {'out': 380, 'in': 460, 'balance': 540}
+
+def write_layout_statement(path, rows, account=ACCOUNT, month='Mar', opening=1500.0):
+    """
+    Draw a one-page statement with the amounts right-aligned in their columns, like
+    the real PDFs. rows are (date, description, amount, column, balance): column is
+    'out' or 'in', an x position for an amount printed off its column, or None to
+    print only the balance on that line; date and balance may be empty.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(str(path), pagesize=A4)
+    c.drawString(40, 800, 'HSBC UK Your Statement')
+    c.drawString(40, 785, f'Sortcode {account[0]} Account number {account[1]}')
+    c.drawString(40, 760, 'Date')
+    c.drawString(110, 760, 'Payment type and details')
+    for column, text in (('out', 'Paid out'), ('in', 'Paid in'), ('balance', 'Balance')):
+        c.drawRightString(LAYOUT_COLUMNS[column], 760, text)
+    c.drawString(40, 745, f'01 {month} 22')
+    c.drawString(110, 745, 'BALANCE BROUGHT FORWARD')
+    c.drawRightString(LAYOUT_COLUMNS['balance'], 745, f'{opening:,.2f}')
+    y = 730
+    for date, description, amount, column, balance in rows:
+        c.drawString(40, y, date)
+        c.drawString(110, y, description)
+        if column is not None:
+            c.drawRightString(LAYOUT_COLUMNS.get(column, column), y, f'{amount:,.2f}')
+        if balance:
+            c.drawRightString(LAYOUT_COLUMNS['balance'], y, f'{balance:,.2f}')
+        y -= 15
+    c.drawString(110, y, 'BALANCE CARRIED FORWARD')
+    c.showPage()
+    c.save()
+    return path
+
+@pytest.fixture
+def statement(tmp_path):
+    """Factory writing a synthetic statement PDF into tmp_path"""
+    pytest.importorskip('reportlab')
+
+    def make(name='2022-03-31_Statement.pdf', **kwargs):
+        return write_statement(tmp_path / name, **kwargs)
+    return make
+
+@pytest.fixture
+def layout_statement(tmp_path):
+    """Factory writing a column-aligned statement PDF (write_layout_statement) into tmp_path"""
+    pytest.importorskip('reportlab')
+
+    def make(rows, name='2022-03-31_Statement.pdf', **kwargs):
+        return write_layout_statement(tmp_path / name, rows, **kwargs)
+    return make
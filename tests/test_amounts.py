@@ -0,0 +1,36 @@
+import random
+import re
+
+import pytest
+
+import s1
+from bench_parse import FUZZ_TOKENS
+
+OLD_PATTERN = re.compile(r'[\d,]+\.\d{2}')
+
+def old_spans(text):
+    return [match.span() for match in OLD_PATTERN.finditer(text)]
+
+def fuzz_lines(count, seed=0):
+    rnd = random.Random(seed)
+    return [''.join(rnd.choice(FUZZ_TOKENS) + rnd.choice([' ', '', ','])
+                    for _ in range(rnd.randint(1, 40)))
+            for _ in range(count)]
+
+# The adversarial inputs from bench_parse.py, at a size the regex still handles quickly
+@pytest.mark.parametrize('text', [
+    '1,2' * 500,
+    '1,2' * 500 + '.34',
+    '02 Mar 22 X ' + '1,234.56 ' * 100,
+    '9' * 2000 + '.12',
+    "@ 1.0042" * 5 + " 12.34",
+    'ABC00042DE042FGH 5.00',
+    '1.234 12.345 1,,2.34 ,.12 .12 1.2 99.999 12.3456.78',
+    '',
+])
+def test_matches_the_regex_on_adversarial_lines(text):
+    assert s1.find_amounts(text) == old_spans(text)
+
+def test_matches_the_regex_on_fuzzed_lines():
+    for line in fuzz_lines(2000):
+        assert s1.find_amounts(line) == old_spans(line), line
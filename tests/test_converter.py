@@ -0,0 +1,99 @@
+import asyncio
+import os
+import shutil
+
+import pytest
+
+import s1
+from conftest import OTHER_ACCOUNT, statement_rows, transaction
+
+def test_convert_tags_statement_and_account(statement):
+    result = s1.Converter().convert(str(statement()))
+
+    assert len(result.transactions) == 20
+    assert {trans['_statement'] for trans in result.transactions} == {'2022-03-31_Statement.pdf'}
+    assert {trans['_account'] for trans in result.transactions} == {'40-11-62 12345678'}
+    assert result.stats['pdfs'] == 1
+
+def test_pages_before_the_account_header_are_tagged_too(statement):
+    result = s1.Converter().convert(str(statement(account_on_page=2)))
+
+    assert result.stats['pages'] == 2
+    assert {trans['_page'] for trans in result.transactions} == {1, 2}
+    assert {trans.get('_account') for trans in result.transactions} == {'40-11-62 12345678'}
+
+def test_account_tagger_backfills_earlier_pages():
+    tagger = s1.AccountTagger()
+    first, second = [transaction('02 Mar 22', 'A')], [transaction('03 Mar 22', 'B')]
+
+    tagger.tag(first, "Your Statement")
+    assert '_account' not in first[0]
+    tagger.tag(second, "Sort code 40-11-62 Account number 12345678")
+
+    assert first[0]['_account'] == second[0]['_account'] == '40-11-62 12345678'
+
+def test_convert_by_account_keeps_stats_per_account(statement, tmp_path):
+    march = statement('2022-03-31_Statement.pdf')
+    april = statement('2022-04-30_Statement.pdf', month='Apr', rows=statement_rows('Apr', seed=2))
+    other = statement('2022-03-31_Savings.pdf', account=OTHER_ACCOUNT, rows=statement_rows(count=6, seed=3))
+    copy = tmp_path / '2022-03-31_Statement (1).pdf'
+    shutil.copy(march, copy)
+
+    results = s1.Converter().convert_by_account([str(march), str(april), str(other), str(copy)])
+
+    by_account = {result.transactions[0]['_account']: result for result in results}
+    current, savings = by_account['40-11-62 12345678'], by_account['40-22-33 87654321']
+    assert (current.stats['pdfs'], current.stats['transactions']) == (2, 40)
+    assert (savings.stats['pdfs'], savings.stats['transactions']) == (1, 6)
+    assert current.stats['duplicate_pdfs_skipped'] == 1
+    assert savings.stats['duplicate_pdfs_skipped'] == 0
+    assert 'seconds_merge' in current.stats and 'seconds_merge' in savings.stats
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_finalize_partitions_returns_merge_stats(workers):
+    partitions = {
+        'a': [transaction('02 Mar 22', 'VIS TESCO STORES', balance='95.00'),
+              transaction('03 Mar 22', 'DD EDF ENERGY', balance='')],
+        'b': [transaction('02 Mar 22', 'CR SALARY ACME', balance='100.00')],
+    }
+    for transactions in partitions.values():
+        for trans in transactions:
+            trans['amount'] = '5.00'
+    stats = {}
+
+    finalized = s1.finalize_partitions(partitions, s1._silent, workers, stats)
+
+    assert list(finalized) == ['a', 'b']
+    assert set(stats) == {'a', 'b'}
+    assert all('seconds_merge' in account_stats for account_stats in stats.values())
+
+def test_export_needs_formats_and_writes_the_index_only_when_asked(statement, tmp_path):
+    converter = s1.Converter(output_dir=str(tmp_path / 'out'))
+    os.makedirs(converter.output_dir)
+    result = converter.convert(str(statement()))
+
+    with pytest.raises(ValueError):
+        converter.export(result, [])
+    csv_path = converter.write(result)
+    assert not os.path.exists(s1.period_index_path(csv_path))
+
+    indexed = s1.Converter(output_dir=converter.output_dir, period_index=True)
+    csv_path = indexed.write(result)
+    assert len(s1.read_period(csv_path, month='2022-03')) == len(result.transactions)
+
+def test_async_converter_matches_the_converter(statement):
+    path = str(statement())
+
+    async def convert():
+        converter = s1.AsyncConverter(max_concurrent=2)
+        try:
+            result = await converter.convert(path)
+            pages = [transactions async for _, transactions in converter.iter_pages(path)]
+        finally:
+            converter.close()
+        return result, pages
+
+    result, pages = asyncio.run(convert())
+
+    assert result.to_csv() == s1.Converter().convert(path).to_csv()
+    assert {trans['_statement'] for page in pages for trans in page} == {'2022-03-31_Statement.pdf'}
@@ -0,0 +1,63 @@
+import io
+
+import s1
+
+PDF = b'%PDF-1.4 statement bytes'
+
+class Pipe(io.RawIOBase):
+    """A readable stream that can't seek, like a socket or stdin"""
+
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self.data.readinto(buffer)
+
+def test_keeps_the_original_name_over_a_download_copy(tmp_path):
+    for name in ('2024-04-30_Statement (1).pdf', '2024-04-30_Statement.pdf', 'copy of statement.pdf'):
+        (tmp_path / name).write_bytes(PDF)
+    sources = sorted(str(path) for path in tmp_path.iterdir())
+
+    unique, duplicates = s1.dedupe_pdfs(sources)
+
+    assert unique == [str(tmp_path / '2024-04-30_Statement.pdf')]
+    assert sorted(skipped for skipped, _ in duplicates) == [
+        str(tmp_path / '2024-04-30_Statement (1).pdf'), str(tmp_path / 'copy of statement.pdf')]
+    assert {kept for _, kept in duplicates} == {str(tmp_path / '2024-04-30_Statement.pdf')}
+
+def test_without_a_clear_original_keeps_the_first_name_alphabetically(tmp_path):
+    for name in ('b.pdf', 'a.pdf'):
+        (tmp_path / name).write_bytes(PDF)
+
+    unique, duplicates = s1.dedupe_pdfs([str(tmp_path / 'b.pdf'), str(tmp_path / 'a.pdf')])
+
+    assert unique == [str(tmp_path / 'a.pdf')]
+    assert duplicates == [(str(tmp_path / 'b.pdf'), str(tmp_path / 'a.pdf'))]
+
+def test_same_size_different_content_is_kept(tmp_path):
+    (tmp_path / 'a.pdf').write_bytes(PDF)
+    (tmp_path / 'b.pdf').write_bytes(PDF.upper())
+
+    unique, duplicates = s1.dedupe_pdfs([str(tmp_path / 'a.pdf'), str(tmp_path / 'b.pdf')])
+
+    assert len(unique) == 2 and duplicates == []
+
+def test_file_objects_keep_their_read_position():
+    first, second = io.BytesIO(PDF), io.BytesIO(PDF)
+    second.seek(3)
+
+    unique, duplicates = s1.dedupe_pdfs([first, second])
+
+    assert unique == [first] and duplicates == [(second, first)]
+    assert first.tell() == 0 and second.tell() == 3
+
+def test_non_seekable_streams_are_never_copies_and_stay_unread():
+    first, second = Pipe(PDF), Pipe(PDF)
+
+    unique, duplicates = s1.dedupe_pdfs([first, second])
+
+    assert unique == [first, second] and duplicates == []
+    assert first.read() == PDF
@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+
+import pytest
+
+import s1
+from conftest import transaction
+
+def transactions():
+    return [
+        transaction('02 Mar 22', 'VIS TESCO STORES', '5.00', '', '95.00', statement='mar.pdf'),
+        transaction('09 Mar 22', 'DD EDF ENERGY', '10.00', '', '85.00', statement='mar.pdf'),
+        transaction('04 Apr 22', 'CR SALARY ACME', '', '100.00', '185.00', statement='apr.pdf'),
+    ]
+
+def export(tmp_path, formats, **kwargs):
+    return s1.export_transactions(transactions(), str(tmp_path / 'out.csv'), formats, s1._silent, **kwargs)
+
+def test_every_format_is_written_next_to_the_csv(tmp_path):
+    paths = export(tmp_path, list(s1.OUTPUT_SINKS))
+
+    assert set(paths) == set(s1.OUTPUT_SINKS)
+    assert paths['csv'] == str(tmp_path / 'out.csv')
+    assert paths['summary'] == str(tmp_path / 'out.summary.json')
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in paths.values())
+
+def test_empty_or_unknown_formats_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        export(tmp_path, [])
+    with pytest.raises(ValueError):
+        export(tmp_path, ['csv', 'xlsx'])
+    assert os.listdir(tmp_path) == []
+
+def test_period_index_is_only_written_when_asked_for(tmp_path):
+    export(tmp_path, ['csv'])
+    assert not os.path.exists(s1.period_index_path(str(tmp_path / 'out.csv')))
+
+    export(tmp_path, ['csv'], period_index=True)
+    assert os.path.exists(s1.period_index_path(str(tmp_path / 'out.csv')))
+
+def test_read_period_seeks_to_a_month_or_statement(tmp_path):
+    csv_path = export(tmp_path, ['csv'], period_index=True)['csv']
+
+    april = s1.read_period(csv_path, month='2022-04')
+    march = s1.read_period(csv_path, statement='mar.pdf')
+
+    assert [row['Details'] for row in april] == ['SALARY ACME']
+    assert [row['£Balance'] for row in march] == ['95.00', '85.00']
+    assert s1.read_period(csv_path, month='2022-05') == []
+    index = s1.load_period_index(csv_path)
+    assert index['months']['2022-03']['opening_balance'] == '100.00'
+    assert index['months']['2022-03']['closing_balance'] == '85.00'
+
+def test_opening_balance_of_a_period_starting_without_a_printed_balance(tmp_path):
+    rows = [transaction('02 Mar 22', 'VIS TESCO STORES', '5.00'),
+            transaction('09 Mar 22', 'DD EDF ENERGY', '10.00', '', '85.00'),
+            transaction('28 Mar 22', 'VIS TESCO STORES', '20.00'),
+            transaction('04 Apr 22', 'CR SALARY ACME', '', '100.00'),
+            transaction('05 Apr 22', 'DD EDF ENERGY', '15.00', '', '150.00')]
+    paths = s1.export_transactions(rows, str(tmp_path / 'out.csv'), ['csv', 'summary'], s1._silent,
+                                   period_index=True)
+
+    index = s1.load_period_index(paths['csv'])
+    with open(paths['summary'], encoding='utf-8') as f:
+        summary = json.load(f)
+    for periods in (index['months'], summary['months']):
+        assert periods['2022-03']['opening_balance'] == '100.00'
+        assert periods['2022-04']['opening_balance'] == '65.00'
+    assert summary['total']['opening_balance'] == '100.00'
+
+def test_export_to_csv_writes_the_period_index_by_default(tmp_path):
+    csv_path = s1.export_to_csv(transactions(), str(tmp_path / 'out.csv'), s1._silent)
+    assert s1.read_period(csv_path, statement='apr.pdf')[0]['Details'] == 'SALARY ACME'
+
+    s1.export_to_csv(transactions(), str(tmp_path / 'plain.csv'), s1._silent, period_index=False)
+    assert not os.path.exists(s1.period_index_path(str(tmp_path / 'plain.csv')))
+
+def test_period_index_is_refused_after_the_csv_is_edited(tmp_path):
+    csv_path = export(tmp_path, ['csv'], period_index=True)['csv']
+    with open(csv_path, 'a', encoding='utf-8', newline='') as f:
+        f.write('10-Apr-22,Credit,EDITED BY HAND,,1.00,186.00\r\n')
+
+    with pytest.raises(ValueError):
+        s1.load_period_index(csv_path)
+    with pytest.raises(ValueError):
+        s1.read_period(csv_path, month='2022-04')
+
+def test_summary_totals(tmp_path):
+    with open(export(tmp_path, ['summary'])['summary'], encoding='utf-8') as f:
+        summary = json.load(f)
+
+    march = summary['months']['2022-03']
+    assert (march['rows'], march['paid_out'], march['paid_in'], march['net']) == (2, '15.00', '0.00', '-15.00')
+    assert (march['opening_balance'], march['closing_balance']) == ('100.00', '85.00')
+    assert march['payment_types']['Direct Debit'] == {'rows': 1, 'paid_in': '0.00', 'paid_out': '10.00'}
+    assert [merchant['details'] for merchant in march['top_merchants']] == ['EDF ENERGY', 'TESCO STORES']
+    assert summary['statements']['apr.pdf']['paid_in'] == '100.00'
+    assert summary['total']['net'] == '85.00'
+
+def test_ofx_declares_and_uses_a_single_byte_charset(tmp_path):
+    rows = transactions()
+    rows[0]['description'] = 'VIS CAFÉ £ ☕'
+    rows[0]['_account'] = '40-11-62 12345678'
+    ofx_path = s1.export_transactions(rows, str(tmp_path / 'out.csv'), ['ofx'], s1._silent)['ofx']
+
+    with open(ofx_path, 'rb') as f:
+        data = f.read()
+    header = data.split(b'\n\n', 1)[0].decode('ascii').splitlines()
+    assert 'ENCODING:USASCII' in header and 'CHARSET:1252' in header
+    assert 'CAFÉ £ ?'.encode('cp1252') in data
+    assert b'<BANKID>401162' in data and b'<ACCTID>12345678' in data
+
+def test_output_sink_requires_write(tmp_path):
+    class NoWrite(s1.OutputSink):
+        extension = '.txt'
+
+    with pytest.raises(TypeError):
+        NoWrite(str(tmp_path / 'out.txt'))
+
+def test_threads_exporting_the_same_file_use_their_own_temporary_files(tmp_path):
+    target = str(tmp_path / 'out.csv')
+    names = []
+    all_open = threading.Barrier(4)
+
+    def open_sink():
+        sink = s1.CsvSink(target, period_index=True)
+        names.append(sink.tmp_path)
+        all_open.wait()  # Thread ids are only unique among running threads
+        sink.abort()
+
+    threads = [threading.Thread(target=open_sink) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(names)) == 4
+    assert os.listdir(tmp_path) == []
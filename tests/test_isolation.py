@@ -0,0 +1,57 @@
+from collections import Counter
+
+import pytest
+
+import s1
+
+@pytest.fixture
+def answers(monkeypatch):
+    """Replace chosen worker answers: {(backend, page_idx): (status, value)}"""
+    replaced = {}
+    request = s1.IsolatedPageWorker.request
+
+    def fake(self, backend, page_idx=None):
+        if (backend, page_idx) in replaced:
+            return replaced[backend, page_idx]
+        return request(self, backend, page_idx)
+    monkeypatch.setattr(s1.IsolatedPageWorker, 'request', fake)
+    return replaced
+
+def pages(path, timeout=10):
+    stats = Counter()
+    return dict(s1.iter_pdf_pages_isolated(path, timeout, log=s1._silent, stats=stats)), stats
+
+def test_pages_match_in_process_extraction(statement):
+    path = str(statement(account_on_page=2))
+
+    assert pages(path)[0] == dict(s1.iter_pdf_pages(path, log=s1._silent))
+
+def test_a_page_that_times_out_and_crashes_is_skipped(statement, answers):
+    path = str(statement(account_on_page=2))
+    answers['pypdf2', 0] = ('timeout', None)
+    answers['pdfplumber', 0] = ('crashed', None)
+
+    texts, stats = pages(path)
+
+    assert texts[1] == "" and 'Sortcode' in texts[2]
+    assert (stats['page_timeouts'], stats['worker_crashes'], stats['failed_pages']) == (1, 1, 1)
+
+def test_a_page_that_times_out_falls_back_to_pdfplumber(statement, answers):
+    path = str(statement())
+    answers['pypdf2', 0] = ('timeout', None)
+
+    texts, stats = pages(path)
+
+    assert 'BALANCEBROUGHTFORWARD' in texts[1]
+    assert (stats['page_timeouts'], stats['pdfplumber_fallbacks'], stats['failed_pages']) == (1, 1, 0)
+
+@pytest.mark.parametrize('status', ['timeout', 'crashed'])
+def test_pages_are_counted_in_process_if_the_worker_cannot(statement, answers, status):
+    path = str(statement(account_on_page=2))
+    answers['count', None] = (status, None)
+
+    texts, stats = pages(path)
+
+    assert sorted(texts) == [1, 2] and all(texts.values())
+    assert stats['pages'] == 2
+    assert stats['page_timeouts' if status == 'timeout' else 'worker_crashes'] == 1
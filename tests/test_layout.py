@@ -0,0 +1,51 @@
+import pytest
+
+import s1
+
+ROWS = [
+    ('02 Mar 22', 'VIS TESCO STORES', 12.50, 'out', ''),
+    ('', 'DD EDF ENERGY', 40.00, 'out', 1447.50),
+    ('03 Mar 22', 'CR SALARY ACME', 1000.00, 'in', 2447.50),
+    # Codes that usually mean the other direction: the column decides
+    ('04 Mar 22', 'CR REVERSAL', 7.50, 'out', 2440.00),
+    ('05 Mar 22', 'VIS REFUND AMAZON', 20.00, 'in', ''),
+    # Printed 8pt left of the Paid out edge, so it only lines up with it roughly
+    ('', 'BP J SMITH RENT', 460.00, 372, ''),
+    # Balance on a line of its own, for the row above
+    ('', '', 0, None, 2000.00),
+]
+
+@pytest.fixture
+def transactions(layout_statement):
+    pages = list(s1.iter_layout_transactions(str(layout_statement(ROWS)), s1._silent))
+    assert [page_num for page_num, _ in pages] == [1]
+    return pages[0][1]
+
+def test_amounts_are_assigned_by_column(transactions):
+    assert [(trans['description'], trans['amount'], trans['_column'], trans['balance'])
+            for trans in transactions] == [
+        ('VIS TESCO STORES', '12.50', 'out', ''),
+        ('DD EDF ENERGY', '40.00', 'out', '1447.50'),
+        ('CR SALARY ACME', '1000.00', 'in', '2447.50'),
+        ('CR REVERSAL', '7.50', 'out', '2440.00'),
+        ('VIS REFUND AMAZON', '20.00', 'in', ''),
+        ('BP J SMITH RENT', '460.00', 'out', '2000.00'),
+    ]
+
+def test_dates_carry_down_and_rows_are_tagged(transactions):
+    assert [trans['date'] for trans in transactions] == [
+        '02 Mar 22', '02 Mar 22', '03 Mar 22', '04 Mar 22', '05 Mar 22', '05 Mar 22']
+    assert {(trans['_page'], trans['_account']) for trans in transactions} == {(1, '40-11-62 12345678')}
+
+def test_the_column_wins_over_the_payment_code(transactions):
+    classified = s1.determine_debit_credit(transactions)
+
+    assert [(trans['paid_out'], trans['paid_in']) for trans in classified] == [
+        ('12.50', ''), ('40.00', ''), ('', '1000.00'), ('7.50', ''), ('', '20.00'), ('460.00', '')]
+    assert s1.find_chain_breaks(classified) == ({}, 3)
+
+def test_page_without_a_table_header_is_left_to_the_text_parser():
+    words = [{'text': text, 'x0': x, 'x1': x + 30, 'top': 100, 'bottom': 110}
+             for x, text in ((40, 'Personal'), (80, 'Banking'), (120, 'Customers'))]
+
+    assert s1.parse_page_layout(words, 3, None, s1._silent) is None
@@ -0,0 +1,54 @@
+from metrics import Histogram, Metrics
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.1, 1, 10))
+    for value in (0.05, 0.5, 0.5, 20):
+        histogram.observe(value)
+
+    assert histogram.counts == [1, 3, 3]
+    assert (histogram.count, histogram.sum) == (4, 21.05)
+
+def test_render_is_prometheus_text():
+    metrics = Metrics(buckets=(0.5, 2))
+    metrics.record({'pdfs': 1, 'pages': 3, 'seconds_parse': 0.25, 'memory_peak_parse': 4096,
+                    'errors': 1})
+    metrics.record({'pdfs': 1, 'pages': 2, 'seconds_parse': 1.5, 'errors': 1})
+    metrics.observe('merge', 3)
+
+    assert metrics.render().splitlines() == [
+        '# HELP hsbc_convert_errors_total PDFs that failed to convert',
+        '# TYPE hsbc_convert_errors_total counter',
+        'hsbc_convert_errors_total 2',
+        '# HELP hsbc_convert_pages_total PDF pages read',
+        '# TYPE hsbc_convert_pages_total counter',
+        'hsbc_convert_pages_total 5',
+        '# HELP hsbc_convert_pdfs_total PDF statements processed',
+        '# TYPE hsbc_convert_pdfs_total counter',
+        'hsbc_convert_pdfs_total 2',
+        '# HELP hsbc_convert_stage_seconds Time spent per PDF in each pipeline stage',
+        '# TYPE hsbc_convert_stage_seconds histogram',
+        'hsbc_convert_stage_seconds_bucket{stage="merge",le="0.5"} 0',
+        'hsbc_convert_stage_seconds_bucket{stage="merge",le="2"} 0',
+        'hsbc_convert_stage_seconds_bucket{stage="merge",le="+Inf"} 1',
+        'hsbc_convert_stage_seconds_sum{stage="merge"} 3',
+        'hsbc_convert_stage_seconds_count{stage="merge"} 1',
+        'hsbc_convert_stage_seconds_bucket{stage="parse",le="0.5"} 1',
+        'hsbc_convert_stage_seconds_bucket{stage="parse",le="2"} 2',
+        'hsbc_convert_stage_seconds_bucket{stage="parse",le="+Inf"} 2',
+        'hsbc_convert_stage_seconds_sum{stage="parse"} 1.75',
+        'hsbc_convert_stage_seconds_count{stage="parse"} 2',
+    ]
+
+def test_textfile_ends_with_the_last_success_gauge(tmp_path):
+    metrics = Metrics()
+    metrics.record({'pdfs': 1})
+
+    path = metrics.write_textfile(str(tmp_path / 'metrics.prom'))
+
+    text = (tmp_path / 'metrics.prom').read_text(encoding='utf-8')
+    assert path == str(tmp_path / 'metrics.prom')
+    lines = text.splitlines()
+    assert not list(tmp_path.glob('*.tmp'))
+    assert lines[-2] == '# TYPE hsbc_convert_last_success_timestamp_seconds gauge'
+    assert lines[-1].startswith('hsbc_convert_last_success_timestamp_seconds ')
+    assert text.endswith('\n')
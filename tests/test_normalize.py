@@ -0,0 +1,40 @@
+import pytest
+
+import s1
+
+@pytest.mark.parametrize('description, code', [
+    ('VIS TESCO STORES', 'VIS'),
+    ('VISA INT\'L 0012', 'VISA'),
+    (')))TESCO EXPRESS', ')))'),
+    ('CRS REFUND', 'CRS'),
+    ('CR SALARY', 'CR'),
+    ('TFR 40-11-62', None),
+])
+def test_the_longest_code_wins(description, code):
+    match = s1.PaymentCodeTrie(s1.PAYMENT_TYPES).match(description)
+
+    assert (match[0] if match else None) == code
+
+def test_normalized_details_drop_the_whole_code():
+    normalized = s1.DescriptionNormalizer().normalize('VISA  AMAZON   MARKETPLACE')
+
+    assert (normalized.payment_type, normalized.details) == ('Visa Card', 'AMAZON MARKETPLACE')
+
+def test_a_code_added_to_the_table_starts_a_transaction(monkeypatch):
+    page = "Your Statement\nSO LANDLORD RENT 500.00 1000.00\n"
+
+    assert s1.parse_page_transactions(page, 2, '01 Mar 22', s1._silent)[0] == []
+    monkeypatch.setattr(s1, '_default_normalizer',
+                        s1.DescriptionNormalizer({**s1.PAYMENT_TYPES, 'SO': 'Standing Order'}))
+    transactions, _ = s1.parse_page_transactions(page, 2, '01 Mar 22', s1._silent)
+
+    assert [(trans['description'], trans['amount'], trans['balance']) for trans in transactions] == [
+        ('SO LANDLORD RENT', '500.00', '1000.00')]
+
+def test_credit_codes_are_paid_in():
+    transactions = [{'date': '02 Mar 22', 'description': description, 'amount': '5.00', 'balance': ''}
+                    for description in ('CRS REFUND', 'VISA TESCO', ')))COSTA')]
+
+    classified = s1.determine_debit_credit(transactions)
+
+    assert [bool(trans['paid_in']) for trans in classified] == [True, False, False]
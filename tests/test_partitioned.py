@@ -0,0 +1,89 @@
+import pytest
+
+import s1
+from conftest import transaction
+
+ACCOUNT = '40-11-62 12345678'
+MARCH = 'year=2022/month=03/40-11-62_12345678.csv'
+APRIL = 'year=2022/month=04/40-11-62_12345678.csv'
+MAY = 'year=2022/month=05/40-11-62_12345678.csv'
+
+def march():
+    return [transaction('02 Mar 22', 'VIS TESCO STORES', '5.00', '', '95.00', statement='mar.pdf'),
+            transaction('09 Mar 22', 'DD EDF ENERGY', '10.00', '', '85.00', statement='mar.pdf')]
+
+def april():
+    return [transaction('04 Apr 22', 'CR SALARY ACME', '', '100.00', '185.00', statement='apr.pdf')]
+
+def may():
+    return [transaction('05 May 22', 'BP J SMITH RENT', '50.00', '', '135.00', statement='may.pdf')]
+
+def write(root, *months, **kwargs):
+    transactions = [trans for month in months for trans in month]
+    return s1.write_partitioned({ACCOUNT: transactions}, str(root), ['csv'], s1._silent, **kwargs)
+
+def test_first_run_writes_every_month(tmp_path):
+    result = write(tmp_path, march(), april())
+
+    assert result == {'written': [MARCH, APRIL], 'unchanged': [], 'kept': [], 'removed': []}
+    assert (tmp_path / MARCH).read_text(encoding='utf-8').count('\n') == 3  # Header and two rows
+
+def test_unchanged_months_are_not_rewritten(tmp_path):
+    write(tmp_path, march(), april())
+    written = (tmp_path / MARCH).stat().st_mtime_ns
+
+    result = write(tmp_path, march(), april())
+
+    assert result['written'] == [] and result['unchanged'] == [MARCH, APRIL]
+    assert (tmp_path / MARCH).stat().st_mtime_ns == written
+
+def test_adding_a_statement_only_writes_its_month(tmp_path):
+    write(tmp_path, march(), april())
+
+    result = write(tmp_path, march(), april(), may())
+
+    assert result['written'] == [MAY]
+    assert sorted(result['unchanged']) == [MARCH, APRIL]
+
+def test_a_changed_row_rewrites_its_month(tmp_path):
+    write(tmp_path, march(), april())
+    changed = march()
+    changed[1]['paid_out'] = '11.00'
+
+    result = write(tmp_path, changed, april())
+
+    assert result['written'] == [MARCH]
+    assert '11.00' in (tmp_path / MARCH).read_text(encoding='utf-8')
+
+def test_months_of_statements_not_read_this_run_are_kept(tmp_path):
+    write(tmp_path, march(), april())
+
+    result = write(tmp_path, april())
+
+    assert result['kept'] == [MARCH] and result['removed'] == []
+    assert (tmp_path / MARCH).exists()
+    # Still recorded, so a later run with every statement sees it as unchanged
+    assert write(tmp_path, march(), april())['unchanged'] == [MARCH, APRIL]
+
+def test_prune_removes_months_without_transactions(tmp_path):
+    write(tmp_path, march(), april())
+
+    result = write(tmp_path, april(), prune=True)
+
+    assert result['removed'] == [MARCH] and result['kept'] == []
+    assert not (tmp_path / MARCH).exists()
+    assert not (tmp_path / 'year=2022' / 'month=03').exists()
+
+def test_a_month_whose_statement_was_reread_and_is_now_empty_is_removed(tmp_path):
+    write(tmp_path, march(), april())
+    # apr.pdf was read again, but its only row moved to May (e.g. a parser fix)
+    moved = [transaction('01 May 22', 'CR SALARY ACME', '', '100.00', '185.00', statement='apr.pdf')]
+
+    result = write(tmp_path, march(), moved)
+
+    assert result['removed'] == [APRIL]
+    assert not (tmp_path / APRIL).exists()
+
+def test_empty_formats_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        s1.write_partitioned({ACCOUNT: march()}, str(tmp_path), [], s1._silent)
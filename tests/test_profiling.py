@@ -0,0 +1,71 @@
+import threading
+import tracemalloc
+from collections import Counter
+
+import pytest
+
+import s1
+from profiling import Profiler
+
+@pytest.fixture
+def tracing():
+    """Run tracemalloc for the test only; it slows everything else down"""
+    was_tracing = tracemalloc.is_tracing()
+    yield
+    if not was_tracing:
+        tracemalloc.stop()
+
+def test_profile_writes_its_files(tmp_path, tracing):
+    profiler = Profiler(str(tmp_path), log=s1._silent)
+
+    with profiler.profile('statement') as stats:
+        with s1._traced(stats, 'work'):
+            sum(range(10000))
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        'statement.collapsed', 'statement.memory.txt', 'statement.prof']
+    assert 'memory_peak_work' in stats
+    assert profiler.results[0][0] == 'statement'
+
+def test_a_name_used_twice_gets_a_suffix(tmp_path, tracing):
+    profiler = Profiler(str(tmp_path), log=s1._silent)
+
+    for name in ('_combined', '_combined', '_Combined'):
+        with profiler.profile(name):
+            pass
+
+    assert [result[0] for result in profiler.results] == ['_combined', '_combined-2', '_Combined-3']
+    assert len(list(tmp_path.glob('*.prof'))) == 3
+
+def test_collapsed_stacks_are_frames_and_microseconds(tmp_path, tracing):
+    profiler = Profiler(str(tmp_path), log=s1._silent)
+
+    with profiler.profile('statement'):
+        sorted(str(number) for number in range(20000))
+
+    lines = (tmp_path / 'statement.collapsed').read_text(encoding='utf-8').splitlines()
+    assert lines and all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+    assert any(';' in line for line in lines)
+
+def test_traced_stages_nest_per_thread(tracing):
+    tracemalloc.start()
+    depths = []
+    all_inside = threading.Barrier(4)
+
+    def work():
+        stats = Counter()
+        with s1._traced(stats, 'outer'):
+            with s1._traced(stats, 'inner'):
+                data = [0] * 10000
+                all_inside.wait()
+            depths.append(len(s1._peak_stack()))
+        depths.append(len(s1._peak_stack()))
+        del data
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(depths) == [0] * 4 + [1] * 4
@@ -0,0 +1,75 @@
+import copy
+from collections import Counter
+
+import pytest
+
+import s1
+from conftest import statement_rows, transaction
+
+@pytest.fixture
+def long_statement(statement):
+    """Three-page statement that stays in credit, so every printed balance chains"""
+    path = str(statement(rows=statement_rows(count=100), opening=20000.0))
+    transactions = [trans for _, page in s1.iter_statement_pages(path, log=s1._silent) for trans in page]
+    assert s1._chain_breaks(transactions) == (Counter(), 49)
+    return path, transactions
+
+@pytest.mark.parametrize('page_timeout', [None, 10])
+def test_a_misread_amount_is_repaired(long_statement, page_timeout):
+    path, transactions = long_statement
+    misread = copy.deepcopy(transactions)
+    misread[60]['amount'] = '999.99'
+    stats = Counter()
+
+    repaired = s1.reconcile_pages(path, misread, log=s1._silent, stats=stats, page_timeout=page_timeout)
+
+    assert repaired == transactions
+    assert (stats['chain_breaks'], stats['pages_reextracted'], stats['pages_repaired']) == (1, 1, 1)
+
+def test_only_the_page_with_its_own_break_is_reread(long_statement):
+    path, transactions = long_statement
+    misread = copy.deepcopy(transactions)
+    # Row 43 is page 2's first row, so its link to the last row of page 1 breaks as well
+    assert (misread[42]['_page'], misread[43]['_page']) == (1, 2)
+    misread[43]['amount'] = misread[60]['amount'] = '999.99'
+    stats = Counter()
+
+    repaired = s1.reconcile_pages(path, misread, log=s1._silent, stats=stats)
+
+    assert repaired == transactions
+    assert (stats['chain_breaks'], stats['pages_reextracted'], stats['pages_repaired']) == (3, 1, 1)
+
+def test_a_break_between_pages_rereads_both(long_statement):
+    path, transactions = long_statement
+    misread = copy.deepcopy(transactions)
+    misread[43]['amount'] = '999.99'
+    stats = Counter()
+
+    repaired = s1.reconcile_pages(path, misread, log=s1._silent, stats=stats)
+
+    assert repaired == transactions
+    assert (stats['chain_breaks'], stats['pages_reextracted'], stats['pages_repaired']) == (2, 2, 1)
+
+def test_chain_breaks_are_blamed_on_the_pages_of_the_link():
+    rows = [transaction('02 Mar 22', 'A', balance='100.00', page=1),
+            transaction('03 Mar 22', 'B', paid_out='10.00', page=1),
+            transaction('04 Mar 22', 'C', paid_out='5.00', balance='80.00', page=2),
+            transaction('05 Mar 22', 'D', paid_in='20.00', balance='100.00', page=2)]
+    for trans in rows:
+        trans['amount'] = trans['paid_out'] or trans['paid_in']
+
+    assert s1.find_chain_breaks(rows) == (Counter({1: 1, 2: 1}), 1)
+
+def test_converter_reconciles_with_page_isolation(statement, monkeypatch):
+    calls = []
+    reconcile_pages = s1.reconcile_pages
+
+    def spy(source, transactions, mode, log, stats, page_timeout=None, memory_limit_mb=None):
+        calls.append(page_timeout)
+        return reconcile_pages(source, transactions, mode, log, stats, page_timeout, memory_limit_mb)
+    monkeypatch.setattr(s1, 'reconcile_pages', spy)
+
+    result = s1.Converter(page_timeout=10).convert(str(statement()))
+
+    assert calls == [10]
+    assert len(result.transactions) == 20
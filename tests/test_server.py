@@ -0,0 +1,71 @@
+import http.client
+import json
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import server
+
+@pytest.fixture
+def pool():
+    pool = server.ConversionPool(workers=1, max_queue=1, timeout=1)
+    yield pool
+    pool.shutdown()
+
+@pytest.fixture
+def post(pool):
+    """POST /convert with raw headers (so Content-Length can be missing or invalid)"""
+    server.ConversionHandler.pool = pool
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), server.ConversionHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    def send(body=b'', path='/convert', **headers):
+        connection = http.client.HTTPConnection(*httpd.server_address, timeout=60)
+        connection.putrequest('POST', path)
+        connection.putheader('Content-Type', 'application/pdf')
+        for name, value in headers.items():
+            connection.putheader(name.replace('_', '-'), value)
+        connection.endheaders(body)
+        response = connection.getresponse()
+        return response.status, response.read()
+
+    yield send
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_missing_content_length_is_411(post):
+    assert post()[0] == 411
+
+@pytest.mark.parametrize('length', ['abc', '-1', '1.5'])
+def test_invalid_content_length_is_400(post, length):
+    status, body = post(Content_Length=length)
+
+    assert status == 400 and json.loads(body) == {'error': 'Invalid Content-Length'}
+
+def test_oversized_upload_is_413(post):
+    assert post(Content_Length=str(server.MAX_UPLOAD_MB * 1024 * 1024 + 1))[0] == 413
+
+def test_upload_is_converted_by_a_worker(post, statement):
+    pdf = statement().read_bytes()
+
+    status, body = post(pdf, path='/convert?format=json', Content_Length=str(len(pdf)))
+
+    assert status == 200
+    assert len(json.loads(body)['transactions']) == 20
+
+def test_recycle_kills_a_job_that_is_still_running(pool):
+    old = pool.executor
+    pool.timeout = 0.2  # Grace period before the old workers are killed
+    stuck = old.submit(time.sleep, 60)
+    time.sleep(0.5)  # Let the worker start it, so cancel() can no longer stop it
+    assert not stuck.cancel()
+
+    pool.recycle()
+
+    assert pool.executor is not old
+    with pytest.raises(BrokenProcessPool):
+        stuck.result(timeout=30)
+    assert pool.executor.submit(sum, [1, 2]).result(timeout=30) == 3
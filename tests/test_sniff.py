@@ -0,0 +1,92 @@
+import io
+
+import pytest
+
+import s1
+
+reportlab = pytest.importorskip('reportlab')
+from reportlab.pdfgen import canvas
+
+def draw(path, *lines, image=None, in_form=False, inline=False):
+    """One-page PDF with the given text lines and optionally an image (inside a form XObject, or inline)"""
+    c = canvas.Canvas(str(path))
+    for idx, line in enumerate(lines):
+        c.drawString(40, 800 - 15 * idx, line)
+    if image is not None:
+        if inline:
+            c.drawInlineImage(image, 0, 0, 500, 700)
+        elif in_form:
+            c.beginForm('scan')
+            c.drawImage(image, 0, 0, 500, 700)
+            c.endForm()
+            c.doForm('scan')
+        else:
+            c.drawImage(image, 0, 0, 500, 700)
+    c.showPage()
+    c.save()
+    return str(path)
+
+@pytest.fixture
+def image():
+    Image = pytest.importorskip('PIL.Image')
+    from reportlab.lib.utils import ImageReader
+    buffer = io.BytesIO()
+    Image.new('L', (40, 40), 128).save(buffer, 'PNG')
+    buffer.seek(0)
+    return ImageReader(buffer)
+
+@pytest.fixture
+def pil_image():
+    Image = pytest.importorskip('PIL.Image')
+    return Image.new('L', (40, 40), 128)
+
+def test_statement_is_recognised(statement):
+    assert s1.sniff_pdf(str(statement())).kind == 'hsbc'
+
+def test_statement_without_hsbc_text_is_recognised_by_its_table(statement):
+    sniffed = s1.sniff_pdf(str(statement(header=False)))
+
+    assert sniffed == s1.SniffResult('hsbc', "HSBC transaction table on page 1")
+
+def test_other_bank_is_rejected(tmp_path):
+    path = draw(tmp_path / 'other.pdf', 'Another Bank plc', 'Your current account statement',
+                'Date  Description  Money out  Money in')
+
+    assert s1.sniff_pdf(path).kind == 'reject'
+
+def test_blank_page_is_rejected(tmp_path):
+    assert s1.sniff_pdf(draw(tmp_path / 'blank.pdf')) == s1.SniffResult('reject', "page 1 has no text or images")
+
+def test_not_a_pdf_is_rejected():
+    assert s1.sniff_pdf(b'<html>not a statement</html>') == s1.SniffResult('reject', "not a PDF")
+
+@pytest.mark.parametrize('in_form', [False, True])
+def test_scan_is_queued_for_ocr(tmp_path, image, in_form):
+    path = draw(tmp_path / 'scan.pdf', image=image, in_form=in_form)
+
+    assert s1.sniff_pdf(path).kind == 'ocr'
+
+def test_inline_image_scan_is_queued_for_ocr(tmp_path, pil_image):
+    path = draw(tmp_path / 'scan.pdf', image=pil_image, inline=True)
+
+    assert s1.sniff_pdf(path).kind == 'ocr'
+
+def test_page_with_a_logo_but_no_hsbc_text_is_queued_for_ocr(tmp_path, image):
+    path = draw(tmp_path / 'cover.pdf', 'Your Statement', 'Important information about your account',
+                image=image)
+
+    assert s1.sniff_pdf(path) == s1.SniffResult(
+        'ocr', "no HSBC text on page 1, but it has images (logo or scan?)")
+
+def test_file_object_position_is_restored(statement):
+    file = io.BytesIO(statement().read_bytes())
+    file.seek(7)
+
+    assert s1.sniff_pdf(file).kind == 'hsbc'
+    assert file.tell() == 7
+
+def test_converter_refuses_other_documents_when_sniffing(tmp_path):
+    path = draw(tmp_path / 'other.pdf', 'Another Bank plc', 'Your current account statement')
+
+    with pytest.raises(ValueError, match='not an HSBC statement'):
+        s1.Converter(sniff=True).convert(path)
@@ -0,0 +1,72 @@
+import argparse
+
+import pytest
+
+import t1
+
+def rows(*balances):
+    """Numbered t1 rows, one per balance, each paying out 1.00"""
+    return [(number, {'Date': f'{day}-Mar-22', 'Type': 'Visa Card', 'Details': 'TESCO',
+                      'Paid out': '1.00', 'Paid in': '', 'Balance': f'{balance:.2f}'})
+            for number, (day, balance) in enumerate(zip(range(1, 29), balances), 2)]
+
+def kinds(events):
+    return [event[0] for event in events]
+
+def test_identical_rows_match():
+    assert kinds(t1.diff_rows(rows(9, 8, 7), rows(9, 8, 7))) == ['match'] * 3
+
+def test_an_inserted_row_is_reported_once():
+    generated = rows(9, 8, 7, 6, 5)
+    known = [row for row in generated if row[1]['Balance'] != '7.00']
+
+    events = list(t1.diff_rows(generated, known))
+
+    assert kinds(events) == ['match', 'match', 'extra', 'match', 'match']
+    assert events[2][1][1]['Balance'] == '7.00'
+
+def test_a_deleted_row_is_reported_once():
+    known = rows(9, 8, 7, 6, 5)
+    generated = [row for row in known if row[1]['Balance'] != '8.00']
+
+    events = list(t1.diff_rows(generated, known))
+
+    assert kinds(events) == ['match', 'missing', 'match', 'match', 'match']
+    assert events[1][1][1]['Balance'] == '8.00'
+
+def test_a_changed_field_is_compared_in_place():
+    generated, known = rows(9, 8, 7), rows(9, 8, 7)
+    generated[1][1]['Details'] = 'TESCO STORES'
+
+    events = list(t1.diff_rows(generated, known))
+
+    assert kinds(events) == ['match', 'changed', 'match']
+    assert events[1][3] == ["Details: 'TESCO STORES' vs 'TESCO'"]
+
+def test_realignment_is_limited_to_the_window():
+    known = rows(*range(20, 10, -1))
+    generated = known[5:]
+
+    assert kinds(t1.diff_rows(generated, known, window=10)) == ['missing'] * 5 + ['match'] * 5
+    # Five rows out is beyond a window of 3, so rows are compared pairwise instead
+    assert kinds(t1.diff_rows(generated, known, window=3)) == ['changed'] * 5 + ['missing'] * 5
+
+@pytest.mark.parametrize('window', [0, -1])
+def test_window_below_one_is_rejected(window):
+    with pytest.raises(ValueError):
+        t1.diff_rows(rows(9), rows(8), window)
+
+@pytest.mark.parametrize('value', ['0', '-5', 'ten'])
+def test_window_option_is_validated(value):
+    with pytest.raises(argparse.ArgumentTypeError):
+        t1._window(value)
+
+def test_diff_files_reads_csvs(tmp_path):
+    header = 'Date,Payment type,Details,£Paid out,£Paid in,£Balance\n'
+    (tmp_path / 'known.csv').write_text(header + '01-Mar-22,VIS,TESCO,1.00,,9.00\n'
+                                        '02-Mar-22,VIS,TESCO,1.00,,8.00\n', encoding='utf-8')
+    (tmp_path / 'generated.csv').write_text(header + '1-Mar-22,VIS,TESCO,1,,9\n', encoding='utf-8')
+
+    summary = t1.diff_files(tmp_path / 'generated.csv', tmp_path / 'known.csv')
+
+    assert (summary['matches'], summary['missing'], summary['extra']) == (1, 1, 0)